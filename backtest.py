@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+backtest.py — Backtest vectorisé de la stratégie du bot (STRAT_ALGO.txt)
+Règles rejouées à l'identique de StopLossBot :
+- Entrée à la clôture de la bougie i si close[i] > HH_N (N bougies avant i)      (_compute_signal)
+- Stop initial = LL_M (M bougies avant i) ou close - atr_mult * ATR14           (use_atr_stop)
+- TP partiel de `tp_fraction` à entry + take_profit_R * R, stop remonté à BE   (_partial_take_profit)
+- Trailing : stop = max(stop, high - atr_mult * ATR) en fin de bougie          (_manage_position)
+Conventions intra-bougie (OHLC seulement, donc conservatrices) :
+- le stop en vigueur au début de la bougie est testé en premier (low <= stop => sortie
+  à min(open, stop)), puis le TP1 (high >= tp1 => fill à max(open, tp1)), puis le trailing
+- une nouvelle entrée est possible dès la clôture de la bougie de sortie
+Taille : risque fixe `risk_quote` par trade (qty = risk_quote / R), sans composition.
+
+Usage:
+    python backtest.py --symbols BTC/USDT,ETH/USDT --timeframe 1h --limit 1000
+"""
+
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass, fields
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Colonnes des tableaux OHLCV (format ccxt)
+TS, OPEN, HIGH, LOW, CLOSE, VOLUME = range(6)
+
+
+@dataclass
+class BacktestParams:
+    breakout_lookback: int = 20
+    stop_lookback: int = 10
+    use_atr_stop: bool = False
+    atr_mult: float = 2.0
+    take_profit_R: float = 1.0
+    tp_fraction: float = 0.5
+    trailing_use_atr: bool = True
+    atr_period: int = 14
+
+    @staticmethod
+    def from_config(cfg, **overrides) -> "BacktestParams":
+        names = {f.name for f in fields(BacktestParams)}
+        kw = {n: getattr(cfg, n) for n in names if hasattr(cfg, n)}
+        kw.update(overrides)
+        return BacktestParams(**kw)
+
+
+# ---------------- Indicateurs vectorisés ----------------
+def rolling_prev_max(x: np.ndarray, n: int) -> np.ndarray:
+    """out[i] = max(x[i-n:i]) (NaN si i < n) — équivaut à iloc[-(n+1):-1].max() sur la bougie i."""
+    out = np.full(len(x), np.nan)
+    if len(x) > n:
+        out[n:] = np.lib.stride_tricks.sliding_window_view(x[:-1], n).max(axis=1)
+    return out
+
+
+def rolling_prev_min(x: np.ndarray, n: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if len(x) > n:
+        out[n:] = np.lib.stride_tricks.sliding_window_view(x[:-1], n).min(axis=1)
+    return out
+
+
+def wilder_atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int = 14) -> np.ndarray:
+    """Même calcul que StopLossBot._atr (ewm pandas, adjust=False) — résultats identiques."""
+    prev_close = np.concatenate(([np.nan], close[:-1]))
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return pd.Series(tr).ewm(alpha=1.0 / n, adjust=False).mean().to_numpy()
+
+
+# ---------------- Simulation ----------------
+def _simulate_trade(i: int, o, h, l, c, trail, entry: float, stop0: float, tp1: float,
+                    use_tp: bool, chunk: int = 64):
+    """
+    Position ouverte à la clôture de i. Retourne (exit_idx, exit_price, reason, tp1_idx|None).
+    Recherche par blocs croissants : les opérations restent vectorisées sans parcourir
+    tout l'historique quand la sortie est proche.
+    """
+    n = len(c)
+    start = i + 1
+    w = chunk
+    while True:
+        end = min(n, start + w)
+        if end <= start:
+            return n - 1, float(c[-1]), "EOD", None
+        seg = slice(start, end)
+        # stop au début de chaque bougie j = max(stop0, trailings des bougies i+1..j-1)
+        stop = np.empty(end - start)
+        stop[0] = stop0
+        np.maximum.accumulate(trail[start:end - 1], out=stop[1:])
+        np.maximum(stop, stop0, out=stop)
+        tp_idx = None
+        if use_tp:
+            hit = h[seg] >= tp1
+            k = int(hit.argmax())
+            if hit[k]:
+                stop[k + 1:] = np.maximum(stop[k + 1:], entry)  # stop à BE après le TP1
+                tp_idx = k
+        out = l[seg] <= stop
+        k = int(out.argmax())
+        if out[k]:
+            if tp_idx is not None and tp_idx >= k:
+                tp_idx = None  # stop touché avant (ou dans la même bougie que) le TP1
+            j = start + k
+            return j, float(min(o[j], stop[k])), "STOP", (start + tp_idx) if tp_idx is not None else None
+        if end >= n:
+            return n - 1, float(c[-1]), "EOD", (start + tp_idx) if tp_idx is not None else None
+        w *= 4
+
+
+def backtest_symbol(symbol: str, ohlcv: np.ndarray, params: BacktestParams, risk_quote: float = 100.0) -> List[dict]:
+    """Rejoue la stratégie sur un tableau (N, 6) [ts, o, h, l, c, v]. Retourne la liste des trades."""
+    ohlcv = np.asarray(ohlcv, dtype=np.float64)
+    o, h, l, c = ohlcv[:, OPEN], ohlcv[:, HIGH], ohlcv[:, LOW], ohlcv[:, CLOSE]
+    ts = ohlcv[:, TS].astype(np.int64)
+    Lh, Ll = params.breakout_lookback, params.stop_lookback
+    min_idx = max(Lh, Ll) + 4  # len(df) >= max(L) + 5 dans _compute_signal
+
+    hh = rolling_prev_max(h, Lh)
+    atr = wilder_atr(h, l, c, params.atr_period)
+    if params.use_atr_stop:
+        stops = c - params.atr_mult * atr
+    else:
+        stops = rolling_prev_min(l, Ll)
+    r_vals = c - stops
+    tp1s = c + params.take_profit_R * r_vals
+    # -inf = pas de trailing (neutre pour le max cumulé)
+    trail = h - params.atr_mult * atr if params.trailing_use_atr else np.full(len(c), -np.inf)
+
+    entry_ok = np.zeros(len(c), dtype=bool)
+    entry_ok[min_idx:] = (c[min_idx:] > hh[min_idx:]) & (r_vals[min_idx:] > 0)
+    candidates = np.flatnonzero(entry_ok)
+
+    trades: List[dict] = []
+    f = min(max(params.tp_fraction, 0.0), 1.0)
+    use_tp = f > 0
+    ci = 0
+    while ci < len(candidates):
+        i = int(candidates[ci])
+        entry, stop0, tp1, r = float(c[i]), float(stops[i]), float(tp1s[i]), float(r_vals[i])
+        j, exit_px, reason, tp_idx = _simulate_trade(i, o, h, l, c, trail, entry, stop0, tp1, use_tp)
+        qty = risk_quote / r
+        if tp_idx is not None:
+            tp_px = float(max(o[tp_idx], tp1))
+            pnl_unit = f * (tp_px - entry) + (1.0 - f) * (exit_px - entry)
+        else:
+            tp_px = np.nan
+            pnl_unit = exit_px - entry
+        trades.append({
+            "symbol": symbol,
+            "entry_ts": int(ts[i]), "exit_ts": int(ts[j]),
+            "entry": entry, "stop": stop0, "tp1": tp1, "tp1_hit": tp_idx is not None, "tp1_fill": tp_px,
+            "exit": exit_px, "reason": reason, "bars": j - i,
+            "R": pnl_unit / r, "pnl": pnl_unit * qty,
+        })
+        if reason == "EOD":
+            break
+        ci = int(np.searchsorted(candidates, j, side="left"))
+    return trades
+
+
+def run_backtest(data: Dict[str, np.ndarray], params: BacktestParams, risk_quote: float = 100.0) -> pd.DataFrame:
+    rows: List[dict] = []
+    for sym, arr in data.items():
+        rows.extend(backtest_symbol(sym, arr, params, risk_quote))
+    cols = ["symbol", "entry_ts", "exit_ts", "entry", "stop", "tp1", "tp1_hit", "tp1_fill",
+            "exit", "reason", "bars", "R", "pnl"]
+    df = pd.DataFrame(rows, columns=cols)
+    return df.sort_values(["exit_ts", "symbol"], kind="stable").reset_index(drop=True)
+
+
+def summarize(trades: pd.DataFrame) -> Dict[str, float]:
+    """Métriques globales (R cumulés dans l'ordre des sorties)."""
+    if trades.empty:
+        return {"trades": 0, "win_rate": np.nan, "avg_R": np.nan, "total_R": 0.0,
+                "max_dd_R": 0.0, "profit_factor": np.nan, "tp1_rate": np.nan, "pnl": 0.0}
+    R = trades["R"].to_numpy()
+    curve = np.cumsum(R)
+    dd = np.maximum.accumulate(np.concatenate(([0.0], curve)))[1:] - curve
+    gains, losses = R[R > 0].sum(), -R[R < 0].sum()
+    return {
+        "trades": int(len(R)),
+        "win_rate": float((R > 0).mean()),
+        "avg_R": float(R.mean()),
+        "total_R": float(curve[-1]),
+        "max_dd_R": float(dd.max()),
+        "profit_factor": float(gains / losses) if losses > 0 else np.inf,
+        "tp1_rate": float(trades["tp1_hit"].mean()),
+        "pnl": float(trades["pnl"].sum()),
+    }
+
+
+def fetch_history(exchange, symbol: str, timeframe: str, limit: int, db=None) -> np.ndarray:
+    """
+    Dernières `limit` bougies closes via ccxt (pagination `since=` par blocs de 1000).
+    Avec `db` (candle_db.CandleDB), seul le trou depuis la dernière bougie locale est téléchargé.
+    """
+    if db is not None:
+        from candle_db import sync_tail
+        return sync_tail(db, exchange, symbol, timeframe, limit)
+    tf_ms = int(exchange.parse_timeframe(timeframe) * 1000)
+    now = exchange.milliseconds()
+    since = now - (limit + 1) * tf_ms
+    rows: List[list] = []
+    while since < now:
+        batch = exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=1000)
+        if not batch:
+            break
+        rows.extend(batch)
+        since = int(batch[-1][0]) + tf_ms
+    rows = [r for r in rows if int(r[0]) + tf_ms <= now]  # bougies closes seulement
+    return np.asarray(rows[-limit:], dtype=np.float64).reshape(-1, 6)
+
+
+def main():
+    import ccxt
+    from rich.console import Console
+    from rich.table import Table
+    from candle_db import CandleDB
+    from main import Config
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--symbols", default="", help="liste séparée par des virgules (défaut: config)")
+    ap.add_argument("--timeframe", default="")
+    ap.add_argument("--limit", type=int, default=1000, help="nombre de bougies par symbole")
+    ap.add_argument("--risk_quote", type=float, default=100.0, help="risque fixe par trade (quote)")
+    ap.add_argument("--trades_csv", default="", help="export optionnel des trades")
+    ap.add_argument("--db", default=None, help="base locale des bougies (défaut: candle_db_dir, '' = aucune)")
+    args = ap.parse_args()
+
+    cfg = Config.from_yaml(args.config)
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()] or cfg.symbols
+    timeframe = args.timeframe or cfg.timeframe
+    ex = getattr(ccxt, cfg.exchange.lower())({"enableRateLimit": True})
+    db_dir = cfg.candle_db_dir if args.db is None else args.db
+    db = CandleDB(db_dir) if db_dir else None
+
+    data = {s: fetch_history(ex, s, timeframe, args.limit, db=db) for s in symbols}
+    params = BacktestParams.from_config(cfg)
+    trades = run_backtest(data, params, risk_quote=args.risk_quote)
+    summary = summarize(trades)
+
+    console = Console()
+    table = Table(title=f"Backtest {timeframe} — {len(symbols)} symbole(s)")
+    table.add_column("Métrique", style="cyan")
+    table.add_column("Valeur")
+    for k, v in summary.items():
+        table.add_row(k, f"{v:.4f}" if isinstance(v, float) else str(v))
+    console.print(table)
+    if args.trades_csv:
+        trades.to_csv(args.trades_csv, index=False)
+        console.print(f"[green]Trades exportés: {args.trades_csv}[/green]")
+
+
+if __name__ == "__main__":
+    main()
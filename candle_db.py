@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+candle_db.py — Stockage local des bougies closes, colonnaire et mappé en mémoire
+Partagé par le bot (amorçage), les viewers (préchargement) et les backtests.
+
+Format (un dossier par exchange / symbole / timeframe) :
+    {root}/{exchange}/{BASE-QUOTE}/{timeframe}/ts.i8 open.f8 high.f8 low.f8 close.f8 volume.f8
+- une colonne = un fichier binaire brut little-endian (int64 pour ts=openTime ms, float64 sinon)
+- timestamps strictement croissants ; ajout en fin de fichier dans le cas courant, fusion
+  (réécriture des colonnes, remplacement atomique par colonne + marqueur de reprise) pour
+  l'historique antérieur à la première bougie et les trous
+- lecture via np.memmap : aucune désérialisation, seules les pages lues sont chargées
+- verrou fcntl (si dispo) : exclusif pour écrire (bot, viewers et téléchargeur en parallèle),
+  partagé le temps d'ouvrir les colonnes en lecture
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrou inter-processus
+    fcntl = None
+
+COLUMNS = ("ts", "open", "high", "low", "close", "volume")
+_DTYPES = {"ts": np.dtype("<i8")}
+_FLOAT = np.dtype("<f8")
+_MERGE_MARK = ".merge"  # posé quand les colonnes .tmp d'une fusion sont complètes
+
+_TF_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "M": 2592000, "y": 31536000}
+
+
+def timeframe_ms(timeframe: str) -> int:
+    """'1m' -> 60000, '4h' -> 14400000 (mêmes unités que ccxt.parse_timeframe)."""
+    m = re.fullmatch(r"(\d+)([smhdwMy])", timeframe)
+    if not m:
+        raise ValueError(f"Timeframe invalide: {timeframe}")
+    return int(m.group(1)) * _TF_UNITS[m.group(2)] * 1000
+
+
+def _dtype(col: str) -> np.dtype:
+    return _DTYPES.get(col, _FLOAT)
+
+
+def _file(d: str, col: str) -> str:
+    dt = _dtype(col)
+    return os.path.join(d, f"{col}.{dt.kind}{dt.itemsize}")
+
+
+def missing_ranges(ts: np.ndarray, start: int, end: int, tf: int) -> List[Tuple[int, int]]:
+    """Plages [début, fin) d'openTime absentes de `ts` (croissant) dans la fenêtre [start, end)."""
+    ts = np.asarray(ts)
+    inside = ts[int(np.searchsorted(ts, start, side="left")):int(np.searchsorted(ts, end, side="left"))]
+    bounds = np.concatenate(([start - tf], inside, [end])).astype(np.int64)
+    idx = np.flatnonzero(np.diff(bounds) > tf)
+    return [(int(bounds[i] + tf), int(bounds[i + 1])) for i in idx]
+
+
+class CandleDB:
+    def __init__(self, root: str = "data/candles"):
+        self.root = root
+
+    def path(self, exchange: str, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, exchange.lower(), symbol.replace("/", "-").upper(), timeframe)
+
+    # ---------------- Lecture ----------------
+    def columns(self, exchange: str, symbol: str, timeframe: str) -> Dict[str, np.ndarray]:
+        """Colonnes mappées (lecture seule, zéro copie). Dict vide si rien en base."""
+        d = self.path(exchange, symbol, timeframe)
+        if not os.path.isdir(d):
+            return {}
+        if os.path.exists(os.path.join(d, _MERGE_MARK)):
+            with self._locked(d):
+                self._repair(d)
+        # verrou partagé : jamais de jeu de colonnes à moitié remplacé par une fusion
+        with self._locked(d, shared=True):
+            return self._open(d)
+
+    def _open(self, d: str) -> Dict[str, np.ndarray]:
+        sizes = []
+        for col in COLUMNS:
+            fp = _file(d, col)
+            if not os.path.exists(fp):
+                return {}
+            sizes.append(os.path.getsize(fp) // _dtype(col).itemsize)
+        n = min(sizes)  # écriture interrompue: on ignore la ligne incomplète
+        if n == 0:
+            return {}
+        return {col: np.memmap(_file(d, col), dtype=_dtype(col), mode="r", shape=(n,)) for col in COLUMNS}
+
+    def count(self, exchange: str, symbol: str, timeframe: str) -> int:
+        cols = self.columns(exchange, symbol, timeframe)
+        return len(cols["ts"]) if cols else 0
+
+    def last_ts(self, exchange: str, symbol: str, timeframe: str) -> Optional[int]:
+        cols = self.columns(exchange, symbol, timeframe)
+        return int(cols["ts"][-1]) if cols else None
+
+    def read(self, exchange: str, symbol: str, timeframe: str,
+             limit: Optional[int] = None, since: Optional[int] = None) -> np.ndarray:
+        """Tableau (N, 6) [ts, o, h, l, c, v] — seule la tranche demandée est copiée."""
+        cols = self.columns(exchange, symbol, timeframe)
+        if not cols:
+            return np.empty((0, 6), dtype=np.float64)
+        start = int(np.searchsorted(cols["ts"], since, side="left")) if since is not None else 0
+        if limit is not None:
+            start = max(start, len(cols["ts"]) - limit)
+        out = np.empty((len(cols["ts"]) - start, 6), dtype=np.float64)
+        for j, col in enumerate(COLUMNS):
+            out[:, j] = cols[col][start:]
+        return out
+
+    # ---------------- Écriture ----------------
+    @contextmanager
+    def _locked(self, d: str, shared: bool = False):
+        os.makedirs(d, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(d, ".lock"), "a") as lf:
+            fcntl.flock(lf, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def append(self, exchange: str, symbol: str, timeframe: str, rows: Iterable) -> int:
+        """
+        Enregistre des bougies closes (liste ccxt ou tableau (N, 6)) ; retourne le nombre ajouté.
+        Les bougies déjà en base sont ignorées. Après la dernière : ajout en fin de fichier ;
+        avant la première ou dans un trou : fusion (réécriture des colonnes, voir _merge).
+        """
+        arr = np.asarray(list(rows) if not isinstance(rows, np.ndarray) else rows, dtype=np.float64)
+        if arr.size == 0:
+            return 0
+        arr = arr.reshape(-1, 6)
+        ts, first = np.unique(arr[:, 0].astype(np.int64), return_index=True)
+        arr = arr[first]
+        d = self.path(exchange, symbol, timeframe)
+        with self._locked(d):
+            self._repair(d)
+            cols = self._open(d)
+            added = 0
+            if cols:
+                stored = cols["ts"]
+                old = ts <= stored[-1]
+                if old.any():
+                    pos = np.minimum(np.searchsorted(stored, ts[old]), len(stored) - 1)
+                    new = np.asarray(stored[pos]) != ts[old]
+                    if new.any():
+                        added += self._merge(d, cols, arr[old][new])
+                    arr, ts = arr[~old], ts[~old]
+            if len(ts):
+                for j, col in enumerate(COLUMNS):
+                    data = ts if col == "ts" else arr[:, j]
+                    with open(_file(d, col), "ab") as f:
+                        f.write(np.ascontiguousarray(data, dtype=_dtype(col)).tobytes())
+                added += len(ts)
+        return added
+
+    def _merge(self, d: str, cols: Dict[str, np.ndarray], rows: np.ndarray) -> int:
+        """
+        Insère des bougies absentes au milieu ou en tête : colonnes réécrites dans des .tmp,
+        marqueur posé, puis remplacement (os.replace). Interrompu après le marqueur, le
+        remplacement est terminé par _repair() ; avant, les .tmp sont simplement jetés.
+        """
+        ts = np.concatenate((np.asarray(cols["ts"]), rows[:, 0].astype(np.int64)))
+        order = np.argsort(ts, kind="stable")
+        for j, col in enumerate(COLUMNS):
+            data = ts if col == "ts" else np.concatenate((np.asarray(cols[col]), rows[:, j]))
+            np.ascontiguousarray(data[order], dtype=_dtype(col)).tofile(_file(d, col) + ".tmp")
+        open(os.path.join(d, _MERGE_MARK), "w").close()
+        self._repair(d)
+        return len(rows)
+
+    def _repair(self, d: str) -> None:
+        """Termine une fusion interrompue, puis répare un ajout interrompu (colonnes de longueurs différentes)."""
+        mark = os.path.join(d, _MERGE_MARK)
+        merging = os.path.exists(mark)
+        for c in COLUMNS:
+            tmp = _file(d, c) + ".tmp"
+            if os.path.exists(tmp):
+                if merging:
+                    os.replace(tmp, _file(d, c))
+                else:
+                    os.remove(tmp)
+        if merging:
+            os.remove(mark)
+        files = [_file(d, c) for c in COLUMNS]
+        if not all(os.path.exists(f) for f in files):
+            for f in files:
+                if os.path.exists(f):
+                    os.truncate(f, 0)
+            return
+        n = min(os.path.getsize(f) // _dtype(c).itemsize for f, c in zip(files, COLUMNS))
+        for f, c in zip(files, COLUMNS):
+            if os.path.getsize(f) != n * _dtype(c).itemsize:
+                os.truncate(f, n * _dtype(c).itemsize)
+
+
+def sync_window(db: CandleDB, exchange_id: str, symbol: str, timeframe: str, limit: int, now: int,
+                fetch: Callable[[int], list]) -> np.ndarray:
+    """
+    Complète la base sur la fenêtre des `limit` dernières bougies closes avant `now`
+    (tête, trous et fin : toutes les plages absentes), puis retourne cette fenêtre depuis la base.
+    `fetch(since)` rend une page de bougies [ts, o, h, l, c, v, ...] à partir de `since`.
+    Seules les plages manquantes passent par le réseau.
+    """
+    tf = timeframe_ms(timeframe)
+    end = now // tf * tf  # la bougie qui commence à `end` est encore en formation
+    start = end - limit * tf
+    cols = db.columns(exchange_id, symbol, timeframe)
+    stored = cols["ts"] if cols else np.empty(0, dtype=np.int64)
+    for lo, hi in missing_ranges(stored, start, end, tf):
+        since = lo
+        while since < hi:
+            batch = [[int(r[0])] + [float(x) for x in r[1:6]] for r in fetch(since)]
+            page = [r for r in batch if since <= r[0] < hi]
+            if not page:
+                break  # plage absente chez l'exchange aussi (maintenance, listing)
+            db.append(exchange_id, symbol, timeframe, page)
+            since = page[-1][0] + tf
+    return db.read(exchange_id, symbol, timeframe, since=start)[-limit:]
+
+
+def sync_tail(db: CandleDB, exchange, symbol: str, timeframe: str, limit: int, page: int = 1000) -> np.ndarray:
+    """
+    Les `limit` dernières bougies closes (ccxt, pagination `since=`), via la base locale :
+    seules les plages absentes (historique plus court que demandé, trous, fin) sont téléchargées.
+    """
+    return sync_window(db, exchange.id, symbol, timeframe, limit, exchange.milliseconds(),
+                       lambda since: exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=page))
+
+
+# ---------------- Binance REST (viewers) ----------------
+def fetch_klines_rest(symbol: str, timeframe: str, limit: int, start_ms: Optional[int] = None) -> list:
+    """Binance REST public klines (sans clé)."""
+    import requests
+
+    url = "https://api.binance.com/api/v3/klines"
+    params = {"symbol": symbol.replace("/", "").upper(), "interval": timeframe, "limit": limit}
+    if start_ms is not None:
+        params["startTime"] = int(start_ms)
+    r = requests.get(url, params=params, timeout=10)
+    r.raise_for_status()
+    return r.json()
+
+
+def load_closed_klines(symbol: str, timeframe: str, limit: int, db: Optional[CandleDB] = None) -> list:
+    """
+    Bougies closes pour le préchargement des viewers : base locale d'abord, REST uniquement pour les plages absentes.
+    Lignes au format kline Binance : [openTime, open, high, low, close, volume, closeTime].
+    """
+    if db is None:
+        return fetch_klines_rest(symbol, timeframe, limit=limit)[:-1]
+    tf = timeframe_ms(timeframe)
+    rows = sync_window(db, "binance", symbol, timeframe, limit, int(time.time() * 1000),
+                       lambda since: fetch_klines_rest(symbol, timeframe, limit=1000, start_ms=since))
+    return [[int(r[0]), r[1], r[2], r[3], r[4], r[5], int(r[0]) + tf - 1] for r in rows]
+
+
+def missed_klines(symbol: str, timeframe: str, after_ms: int, limit: int, db: Optional[CandleDB] = None) -> list:
+    """
+    Rattrapage d'un viewer après une reconnexion WS : bougies closes ouvertes après `after_ms`
+    (closeTime de la dernière bougie connue), les `limit` dernières au plus, au format
+    [openTime, open, high, low, close, volume, closeTime] ; enregistrées dans `db` si fourni.
+    """
+    tf = timeframe_ms(timeframe)
+    now = int(time.time() * 1000)
+    since = max(int(after_ms) + 1, now // tf * tf - limit * tf)
+    out = []
+    while since + tf <= now:
+        page = [[int(k[0])] + [float(x) for x in k[1:6]] + [int(k[6])]
+                for k in fetch_klines_rest(symbol, timeframe, limit=1000, start_ms=since) if int(k[6]) < now]
+        if not page:
+            break
+        out += page
+        since = page[-1][0] + tf
+    if db is not None and out:
+        db.append("binance", symbol, timeframe, [k[:6] for k in out])
+    return out
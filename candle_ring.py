@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+candle_ring.py — Tampon circulaire de bougies en colonnes NumPy (structure de tableaux)
+Partagé par les viewers (CandleBuffer, KlineBuf) et le bot (CandleStore).
+- Stockage préalloué : une ligne float64 par champ (ts, open, high, low, close, volume par défaut)
+- Écriture « miroir » (chaque valeur écrite en i et i + capacité) : les `n` dernières bougies
+  sont toujours contiguës => view() rend une vue NumPy sans copie, quel que soit l'état du tampon
+- Bougie en formation : emplacement dédié juste après la dernière close, inclus dans la vue
+  `forming=True` ; remplacée en place à chaque tick
+- `version` : incrémenté à chaque changement (clé des caches et du RenderScheduler)
+Les vues sont en lecture seule et ne restent valides que jusqu'à la prochaine écriture :
+copier (`.copy()`, `.tolist()`) ce qui doit être conservé.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+COLUMNS: Tuple[str, ...] = ("ts", "open", "high", "low", "close", "volume")
+
+
+class CandleRing:
+    def __init__(self, maxlen: int, fields: Sequence[str] = COLUMNS):
+        self.maxlen = int(maxlen)
+        self.fields = tuple(fields)
+        self._idx: Dict[str, int] = {f: i for i, f in enumerate(self.fields)}
+        self._cap = self.maxlen + 1            # +1 : emplacement de la bougie en formation
+        self._data = np.full((len(self.fields), 2 * self._cap), np.nan)
+        self._head = 0                         # position de la prochaine close (et de la bougie en formation)
+        self._n = 0
+        self._forming = False
+        self.version = 0
+
+    def __len__(self) -> int:
+        """Nombre de bougies closes."""
+        return self._n
+
+    @property
+    def has_forming(self) -> bool:
+        return self._forming
+
+    # ---------------- Écriture ----------------
+    def _write(self, values) -> None:
+        col = self._data
+        h = self._head
+        col[:, h] = values
+        col[:, h + self._cap] = values
+
+    def append(self, *values: float, keep_forming: bool = False) -> None:
+        """Ajoute une bougie close. La bougie en formation est effacée, sauf `keep_forming`."""
+        forming = self._data[:, self._head].copy() if keep_forming and self._forming else None
+        self._write(values)
+        self._head = (self._head + 1) % self._cap
+        self._n = min(self._n + 1, self.maxlen)
+        self._forming = forming is not None
+        if forming is not None:
+            self._write(forming)
+        self.version += 1
+
+    def extend(self, rows) -> None:
+        """Ajout en bloc d'un tableau (N, len(fields)) de bougies closes (seules les `maxlen` dernières comptent)."""
+        arr = np.asarray(rows, dtype=np.float64).reshape(-1, len(self.fields))[-self.maxlen:]
+        if len(arr) == 0:
+            return
+        self._forming = False
+        for row in arr:  # au plus maxlen écritures, une fois (préchargement)
+            self._write(row)
+            self._head = (self._head + 1) % self._cap
+        self._n = min(self._n + len(arr), self.maxlen)
+        self.version += 1
+
+    def set_forming(self, *values: float) -> bool:
+        """Remplace la bougie en formation. False (version inchangée) si rien n'a changé."""
+        if self._forming and tuple(self._data[:, self._head]) == tuple(float(v) for v in values):
+            return False
+        self._write(values)
+        self._forming = True
+        self.version += 1
+        return True
+
+    def clear_forming(self) -> None:
+        if self._forming:
+            self._forming = False
+            self.version += 1
+
+    def clear(self) -> None:
+        self._head = self._n = 0
+        self._forming = False
+        self.version += 1
+
+    # ---------------- Lecture ----------------
+    def view(self, field: str, forming: bool = True, n: Optional[int] = None) -> np.ndarray:
+        """Vue contiguë (lecture seule) des `n` dernières closes (toutes par défaut), + bougie en formation si demandée."""
+        k = min(self._n, self._n if n is None else int(n))
+        end = self._head + self._cap + (1 if forming and self._forming else 0)
+        v = self._data[self._idx[field], end - k - (1 if forming and self._forming else 0):end]
+        v.flags.writeable = False
+        return v
+
+    def arrays(self, forming: bool = True, n: Optional[int] = None) -> Tuple[np.ndarray, ...]:
+        """Vues de tous les champs, dans l'ordre de `fields`."""
+        return tuple(self.view(f, forming, n) for f in self.fields)
+
+    def last(self, field: str, forming: bool = False) -> float:
+        """Dernière valeur (close, ou bougie en formation si `forming` et présente) ; NaN si vide."""
+        if forming and self._forming:
+            return float(self._data[self._idx[field], self._head])
+        if self._n == 0:
+            return float("nan")
+        return float(self._data[self._idx[field], (self._head - 1) % self._cap])
+
+    def forming_row(self) -> Optional[Tuple[float, ...]]:
+        if not self._forming:
+            return None
+        return tuple(float(x) for x in self._data[:, self._head])
+
+    def rows(self, forming: bool = False) -> Iterable[Tuple[float, ...]]:
+        return zip(*(a.tolist() for a in self.arrays(forming)))
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+candle_store.py — Cache OHLCV incrémental par symbole (pour main.py)
+- Amorçage unique via REST (fetch_ohlcv limit=N)
+- Ensuite on n'ajoute que les bougies closes :
+    - via REST `fetch_ohlcv(since=...)` quand une clôture est attendue
+    - ou via le callback WS `on_kline_closed` (aucun appel réseau)
+- `refresh_many()` : rafraîchit plusieurs symboles en parallèle (pool de threads borné,
+  budget REST partagé via ratelimit.RateBudget), résultats dans l'ordre d'arrivée
+- Base locale optionnelle (candle_db.CandleDB) : l'amorçage lit d'abord le disque (fenêtre
+  complète et contiguë) et ne demande au réseau que la fin manquante ; chaque bougie close
+  reçue y est enregistrée
+- Listener optionnel (ex: indicators.IndicatorBook) : reset(symbol) / push(symbol, row)
+  appelés sous verrou pour chaque bougie close ajoutée, dans l'ordre
+- Stockage : un candle_ring.CandleRing par symbole (colonnes NumPy préallouées, bougie en
+  formation dans l'emplacement dédié)
+Notes:
+- Thread-safe : le WS pousse depuis son thread, la boucle du bot lit depuis le thread principal.
+- Une bougie WS qui laisse un trou (bougies manquantes) est ignorée : le prochain
+  `refresh()` REST comble le trou dans l'ordre.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from candle_ring import CandleRing
+
+COLUMNS = ["ts", "open", "high", "low", "close", "volume"]
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class CandleStore:
+    """Bougies closes par symbole (+ bougie en formation optionnelle), bornées à `maxlen`."""
+
+    def __init__(self, exchange, timeframe: str, maxlen: int = 200, listener=None,
+                 max_workers: int = 1, budget=None, db=None):
+        self.exchange = exchange
+        self.db = db
+        self.listener = listener
+        self.max_workers = max(1, int(max_workers))
+        self.budget = budget
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.timeframe = timeframe
+        self.maxlen = maxlen
+        self.tf_ms = int(exchange.parse_timeframe(timeframe) * 1000)
+        self._lock = threading.Lock()
+        self._closed: Dict[str, CandleRing] = {}
+
+    # ---------------- Ingestion ----------------
+    def has(self, symbol: str) -> bool:
+        return symbol in self._closed
+
+    def bootstrap(self, symbol: str) -> int:
+        """Charge l'historique initial (base locale puis un seul appel REST)."""
+        local = self._read_local(symbol)
+        with self._lock:
+            self._closed[symbol] = CandleRing(self.maxlen, fields=COLUMNS)
+            if self.listener is not None:
+                self.listener.reset(symbol)
+        # base locale utilisée seulement si elle couvre toute la fenêtre, sans trou ; sinon un
+        # amorçage REST complet, dont les bougies comblent la base (tête et trous) au passage
+        if len(local) == self.maxlen and (local[1:, 0] - local[:-1, 0] == self.tf_ms).all():
+            last = int(local[-1][0])
+            if (now_ms() - last) // self.tf_ms <= self.maxlen:
+                added = self._ingest(symbol, local.tolist(), persist=False)
+                rows = self._fetch(symbol, since=last + self.tf_ms, limit=self.maxlen + 1)
+                return added + self._ingest(symbol, rows)
+        rows = self._fetch(symbol, limit=self.maxlen + 1)
+        return self._ingest(symbol, rows)
+
+    def _read_local(self, symbol: str):
+        if self.db is None:
+            return ()
+        try:
+            return self.db.read(self.exchange.id, symbol, self.timeframe, limit=self.maxlen)
+        except Exception:
+            return ()
+
+    def _persist(self, symbol: str, rows: List[list]) -> None:
+        if self.db is None or not rows:
+            return
+        try:
+            self.db.append(self.exchange.id, symbol, self.timeframe, rows)
+        except Exception:
+            pass  # la base locale est un cache: jamais bloquante pour le trading
+
+    def due(self, symbol: str) -> bool:
+        """True si une bougie a dû clôturer depuis la dernière connue (sinon rien à demander)."""
+        last = self.last_closed_ts(symbol)
+        if last is None:
+            return True
+        return now_ms() >= last + 2 * self.tf_ms
+
+    def refresh(self, symbol: str, force: bool = False) -> int:
+        """
+        Complète le cache via REST. Sans `force`, n'appelle le réseau que si une clôture
+        manque (`due`). Avec `force`, rafraîchit aussi la bougie en formation.
+        Retourne le nombre de nouvelles bougies closes.
+        """
+        if not self.has(symbol):
+            return self.bootstrap(symbol)
+        if not force and not self.due(symbol):
+            return 0
+        last = self.last_closed_ts(symbol)
+        if last is None or (now_ms() - last) // self.tf_ms > self.maxlen:
+            # Trou plus grand que le cache : on repart de zéro
+            return self.bootstrap(symbol)
+        rows = self._fetch(symbol, since=last + self.tf_ms, limit=self.maxlen + 1)
+        return self._ingest(symbol, rows)
+
+    def refresh_many(self, symbols: Iterable[str], force: bool = False) -> Iterator[Tuple[str, Optional[Exception]]]:
+        """
+        `refresh()` de plusieurs symboles en parallèle (`max_workers` threads).
+        Produit (symbol, erreur|None) dès que chaque symbole est prêt ; une erreur
+        réseau sur un symbole n'interrompt pas les autres.
+        """
+        symbols = list(symbols)
+        if self.max_workers <= 1 or len(symbols) <= 1:
+            for sym in symbols:
+                try:
+                    self.refresh(sym, force=force)
+                    yield sym, None
+                except Exception as e:
+                    yield sym, e
+            return
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="candles")
+        futures = {self._pool.submit(self.refresh, sym, force): sym for sym in symbols}
+        for fut in as_completed(futures):
+            yield futures[fut], fut.exception()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _fetch(self, symbol: str, since: Optional[int] = None, limit: Optional[int] = None) -> List[list]:
+        if self.budget is not None:
+            self.budget.acquire()
+        return self.exchange.fetch_ohlcv(symbol, timeframe=self.timeframe, since=since, limit=limit)
+
+    def add_closed(self, symbol: str, ts: int, o: float, h: float, l: float, c: float, v: float) -> bool:
+        """Ajoute une bougie close (ex: WS). Refuse les doublons et les trous."""
+        with self._lock:
+            closed = self._closed.get(symbol)
+            if closed is None:
+                return False
+            if len(closed) and ts != int(closed.last("ts")) + self.tf_ms:
+                return False
+            row = [int(ts), float(o), float(h), float(l), float(c), float(v)]
+            # bougie en formation conservée seulement si elle est postérieure à la close ajoutée
+            closed.append(*row, keep_forming=closed.last("ts", forming=True) > ts)
+            if self.listener is not None:
+                self.listener.push(symbol, row)
+        self._persist(symbol, [row])
+        return True
+
+    def _ingest(self, symbol: str, rows: List[list], persist: bool = True) -> int:
+        cutoff = now_ms()
+        new_rows: List[list] = []
+        with self._lock:
+            closed = self._closed[symbol]
+            for r in rows:
+                ts = int(r[0])
+                row = [ts, float(r[1]), float(r[2]), float(r[3]), float(r[4]), float(r[5] or 0.0)]
+                if ts + self.tf_ms > cutoff:
+                    closed.set_forming(*row)
+                    continue
+                if len(closed) and ts <= closed.last("ts"):
+                    continue
+                closed.append(*row, keep_forming=True)
+                if self.listener is not None:
+                    self.listener.push(symbol, row)
+                new_rows.append(row)
+            if closed.has_forming and len(closed) and closed.last("ts", forming=True) <= closed.last("ts"):
+                closed.clear_forming()
+        if persist:
+            self._persist(symbol, new_rows)
+        return len(new_rows)
+
+    # ---------------- Lecture ----------------
+    def last_closed_ts(self, symbol: str) -> Optional[int]:
+        closed = self._closed.get(symbol)
+        if not closed:
+            return None
+        return int(closed.last("ts"))
+
+    def forming(self, symbol: str) -> Optional[list]:
+        """Bougie en formation connue (dernier REST forcé), ou None."""
+        with self._lock:
+            ring = self._closed.get(symbol)
+            row = ring.forming_row() if ring is not None else None
+        if row is None:
+            return None
+        return [int(row[0])] + list(row[1:])
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+download.py — Téléchargement d'historique profond vers la base locale (candle_db)
+- Pagination ccxt `fetch_ohlcv(since=..., limit=1000)` : une page = une fenêtre de 1000 bougies
+- Pages de tous les (symbole, timeframe) exécutées en parallèle (pool de threads borné),
+  sous un budget REST global (ratelimit.RateBudget)
+- Plan = plages absentes de la base entre --since/--days (ou la première bougie stockée si elle est
+  plus ancienne) et maintenant : historique antérieur, trous et fin, une tâche par plage
+- Reprise : la relance ne replanifie que ce qui manque encore (Ctrl+C puis relance = aucune perte)
+- Les pages terminées sont écrites dans l'ordre de chaque plage (CandleDB fusionne tête et trous)
+- Trous restants après téléchargement : absents chez l'exchange aussi (maintenance, listing...)
+Le bot (candle_store) et les backtests lisent ensuite ces bougies au démarrage au lieu du REST.
+
+Usage:
+    python download.py --symbols BTC/USDT,ETH/USDT --timeframes 1m,1h --days 365
+    python download.py --since 2021-01-01 --workers 8 --rate 15
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from candle_db import CandleDB, missing_ranges, timeframe_ms
+from ratelimit import RateBudget
+
+PAGE = 1000
+
+
+@dataclass
+class Job:
+    symbol: str
+    timeframe: str
+    tf_ms: int
+    start: int                       # premier openTime à télécharger
+    end: int                         # exclu (bougies closes seulement)
+    pages: int = 0
+    next_page: int = 0               # prochaine page à écrire (ordre strict)
+    done: Dict[int, list] = field(default_factory=dict)
+    added: int = 0
+
+
+def plan(db: CandleDB, exchange_id: str, symbol: str, timeframe: str, since_ms: int, now: int) -> List[Job]:
+    """Une tâche par plage absente de [min(since_ms, première bougie locale), maintenant)."""
+    tf = timeframe_ms(timeframe)
+    cols = db.columns(exchange_id, symbol, timeframe)
+    ts = cols["ts"] if cols else np.empty(0, dtype=np.int64)
+    start = -(-since_ms // tf) * tf
+    if len(ts):
+        start = min(start, int(ts[0]))
+    end = now // tf * tf  # la bougie qui commence à `end` est encore en formation
+    jobs = []
+    for lo, hi in missing_ranges(ts, start, end, tf):
+        job = Job(symbol, timeframe, tf, lo, hi)
+        job.pages = -(-(hi - lo) // (PAGE * tf))
+        jobs.append(job)
+    return jobs
+
+
+def fetch_page(exchange, budget: Optional[RateBudget], job: Job, k: int, retries: int = 3) -> list:
+    lo = job.start + k * PAGE * job.tf_ms
+    hi = min(job.end, lo + PAGE * job.tf_ms)
+    for attempt in range(retries):
+        try:
+            if budget is not None:
+                budget.acquire()
+            rows = exchange.fetch_ohlcv(job.symbol, timeframe=job.timeframe, since=lo, limit=PAGE)
+            return [r for r in rows if lo <= int(r[0]) < hi]
+        except Exception:
+            if attempt == retries - 1:
+                raise
+            time.sleep(1.0 * (attempt + 1))
+    return []
+
+
+def flush(db: CandleDB, exchange_id: str, job: Job) -> None:
+    """Écrit les pages terminées contiguës à partir de `next_page`."""
+    while job.next_page in job.done:
+        rows = job.done.pop(job.next_page)
+        job.added += db.append(exchange_id, job.symbol, job.timeframe, rows)
+        job.next_page += 1
+
+
+def find_gaps(db: CandleDB, exchange_id: str, symbol: str, timeframe: str) -> np.ndarray:
+    """
+    Trous de la série stockée : tableau (K, 2) [premier openTime manquant, nb de bougies manquantes].
+    plan() les replanifie à chaque lancement ; ceux qui restent n'existent pas chez l'exchange.
+    """
+    cols = db.columns(exchange_id, symbol, timeframe)
+    if not cols:
+        return np.empty((0, 2), dtype=np.int64)
+    tf = timeframe_ms(timeframe)
+    ts = np.asarray(cols["ts"])
+    step = np.diff(ts)
+    idx = np.flatnonzero(step != tf)
+    return np.column_stack((ts[idx] + tf, step[idx] // tf - 1)).astype(np.int64)
+
+
+def plan_all(exchange, db: CandleDB, symbols: List[str], timeframes: List[str], since_ms: int) -> List[Job]:
+    now = exchange.milliseconds()
+    return [job for s in symbols for tf in timeframes for job in plan(db, exchange.id, s, tf, since_ms, now)]
+
+
+def download(exchange, db: CandleDB, jobs: List[Job], workers: int = 4,
+             budget: Optional[RateBudget] = None, on_page=None) -> List[Job]:
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(fetch_page, exchange, budget, job, k): (job, k)
+                   for job in jobs for k in range(job.pages)}
+        try:
+            for fut in as_completed(futures):
+                job, k = futures[fut]
+                job.done[k] = fut.result()
+                flush(db, exchange.id, job)
+                if on_page is not None:
+                    on_page(job)
+        except BaseException:
+            # Ctrl+C / erreur : on garde le préfixe déjà écrit, la relance reprendra de là
+            for f in futures:
+                f.cancel()
+            raise
+    return jobs
+
+
+def _fmt_ts(ms: Optional[int]) -> str:
+    if ms is None:
+        return "-"
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+def main():
+    import ccxt
+    from rich.console import Console
+    from rich.progress import Progress
+    from rich.table import Table
+    from main import Config
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--symbols", default="", help="liste séparée par des virgules (défaut: config)")
+    ap.add_argument("--timeframes", default="", help="ex: 1m,1h (défaut: timeframe de la config)")
+    ap.add_argument("--days", type=float, default=365.0, help="profondeur (historique antérieur complété si besoin)")
+    ap.add_argument("--since", default="", help="date de départ YYYY-MM-DD (prioritaire sur --days)")
+    ap.add_argument("--workers", type=int, default=0, help="pages en parallèle (défaut: scan_concurrency)")
+    ap.add_argument("--rate", type=float, default=None, help="requêtes/s max (défaut: rest_rate_per_sec)")
+    ap.add_argument("--db", default=None, help="base locale (défaut: candle_db_dir)")
+    args = ap.parse_args()
+
+    cfg = Config.from_yaml(args.config)
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()] or cfg.symbols
+    timeframes = [t.strip() for t in args.timeframes.split(",") if t.strip()] or [cfg.timeframe]
+    db = CandleDB((cfg.candle_db_dir if args.db is None else args.db) or "data/candles")
+    budget = RateBudget(cfg.rest_rate_per_sec if args.rate is None else args.rate)
+    ex = getattr(ccxt, cfg.exchange.lower())({"enableRateLimit": True})
+    if args.since:
+        since_ms = int(datetime.strptime(args.since, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+    else:
+        since_ms = ex.milliseconds() - int(args.days * 86400 * 1000)
+
+    console = Console()
+    with Progress(console=console) as progress:
+        jobs = plan_all(ex, db, symbols, timeframes, since_ms)
+        task = progress.add_task("Pages", total=sum(j.pages for j in jobs))
+
+        def on_page(_job):
+            progress.advance(task)
+
+        try:
+            download(ex, db, jobs, workers=args.workers or cfg.scan_concurrency, budget=budget, on_page=on_page)
+        except KeyboardInterrupt:
+            console.print("[yellow]Interrompu — relancer pour reprendre là où la base s'arrête.[/yellow]")
+            return
+
+    table = Table(title=f"Historique {db.root} — {ex.id}")
+    for col in ("Symbole", "TF", "Ajoutées", "Total", "Début", "Fin", "Trous"):
+        table.add_column(col)
+    for sym, tf in ((s, t) for s in symbols for t in timeframes):
+        added = sum(j.added for j in jobs if j.symbol == sym and j.timeframe == tf)
+        cols = db.columns(ex.id, sym, tf)
+        gaps = find_gaps(db, ex.id, sym, tf)
+        missing = int(gaps[:, 1].sum()) if len(gaps) else 0
+        table.add_row(sym, tf, str(added), str(len(cols["ts"]) if cols else 0),
+                      _fmt_ts(int(cols["ts"][0]) if cols else None), _fmt_ts(int(cols["ts"][-1]) if cols else None),
+                      f"[red]{len(gaps)} ({missing} bougies)[/red]" if len(gaps) else "[green]0[/green]")
+    console.print(table)
+    if budget.waits:
+        console.print(f"[dim]Budget REST: {budget.waits} attentes, {budget.waited_sec:.1f}s cumulées[/dim]")
+
+
+if __name__ == "__main__":
+    main()
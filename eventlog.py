@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+eventlog.py — Journal d'événements du bot (logs/bot-events-YYYYMMDD.log) sans I/O sur le thread de trading
+- Mode asynchrone (défaut) : le logger n'a qu'un QueueHandler (SimpleQueue, utilisable depuis un
+  handler de signal) ; un QueueListener écrit sur disque dans son propre thread
+- Rotation quotidienne (UTC) en gardant le nommage existant : on passe simplement au fichier du jour
+- Option lignes JSON : {"ts", "level", "event", "msg", + champs key=value du message}
+- stop_event_logger(name) vide la file et ferme les fichiers (appelé par StopLossBot.close ; atexit en filet)
+"""
+
+from __future__ import annotations
+
+import atexit
+import datetime as dt
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+from typing import Dict
+
+_LISTENERS: Dict[str, logging.handlers.QueueListener] = {}
+_KV = re.compile(r"(\w+)=(\S*)")
+
+
+class DailyFileHandler(logging.FileHandler):
+    """FileHandler qui bascule sur `{prefix}-YYYYMMDD.log` (date UTC de l'enregistrement) à minuit."""
+
+    def __init__(self, log_dir: str, prefix: str = "bot-events"):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.day = self._day(None)
+        os.makedirs(log_dir, exist_ok=True)
+        super().__init__(self._path(self.day), encoding="utf-8", delay=True)
+
+    @staticmethod
+    def _day(record) -> str:
+        t = record.created if record is not None else None
+        return (dt.datetime.fromtimestamp(t, dt.timezone.utc) if t else dt.datetime.now(dt.timezone.utc)).strftime("%Y%m%d")
+
+    def _path(self, day: str) -> str:
+        return os.path.abspath(os.path.join(self.log_dir, f"{self.prefix}-{day}.log"))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        day = self._day(record)
+        if day != self.day:
+            self.acquire()
+            try:
+                if self.stream is not None:
+                    self.stream.close()
+                    self.stream = None
+                self.day = day
+                self.baseFilename = self._path(day)
+            finally:
+                self.release()
+        super().emit(record)
+
+
+class JsonLineFormatter(logging.Formatter):
+    """Une ligne JSON par événement ; 'TRADE action=ENTER symbol=...' => event=TRADE, action=..., symbol=..."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        msg = record.getMessage()
+        head = msg.split(" ", 1)[0]
+        row = {
+            "ts": dt.datetime.fromtimestamp(record.created, dt.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "event": head if head.isupper() and "=" not in head else "",
+            "msg": msg,
+        }
+        for k, v in _KV.findall(msg):
+            row.setdefault(k, v)
+        if record.exc_info:
+            row["exc"] = self.formatException(record.exc_info)
+        return json.dumps(row, ensure_ascii=False)
+
+
+def setup_event_logger(name: str = "bot", log_dir: str = "logs", async_mode: bool = True,
+                       json_lines: bool = False) -> logging.Logger:
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    fh = DailyFileHandler(log_dir)
+    if json_lines:
+        fh.setFormatter(JsonLineFormatter())
+    else:
+        fh.setFormatter(logging.Formatter(fmt="%(asctime)s %(levelname)s %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+    if not async_mode:
+        logger.addHandler(fh)
+        return logger
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(q, fh, respect_handler_level=True)
+    listener.start()
+    _LISTENERS[name] = listener
+    logger.addHandler(logging.handlers.QueueHandler(q))
+    atexit.register(stop_event_logger, name)
+    return logger
+
+
+def stop_event_logger(name: str = "bot") -> None:
+    """Vide la file (tous les messages déjà émis sont écrits) puis ferme les fichiers. Idempotent."""
+    listener = _LISTENERS.pop(name, None)
+    logger = logging.getLogger(name)
+    if listener is not None:
+        listener.stop()
+        for h in listener.handlers:
+            h.close()
+    for h in list(logger.handlers):
+        h.flush()
+        if listener is None:
+            h.close()
+        logger.removeHandler(h)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+indicators.py — Indicateurs incrémentaux par symbole (pour main.py)
+- RollingMax / RollingMin : extrêmes glissants via deque monotone, O(1) amorti par bougie
+- RollingMean : moyenne glissante par somme courante, O(1) par bougie (+ peek pour la bougie en formation)
+- WilderATR : ATR en flux, O(1) par bougie, identique bit à bit à
+  `tr.ewm(alpha=1/n, adjust=False).mean()` (StopLossBot._atr) sur la même série
+- Levels : HH_N / LL_N pour chaque lookback configuré + ATR, mis à jour à chaque bougie close
+- IndicatorBook : un Levels par symbole, branché comme listener sur CandleStore
+Conventions (identiques aux slices pandas historiques du bot) :
+- hh(N)       = max des N dernières bougies closes        (seuil à casser par la prochaine clôture)
+- prev_hh(N)  = max des N bougies avant la dernière close  (= df["high"].iloc[-(N+1):-1].max())
+"""
+
+from __future__ import annotations
+
+import math
+from collections import deque
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+
+class RollingMax:
+    """Max glissant sur `window` valeurs (deque monotone décroissante)."""
+
+    __slots__ = ("window", "_dq", "_i")
+
+    def __init__(self, window: int):
+        self.window = int(window)
+        self._dq: Deque[Tuple[int, float]] = deque()
+        self._i = 0
+
+    def push(self, x: float) -> None:
+        dq = self._dq
+        while dq and dq[-1][1] <= x:
+            dq.pop()
+        dq.append((self._i, x))
+        if dq[0][0] <= self._i - self.window:
+            dq.popleft()
+        self._i += 1
+
+    def value(self) -> float:
+        return self._dq[0][1] if self._dq else math.nan
+
+
+class RollingMin:
+    """Min glissant sur `window` valeurs (deque monotone croissante)."""
+
+    __slots__ = ("window", "_dq", "_i")
+
+    def __init__(self, window: int):
+        self.window = int(window)
+        self._dq: Deque[Tuple[int, float]] = deque()
+        self._i = 0
+
+    def push(self, x: float) -> None:
+        dq = self._dq
+        while dq and dq[-1][1] >= x:
+            dq.pop()
+        dq.append((self._i, x))
+        if dq[0][0] <= self._i - self.window:
+            dq.popleft()
+        self._i += 1
+
+    def value(self) -> float:
+        return self._dq[0][1] if self._dq else math.nan
+
+
+class RollingMean:
+    """Moyenne des `window` dernières valeurs (fenêtre partielle au démarrage)."""
+
+    __slots__ = ("window", "_dq", "_sum")
+
+    def __init__(self, window: int):
+        self.window = int(window)
+        self._dq: Deque[float] = deque()
+        self._sum = 0.0
+
+    def push(self, x: float) -> None:
+        self._dq.append(x)
+        self._sum += x
+        if len(self._dq) > self.window:
+            self._sum -= self._dq.popleft()
+
+    def value(self) -> float:
+        return self._sum / len(self._dq) if self._dq else math.nan
+
+    def peek(self, x: float) -> float:
+        """Moyenne si `x` était ajouté — état inchangé."""
+        n = len(self._dq)
+        if n < self.window:
+            return (self._sum + x) / (n + 1)
+        return (self._sum + x - self._dq[0]) / self.window
+
+
+class WilderATR:
+    """
+    ATR de Wilder incrémental. Reproduit le noyau pandas `ewm(adjust=False)` :
+    alpha recalculé via le centre de masse, pondération normalisée, et valeur inchangée
+    si TR == ATR — d'où l'égalité bit à bit avec le calcul DataFrame historique.
+    La 1re bougie n'a pas de close précédent : TR = high - low.
+    """
+
+    __slots__ = ("n", "alpha", "_old_wt", "value", "prev_close", "count")
+
+    def __init__(self, n: int = 14):
+        self.n = int(n)
+        com = (1.0 - 1.0 / self.n) / (1.0 / self.n)
+        self.alpha = 1.0 / (1.0 + com)
+        self._old_wt = 1.0 - self.alpha
+        self.value = math.nan
+        self.prev_close = math.nan
+        self.count = 0
+
+    def true_range(self, high: float, low: float) -> float:
+        pc = self.prev_close
+        if pc != pc:
+            return high - low
+        return max(high - low, abs(high - pc), abs(low - pc))
+
+    def _step(self, tr: float) -> float:
+        v = self.value
+        if v != v:
+            return tr
+        if v != tr:
+            return (self._old_wt * v + self.alpha * tr) / (self._old_wt + self.alpha)
+        return v
+
+    def update(self, high: float, low: float, close: float) -> float:
+        self.value = self._step(self.true_range(high, low))
+        self.prev_close = close
+        self.count += 1
+        return self.value
+
+    def peek(self, high: float, low: float) -> float:
+        """ATR si une bougie (en formation) de high/low donnés était ajoutée — état inchangé."""
+        return self._step(self.true_range(high, low))
+
+
+class Levels:
+    """HH/LL glissants d'un symbole pour plusieurs lookbacks (+ ATR de Wilder)."""
+
+    def __init__(self, high_lookbacks: Iterable[int], low_lookbacks: Iterable[int], atr_period: int = 14):
+        self._hh: Dict[int, RollingMax] = {int(n): RollingMax(n) for n in high_lookbacks}
+        self._ll: Dict[int, RollingMin] = {int(n): RollingMin(n) for n in low_lookbacks}
+        self._prev_hh: Dict[int, float] = {n: math.nan for n in self._hh}
+        self._prev_ll: Dict[int, float] = {n: math.nan for n in self._ll}
+        self.atr = WilderATR(atr_period)
+        self.count = 0
+        self.ts: Optional[int] = None      # openTime (ms) de la dernière bougie close
+        self.high: float = math.nan        # OHLC utiles de la dernière bougie close
+        self.low: float = math.nan
+        self.close: float = math.nan
+
+    def update(self, ts: int, high: float, low: float, close: float) -> None:
+        for n, rm in self._hh.items():
+            self._prev_hh[n] = rm.value()
+            rm.push(high)
+        for n, rm in self._ll.items():
+            self._prev_ll[n] = rm.value()
+            rm.push(low)
+        self.atr.update(high, low, close)
+        self.count += 1
+        self.ts = ts
+        self.high = high
+        self.low = low
+        self.close = close
+
+    def hh(self, n: int) -> float:
+        return self._hh[n].value()
+
+    def ll(self, n: int) -> float:
+        return self._ll[n].value()
+
+    def prev_hh(self, n: int) -> float:
+        return self._prev_hh[n]
+
+    def prev_ll(self, n: int) -> float:
+        return self._prev_ll[n]
+
+
+class IndicatorBook:
+    """
+    Indicateurs par symbole. Interface listener de CandleStore :
+    - reset(symbol)       # ré-amorçage complet du cache
+    - push(symbol, row)   # nouvelle bougie close [ts, o, h, l, c, v]
+    """
+
+    def __init__(self, high_lookbacks: Iterable[int], low_lookbacks: Iterable[int], atr_period: int = 14):
+        self.high_lookbacks = sorted({int(n) for n in high_lookbacks})
+        self.low_lookbacks = sorted({int(n) for n in low_lookbacks})
+        self.atr_period = int(atr_period)
+        self._by_symbol: Dict[str, Levels] = {}
+
+    def reset(self, symbol: str) -> None:
+        self._by_symbol[symbol] = Levels(self.high_lookbacks, self.low_lookbacks, self.atr_period)
+
+    def push(self, symbol: str, row) -> None:
+        lv = self._by_symbol.get(symbol)
+        if lv is None:
+            self.reset(symbol)
+            lv = self._by_symbol[symbol]
+        lv.update(int(row[0]), float(row[2]), float(row[3]), float(row[4]))
+
+    def get(self, symbol: str) -> Optional[Levels]:
+        return self._by_symbol.get(symbol)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+journal.py — Journal des trades bufferisé (remplace l'ouverture/fermeture de trades.csv à chaque trade)
+- Le CSV reste ouvert ; les lignes sont accumulées puis écrites d'un bloc quand
+  `flush_rows` lignes sont en attente ou que `flush_sec` est écoulé (write / maybe_flush),
+  et toujours sur flush() / close()
+- Format CSV : ts, symbol, action, price, qty, realized_pnl, equity, note, stop
+  (stop = stop initial des lignes ENTER_*, vide sinon) ; un ancien trades.csv sans colonne
+  `stop` est migré une fois à l'ouverture (colonne ajoutée, vide)
+- Puits colonnaire optionnel (`columnar_dir`) pour l'analyse de millions de lignes :
+    ts.i8 (ms UTC), price.f8, qty.f8, realized_pnl.f8, equity.f8, stop.f8 — binaires bruts en ajout
+    symbol.i4, action.i4, note.i4 — codes d'un dictionnaire (dictionary.json) ; les notes sont
+    des libellés constants (valeurs numériques en colonnes), le dictionnaire reste petit
+  Relecture : load_columnar(dir) -> DataFrame (np.fromfile, sans parsing)
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+HEADER = ["ts", "symbol", "action", "price", "qty", "realized_pnl", "equity", "note", "stop"]
+
+_NUM_COLS = {"ts": "<i8", "price": "<f8", "qty": "<f8", "realized_pnl": "<f8", "equity": "<f8", "stop": "<f8"}
+_STR_COLS = ("symbol", "action", "note")
+
+
+class ColumnarSink:
+    """Colonnes binaires en ajout ; les chaînes sont encodées via un dictionnaire persistant."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._dict_path = os.path.join(root, "dictionary.json")
+        self.dictionary: Dict[str, List[str]] = {c: [] for c in _STR_COLS}
+        if os.path.exists(self._dict_path):
+            with open(self._dict_path, "r", encoding="utf-8") as f:
+                self.dictionary.update(json.load(f))
+        self._codes = {c: {v: i for i, v in enumerate(vals)} for c, vals in self.dictionary.items()}
+        self._repair()
+
+    def _file(self, col: str) -> str:
+        dt = np.dtype(_NUM_COLS.get(col, "<i4"))
+        return os.path.join(self.root, f"{col}.{dt.kind}{dt.itemsize}")
+
+    def _repair(self) -> None:
+        """
+        Écriture interrompue : ramène toutes les colonnes à la longueur commune.
+        Colonne numérique absente d'un puits plus ancien (ex: stop) : créée, remplie de NaN.
+        """
+        cols = list(_NUM_COLS) + list(_STR_COLS)
+        sizes = {}
+        for c in cols:
+            fp = self._file(c)
+            sizes[c] = os.path.getsize(fp) // np.dtype(_NUM_COLS.get(c, "<i4")).itemsize if os.path.exists(fp) else None
+        present = [v for v in sizes.values() if v is not None]
+        n = min(present) if present else 0
+        for c in _NUM_COLS:
+            if sizes[c] is None and n and c != "ts":
+                np.full(n, np.nan, dtype=_NUM_COLS[c]).tofile(self._file(c))
+                sizes[c] = n
+        for c in cols:
+            sizes[c] = sizes[c] or 0
+        n = min(sizes.values())
+        for c in cols:
+            if sizes[c] != n:
+                os.truncate(self._file(c), n * np.dtype(_NUM_COLS.get(c, "<i4")).itemsize)
+
+    def _code(self, col: str, value: str) -> int:
+        codes = self._codes[col]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.dictionary[col])
+            self.dictionary[col].append(value)
+        return code
+
+    def write(self, rows: List[tuple]) -> None:
+        """rows: (ts_ms, symbol, action, price, qty, pnl, equity, note, stop)"""
+        if not rows:
+            return
+        n_dict = sum(len(v) for v in self.dictionary.values())
+        codes = {c: np.array([self._code(c, r[i]) for r in rows], dtype="<i4")
+                 for c, i in (("symbol", 1), ("action", 2), ("note", 7))}
+        if sum(len(v) for v in self.dictionary.values()) != n_dict:
+            # dictionnaire d'abord : un code écrit est toujours décodable
+            tmp = self._dict_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.dictionary, f)
+            os.replace(tmp, self._dict_path)
+        arrays = {
+            "ts": np.array([r[0] for r in rows], dtype="<i8"),
+            "price": np.array([r[3] for r in rows], dtype="<f8"),
+            "qty": np.array([r[4] for r in rows], dtype="<f8"),
+            "realized_pnl": np.array([r[5] for r in rows], dtype="<f8"),
+            "equity": np.array([r[6] for r in rows], dtype="<f8"),
+            "stop": np.array([r[8] for r in rows], dtype="<f8"),
+            **codes,
+        }
+        for col, arr in arrays.items():
+            with open(self._file(col), "ab") as f:
+                f.write(arr.tobytes())
+
+
+def load_columnar(root: str):
+    """Relit un puits colonnaire en DataFrame (colonnes texte en `category`)."""
+    import pandas as pd
+
+    sink = ColumnarSink(root)
+    data = {}
+    for col, dt in _NUM_COLS.items():
+        data[col] = np.fromfile(sink._file(col), dtype=dt) if os.path.exists(sink._file(col)) else np.empty(0, dt)
+    for col in _STR_COLS:
+        codes = np.fromfile(sink._file(col), dtype="<i4") if os.path.exists(sink._file(col)) else np.empty(0, "<i4")
+        data[col] = pd.Categorical.from_codes(codes, categories=pd.Index(sink.dictionary[col], dtype=object))
+    df = pd.DataFrame(data)
+    df["ts"] = pd.to_datetime(df["ts"], unit="ms", utc=True)
+    return df[HEADER]
+
+
+class TradeJournal:
+    def __init__(self, path: str, flush_sec: float = 5.0, flush_rows: int = 64, columnar_dir: str = ""):
+        self.path = path
+        self.flush_sec = float(flush_sec)
+        self.flush_rows = max(1, int(flush_rows))
+        self._lock = threading.Lock()
+        self._pending: List[tuple] = []
+        self._last_flush = time.monotonic()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new:
+            self._migrate(path)
+        self._f = open(path, "a", newline="", encoding="utf-8")
+        self._w = csv.writer(self._f)
+        if new:
+            self._w.writerow(HEADER)
+            self._f.flush()
+        self.sink: Optional[ColumnarSink] = ColumnarSink(columnar_dir) if columnar_dir else None
+        self.rows_written = 0
+
+    @staticmethod
+    def _migrate(path: str) -> None:
+        """Ancien en-tête (sans `stop`) : fichier réécrit une fois avec la colonne ajoutée, vide."""
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            header = next(csv.reader(f), [])
+            if header == HEADER or header != HEADER[:len(header)]:
+                return  # à jour, ou format inconnu : laissé tel quel
+            tmp = path + ".tmp"
+            with open(tmp, "w", newline="", encoding="utf-8") as out:
+                w = csv.writer(out)
+                w.writerow(HEADER)
+                pad = [""] * (len(HEADER) - len(header))
+                w.writerows(row + pad for row in csv.reader(f))
+        os.replace(tmp, path)
+
+    def write(self, ts: datetime, symbol: str, action: str, price: float, qty: float,
+              pnl: float, equity: float, note: str = "", stop: float = float("nan")) -> None:
+        """`stop` : stop initial (lignes ENTER_*), NaN sinon."""
+        with self._lock:
+            self._pending.append((ts, symbol, action, float(price), float(qty), float(pnl), float(equity), note,
+                                  float(stop)))
+            if len(self._pending) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_sec:
+                self._flush_locked()
+
+    def maybe_flush(self) -> None:
+        """À appeler périodiquement : vide les lignes plus vieilles que flush_sec."""
+        with self._lock:
+            if self._pending and time.monotonic() - self._last_flush >= self.flush_sec:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._pending or self._f is None:
+            return
+        rows, self._pending = self._pending, []
+        self._w.writerows([ts.isoformat(), sym, act, f"{px:.8f}", f"{q:.8f}", f"{pnl:.2f}", f"{eq:.2f}", note,
+                           "" if stop != stop else f"{stop:.8f}"]
+                          for ts, sym, act, px, q, pnl, eq, note, stop in rows)
+        self._f.flush()
+        if self.sink is not None:
+            self.sink.write([(int(r[0].timestamp() * 1000),) + r[1:] for r in rows])
+        self.rows_written += len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._f is None:
+                return
+            self._flush_locked()
+            self._f.close()
+            self._f = None
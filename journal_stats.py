@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+journal_stats.py — Statistiques des trades réels/simulés à partir du journal du bot
+Entrées : un ou plusieurs trades.csv (ts, symbol, action, price, qty, realized_pnl, equity, note, stop)
+et/ou dossiers colonnaires (journal_columnar_dir, voir journal.load_columnar), tout chargé en un bloc.
+Reconstruction vectorisée des trades, par fichier source et par symbole :
+- une ligne ENTER_* ouvre un trade ; TP1_* et EXIT_* suivants jusqu'au prochain ENTER lui appartiennent
+- PnL du trade = somme des realized_pnl (TP1 + sortie)
+- R = PnL / (qty * (entry - stop)), stop = colonne `stop` de la ligne d'entrée ;
+  anciens journaux sans stop : R = PnL / --risk_quote si fourni, sinon non calculé
+Métriques par symbole (mêmes noms que backtest.summarize) + durée en position ; drawdowns
+calculés sur la courbe cumulée dans l'ordre des sorties. Les trades encore ouverts sont comptés à part.
+
+Usage:
+    python journal_stats.py trades.csv
+    python journal_stats.py bots/*/trades.csv data/journal --since 2024-01-01 --symbols BTC/USDT
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from journal import HEADER, load_columnar
+
+_DTYPES = {"symbol": "category", "action": "category", "price": "float64", "qty": "float64",
+           "realized_pnl": "float64", "equity": "float64", "note": "object", "stop": "float64"}
+
+
+def load_journals(paths: List[str]) -> pd.DataFrame:
+    """Concatène les journaux ; colonne `source` = chemin (une instance de bot par fichier)."""
+    frames = []
+    for p in paths:
+        if os.path.isdir(p):
+            df = load_columnar(p)
+        else:
+            df = pd.read_csv(p, usecols=lambda c: c in HEADER, dtype=_DTYPES, keep_default_na=False,
+                             na_values={"stop": [""]})
+            df["ts"] = pd.to_datetime(df["ts"], utc=True, format="ISO8601")
+            if "stop" not in df:
+                df["stop"] = np.nan  # journal antérieur à la colonne stop
+        df["source"] = p
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=HEADER + ["source"])
+    out = pd.concat(frames, ignore_index=True)
+    for col in ("symbol", "action", "source"):
+        out[col] = out[col].astype("category")
+    return out
+
+
+def build_trades(journal: pd.DataFrame, risk_quote: float = 0.0) -> pd.DataFrame:
+    """Une ligne par trade : symbol, source, entry_ts, exit_ts, entry, stop, qty, exit, reason, tp1_hit, pnl, R, hold, closed."""
+    df = journal.sort_values(["source", "symbol", "ts"], kind="stable").reset_index(drop=True)
+    # opérations texte sur les catégories (quelques dizaines), puis indexation par code
+    cats = df["action"].cat.categories.astype(str)
+    codes = df["action"].cat.codes.to_numpy()
+    is_enter = np.asarray(cats.str.startswith("ENTER"))[codes]
+    is_exit = np.asarray(cats.str.startswith("EXIT"))[codes]
+    is_tp1 = np.asarray(cats.str.startswith("TP1"))[codes]
+    reasons = cats.str.replace(r"^EXIT_(SIM|LIVE)_", "", regex=True)
+    keys = [df["source"], df["symbol"]]
+    tid = pd.Series(is_enter, index=df.index).groupby(keys, observed=True).cumsum().to_numpy()
+    keep = tid > 0  # lignes avant la première entrée (journal tronqué) ignorées
+    df, tid, codes = df[keep], tid[keep], codes[keep]
+    is_enter, is_exit, is_tp1 = is_enter[keep], is_exit[keep], is_tp1[keep]
+
+    parts = pd.DataFrame({
+        "source": df["source"], "symbol": df["symbol"], "tid": tid,
+        "entry_ts": df["ts"].where(is_enter), "entry": df["price"].where(is_enter),
+        "qty": df["qty"].where(is_enter), "stop": df["stop"].where(is_enter),
+        "exit_ts": df["ts"].where(is_exit), "exit": df["price"].where(is_exit),
+        "reason": pd.Series(np.asarray(reasons, dtype=object)[codes], index=df.index).where(is_exit),
+        "tp1_hit": is_tp1, "pnl": df["realized_pnl"],
+    })
+    trades = parts.groupby(["source", "symbol", "tid"], observed=True, sort=False).agg(
+        entry_ts=("entry_ts", "first"), exit_ts=("exit_ts", "last"), entry=("entry", "first"),
+        stop=("stop", "first"), qty=("qty", "first"), exit=("exit", "last"), reason=("reason", "last"),
+        tp1_hit=("tp1_hit", "any"), pnl=("pnl", "sum"),
+    ).reset_index().drop(columns="tid")
+
+    risk = trades["qty"] * (trades["entry"] - trades["stop"])
+    if risk_quote > 0:
+        risk = risk.where(risk > 0, risk_quote)
+    trades["R"] = trades["pnl"] / risk.where(risk > 0)
+    trades["closed"] = trades["exit_ts"].notna()
+    trades["hold"] = trades["exit_ts"] - trades["entry_ts"]
+    return trades
+
+
+def _stats(closed: pd.DataFrame, by: pd.Series) -> pd.DataFrame:
+    g = closed.groupby(by, observed=True)
+    cum = g["pnl"].cumsum()
+    max_dd = (cum.groupby(by, observed=True).cummax().clip(lower=0) - cum).groupby(by, observed=True).max()
+    cum_r = closed["R"].fillna(0.0).groupby(by, observed=True).cumsum()
+    max_dd_r = (cum_r.groupby(by, observed=True).cummax().clip(lower=0) - cum_r).groupby(by, observed=True).max()
+    gains = closed["pnl"].clip(lower=0).groupby(by, observed=True).sum()
+    losses = -closed["pnl"].clip(upper=0).groupby(by, observed=True).sum()
+    return pd.DataFrame({
+        "trades": g.size(),
+        "win_rate": (closed["pnl"] > 0).groupby(by, observed=True).mean(),
+        "avg_R": g["R"].mean(),
+        "total_R": g["R"].sum(min_count=1),
+        "max_dd_R": max_dd_r,
+        "profit_factor": (gains / losses.where(losses > 0)).fillna(np.inf).where(gains > 0, 0.0),
+        "tp1_rate": g["tp1_hit"].mean(),
+        "pnl": g["pnl"].sum(),
+        "max_dd": max_dd,
+        "avg_hold": g["hold"].mean(),
+        "median_hold": g["hold"].median(),
+    })
+
+
+def summarize_by_symbol(trades: pd.DataFrame) -> pd.DataFrame:
+    """Une ligne par symbole + TOTAL (tous symboles, toutes instances). Trades fermés uniquement."""
+    closed = trades[trades["closed"]].sort_values("exit_ts", kind="stable").reset_index(drop=True)
+    sym = closed["symbol"].astype(str)
+    per = _stats(closed, sym)
+    total = _stats(closed, pd.Series("TOTAL", index=closed.index))
+    per = per.reindex(sorted(set(per.index) | set(trades["symbol"].astype(str))))
+    per["trades"] = per["trades"].fillna(0).astype(int)
+    out = pd.concat([per, total])
+    out["open"] = trades.loc[~trades["closed"], "symbol"].astype(str).value_counts()
+    out.loc["TOTAL", "open"] = int((~trades["closed"]).sum())
+    out["open"] = out["open"].fillna(0).astype(int)
+    out.index.name = "symbol"
+    return out
+
+
+def _fmt_td(td) -> str:
+    if pd.isna(td):
+        return "-"
+    mins = int(td.total_seconds() // 60)
+    d, rem = divmod(mins, 1440)
+    return f"{d}j{rem // 60:02d}h" if d else f"{rem // 60}h{rem % 60:02d}m"
+
+
+def main():
+    from rich.console import Console
+    from rich.table import Table
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("paths", nargs="*", default=["trades.csv"], help="trades.csv et/ou dossiers colonnaires")
+    ap.add_argument("--since", default="", help="entrées à partir de YYYY-MM-DD")
+    ap.add_argument("--until", default="", help="entrées avant YYYY-MM-DD")
+    ap.add_argument("--symbols", default="", help="filtre, liste séparée par des virgules")
+    ap.add_argument("--risk_quote", type=float, default=0.0, help="risque par trade si le stop n'est pas journalisé")
+    ap.add_argument("--trades_csv", default="", help="export optionnel des trades reconstruits")
+    args = ap.parse_args()
+
+    console = Console()
+    trades = build_trades(load_journals(args.paths), risk_quote=args.risk_quote)
+    if args.since:
+        trades = trades[trades["entry_ts"] >= pd.Timestamp(args.since, tz="UTC")]
+    if args.until:
+        trades = trades[trades["entry_ts"] < pd.Timestamp(args.until, tz="UTC")]
+    if args.symbols:
+        trades = trades[trades["symbol"].astype(str).isin([s.strip() for s in args.symbols.split(",") if s.strip()])]
+    if trades.empty:
+        console.print("[yellow]Aucun trade dans la sélection.[/yellow]")
+        return
+    stats = summarize_by_symbol(trades)
+
+    table = Table(title=f"Journal — {len(args.paths)} fichier(s), {len(trades)} trade(s)")
+    for col in ("Symbole", "Trades", "Ouverts", "Win %", "Espérance R", "Total R", "Max DD R",
+                "PF", "TP1 %", "PnL", "Max DD", "Durée moy.", "Durée méd."):
+        table.add_column(col, justify="left" if col == "Symbole" else "right")
+
+    def f(v, fmt):
+        return "-" if pd.isna(v) else format(v, fmt)
+
+    for sym, r in stats.iterrows():
+        table.add_row(f"[bold]{sym}[/bold]" if sym == "TOTAL" else sym, str(int(r["trades"]) if not pd.isna(r["trades"]) else 0),
+                      str(r["open"]), f(r["win_rate"] * 100, ".1f"), f(r["avg_R"], "+.2f"), f(r["total_R"], "+.2f"),
+                      f(r["max_dd_R"], ".2f"), f(r["profit_factor"], ".2f"), f(r["tp1_rate"] * 100, ".1f"),
+                      f(r["pnl"], "+.2f"), f(r["max_dd"], ".2f"), _fmt_td(r["avg_hold"]), _fmt_td(r["median_hold"]))
+    console.print(table)
+    missing_r = int((trades["closed"] & trades["R"].isna()).sum())
+    if missing_r:
+        console.print(f"[dim]{missing_r} trade(s) sans stop journalisé : R non calculé (voir --risk_quote).[/dim]")
+    if args.trades_csv:
+        trades.to_csv(args.trades_csv, index=False)
+        console.print(f"[green]Trades exportés: {args.trades_csv}[/green]")
+
+
+if __name__ == "__main__":
+    main()
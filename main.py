@@ -11,7 +11,6 @@ import os
 import time
 import math
 import json
-import csv
 import signal
 import shutil
 import sys
@@ -30,11 +29,21 @@ from rich.table import Table
 from rich import box
 
 # === AJOUTS: logging & asyncio helpers ===
-import logging
 import asyncio
 import inspect
+import queue
 from concurrent.futures import TimeoutError as FuturesTimeout
 
+from candle_db import CandleDB
+from candle_store import CandleStore
+from eventlog import setup_event_logger, stop_event_logger
+from journal import TradeJournal
+from metrics import InstrumentedExchange, LatencyRegistry, prometheus_text, start_metrics_server
+from orderbook import OrderBookCache
+from indicators import IndicatorBook
+from portfolio import Portfolio
+from ratelimit import RateBudget
+
 # WS (optionnel, gratuit via API Binance)
 try:
     from ws_binance import BinanceWS, StreamConfig
@@ -53,21 +62,6 @@ def today_utc_date() -> dt.date:
     return now_utc().date()
 
 
-def _setup_file_logger(name: str = "bot", log_dir: str = "logs") -> logging.Logger:
-    """Crée un logger fichier avec timestamps."""
-    os.makedirs(log_dir, exist_ok=True)
-    logger = logging.getLogger(name)
-    if logger.handlers:
-        return logger
-    logger.setLevel(logging.INFO)
-    fname = os.path.join(log_dir, f"bot-events-{now_utc().strftime('%Y%m%d')}.log")
-    fh = logging.FileHandler(fname, encoding="utf-8")
-    fmt = logging.Formatter(fmt="%(asctime)s %(levelname)s %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
-    fh.setFormatter(fmt)
-    logger.addHandler(fh)
-    return logger
-
-
 @dataclass
 class Config:
     exchange: str = "binance"
@@ -76,20 +70,39 @@ class Config:
     symbols: List[str] = field(default_factory=lambda: ["BTC/USDT"])
     timeframe: str = "1h"
     risk_per_trade_pct: float = 1.0
+    max_positions: int = 5               # positions simultanées (une par symbole)
+    max_symbol_risk_pct: float = 2.0     # risque max d'une position (% equity)
+    max_total_risk_pct: float = 5.0      # risque ouvert cumulé max (% equity)
     breakout_lookback: int = 20
     stop_lookback: int = 10
     use_atr_stop: bool = False
     atr_mult: float = 2.0
     max_spread_pct: float = 0.5
+    use_depth_stream: bool = False  # carnet diff-depth WS (@depth@100ms) en plus du bookTicker
+    book_max_age_sec: float = 30.0  # au-delà, bid/ask WS jugés périmés => fetch_order_book
     take_profit_R: float = 1.0
     tp_fraction: float = 0.5
     trailing_use_atr: bool = True
     kill_switch_daily_dd_pct: float = -3.0
     poll_seconds: int = 60
+    scan_concurrency: int = 8            # fetchs OHLCV parallèles pendant le scan (1 = séquentiel)
+    rest_rate_per_sec: float = 10.0      # budget REST global partagé par les workers (0 = illimité)
     journal_csv: str = "trades.csv"
+    journal_flush_sec: float = 5.0      # lignes bufferisées au plus ce délai (et flush à l'arrêt)
+    journal_flush_rows: int = 64        # ... ou dès ce nombre de lignes en attente
+    journal_columnar_dir: str = ""      # puits binaire colonnaire optionnel (analytics rapides)
+    candle_db_dir: str = "data/candles"  # base locale des bougies closes ("" = désactivée)
     fiat: str = "USDT"
     use_websocket: bool = True
     ws_reconnect_sec: float = 3.0
+    ws_streams_per_connection: int = 200  # streams par connexion WS (shards au-delà)
+    metrics_port: int = 0  # >0 => serveur HTTP de métriques (/health, /latency, /metrics Prometheus)
+    metrics_host: str = "127.0.0.1"
+    log_dir: str = "logs"                # logs/bot-events-YYYYMMDD.log (rotation quotidienne UTC)
+    log_async: bool = True               # écriture disque dans un thread dédié (file QueueHandler)
+    log_json: bool = False               # lignes JSON au lieu du texte horodaté
+    ws_queue_max: int = 10000  # file WS -> callbacks (les tickers sont coalescés, les clôtures jamais jetées)
+    event_driven: bool = False     # signal à la clôture WS + stop/TP sur bookTicker (requiert le WS)
     sound_alerts: bool = True
     dashboard_clear: bool = True   # AJOUT: permet de ne pas effacer le terminal si False
 
@@ -125,40 +138,55 @@ class Position:
     side: str = "long"
     opened_at: dt.datetime = field(default_factory=now_utc)
     realized_pnl: float = 0.0
+    tp1_done: bool = False
     closed: bool = False
     closed_at: Optional[dt.datetime] = None
 
 
 class StopLossBot:
-    def __init__(self, cfg: Config):
+    def __init__(self, cfg: Config, config_path: str = "config.yaml"):
         self.cfg = cfg
-        self._levels = {}  # {symbol: {"hh": float, "ll": float, "asof": pd.Timestamp}}
-        self.exchange = self._init_exchange(cfg)
+        self.config_path = config_path
+        self._reload_requested = False
+        self.latency = LatencyRegistry()
+        # Proxy: chaque appel REST est compté/chronométré (rest_<méthode>) pour /metrics
+        self.exchange = InstrumentedExchange(self._init_exchange(cfg), self.latency)
         self.markets = self.exchange.load_markets()
-        # Préflight des symbols (et correction USUT -> USDT si besoin)
-        for s in list(self.cfg.symbols):
-            if s not in self.markets:
-                fixed = s.replace("USUT", "USDT")
-                if fixed in self.markets:
-                    console.print(f"[yellow]Symbole '{s}' introuvable. Correction automatique -> '{fixed}'.[/yellow]")
-                    self.cfg.symbols[self.cfg.symbols.index(s)] = fixed
-                else:
-                    examples = [m for m in self.markets.keys() if m.endswith(f"/{self.cfg.fiat}")][:10]
-                    raise ValueError(f"Symbole '{s}' indisponible sur {self.exchange.id}. Exemples valides: {examples}")
-        self.position: Optional[Position] = None
+        self.cfg.symbols = self._preflight_symbols(self.cfg.symbols)
+        self.portfolio = Portfolio(max_positions=cfg.max_positions,
+                                   max_total_risk_pct=cfg.max_total_risk_pct,
+                                   max_symbol_risk_pct=cfg.max_symbol_risk_pct)
         self.equity: float = 10_000.0
         self.daily_start_equity: float = self.equity
         self.daily_date: dt.date = today_utc_date()
         self.journal_path = cfg.journal_csv
-        self._init_journal()
+        self.journal = TradeJournal(self.journal_path, flush_sec=cfg.journal_flush_sec,
+                                    flush_rows=cfg.journal_flush_rows, columnar_dir=cfg.journal_columnar_dir)
+
+        # Cache OHLCV incrémental (amorçage REST unique, puis bougies closes seulement)
+        # + HH/LL glissants O(1) mis à jour à chaque bougie close
+        self.indicators = IndicatorBook(high_lookbacks=[self.cfg.breakout_lookback],
+                                        low_lookbacks=[self.cfg.stop_lookback], atr_period=14)
+        self.rest_budget = RateBudget(self.cfg.rest_rate_per_sec)
+        self.candles = CandleStore(self.exchange, self.cfg.timeframe, maxlen=200, listener=self.indicators,
+                                   max_workers=self.cfg.scan_concurrency, budget=self.rest_budget,
+                                   db=CandleDB(self.cfg.candle_db_dir) if self.cfg.candle_db_dir else None)
 
         # Logger fichiers
-        self.log = _setup_file_logger()
+        self.log = setup_event_logger("bot", self.cfg.log_dir, async_mode=self.cfg.log_async,
+                                      json_lines=self.cfg.log_json)
 
         # WS helpers
         self._ws = None
         self._last_ticker: Dict[str, float] = {}
+        self.book = OrderBookCache(snapshot_fn=self._depth_snapshot)
+        self._kline_event_time: Dict[str, int] = {}
+        self._metrics_srv = None
         self._last_closed_ts: Dict[str, int] = {}
+        self._last_checked_candle: Dict[str, Any] = {}
+        # Mode événementiel: callbacks WS (thread WS) -> file consommée par le thread principal
+        self._events: "queue.Queue" = queue.Queue()
+        self._pending_ticks: set = set()
 
         console.print(f"[cyan]Exchange:[/cyan] {self.exchange.id} | [cyan]Dry run:[/cyan] {self.cfg.dry_run}")
         self.log.info("BOOT exchange=%s dry_run=%s symbols=%s timeframe=%s",
@@ -166,15 +194,24 @@ class StopLossBot:
 
         # WebSocket: démarrage si activé et exchange=binance
         if self.cfg.use_websocket and self.exchange.id == "binance" and BinanceWS and StreamConfig:
-            def on_kline_closed(sym, payload):
-                k = payload["k"]
-                self._last_closed_ts[sym] = int(k["T"])  # close time ms
-
-            def on_ticker(sym, payload):
-                try:
-                    self._last_ticker[sym] = float(payload.get("c") or payload.get("C") or 0.0)
-                except Exception:
-                    pass
+            # Callbacks: symbole tel que configuré (BTC/USDT) + message typé (ws_binance)
+            def on_kline_closed(sym, k):
+                self._last_closed_ts[sym] = k.close_time
+                self._kline_event_time[sym] = k.event_time  # 0 = bougie rejouée (backfill)
+                self.candles.add_closed(sym, k.open_time, k.open, k.high, k.low, k.close, k.volume)
+                if self.cfg.event_driven:
+                    self._events.put(("kline", sym))
+
+            def on_ticker(sym, t):
+                self.book.update_top(sym, t.bid, t.bid_qty, t.ask, t.ask_qty)
+                self._last_ticker[sym] = (t.bid + t.ask) / 2.0  # bookTicker: mid bid/ask
+                if self.cfg.event_driven and sym in self.portfolio and sym not in self._pending_ticks:
+                    # Coalescence: un seul tick en attente par symbole, le prix lu est le dernier
+                    self._pending_ticks.add(sym)
+                    self._events.put(("tick", sym))
+
+            def on_depth(sym, diff):
+                self.book.apply_diff(sym, diff)
 
             sc = StreamConfig(
                 symbols=self.cfg.symbols,
@@ -182,6 +219,11 @@ class StopLossBot:
                 on_kline_closed=on_kline_closed,
                 on_ticker=on_ticker,
                 reconnect_delay=self.cfg.ws_reconnect_sec,
+                streams_per_connection=self.cfg.ws_streams_per_connection,
+                queue_max=self.cfg.ws_queue_max,
+                backfill=self._ws_backfill,
+                latency=self.latency,
+                on_depth=on_depth if self.cfg.use_depth_stream else None,
             )
             try:
                 try:
@@ -197,20 +239,71 @@ class StopLossBot:
                 console.print(f"[yellow]WebSocket non démarré: {e}. Fallback polling.[/yellow]")
                 self.log.warning("WS not started: %s", e)
 
-    def _compute_levels_from_df(self, df: pd.DataFrame) -> dict:
-        """Calcule HH/LL sur la base du DF passé (pas d'appel réseau ici)."""
-        Lh = self.cfg.breakout_lookback
-        Ll = self.cfg.stop_lookback
-        if len(df) < max(Lh, Ll) + 2:
-            return {}
-        hh = float(df["high"].iloc[-(Lh + 1):-1].max())
-        ll = float(df["low"].iloc[-(Ll + 1):-1].min())
-        return {"hh": hh, "ll": ll, "asof": df["ts"].iloc[-1]}
+        if self.cfg.metrics_port:
+            try:
+                self._metrics_srv, _ = start_metrics_server(self.cfg.metrics_host, self.cfg.metrics_port, self._metrics_routes())
+                console.print(f"[green]Métriques HTTP: http://{self.cfg.metrics_host}:{self.cfg.metrics_port}/metrics (+ /latency)[/green]")
+                self.log.info("METRICS_SERVER port=%s", self.cfg.metrics_port)
+            except Exception as e:
+                console.print(f"[yellow]Serveur de métriques non démarré: {e}[/yellow]")
+                self.log.warning("METRICS_SERVER not started: %s", e)
+
+    def _metrics_routes(self) -> Dict[str, Any]:
+        return {
+            "/health": lambda: ("text/plain", "ok"),
+            "/latency": lambda: ("application/json", self.latency.to_json()),
+            "/metrics": lambda: ("text/plain; version=0.0.4; charset=utf-8", self._prometheus()),
+        }
 
-    def _cache_levels(self, symbol: str, df: pd.DataFrame) -> None:
-        lv = self._compute_levels_from_df(df)
-        if lv:
-            self._levels[symbol] = lv
+    def _prometheus(self) -> str:
+        """Lu au scrape (thread HTTP) depuis l'état courant : aucun travail sur le chemin de trading."""
+        g, c = "gauge", "counter"
+        samples = [
+            ("equity", g, "Equity (quote)", {}, self.equity),
+            ("daily_pnl_pct", g, "PnL journalier (%)", {}, self._daily_pnl_pct()),
+            ("kill_switch", g, "1 si le kill switch est actif", {}, float(self._kill_switch_tripped())),
+            ("positions_open", g, "Positions ouvertes", {}, len(self.portfolio)),
+            ("open_risk_quote", g, "Risque ouvert total (quote)", {}, self.portfolio.total_risk()),
+        ]
+        for pos in self.portfolio:
+            lbl = {"symbol": pos.symbol}
+            samples.append(("position_qty", g, "Quantité restante par position", lbl, pos.remaining_qty))
+            samples.append(("position_entry_price", g, "Prix d'entrée par position", lbl, pos.entry_price))
+            samples.append(("position_stop_price", g, "Stop courant par position", lbl, pos.stop_price))
+        samples.append(("rest_budget_waits_total", c, "Attentes imposées par le budget REST", {}, self.rest_budget.waits))
+        samples.append(("rest_budget_waited_seconds_total", c, "Temps cumulé d'attente du budget REST", {},
+                        self.rest_budget.waited_sec))
+        for method, n in sorted(self.exchange.errors.items()):
+            samples.append(("rest_errors_total", c, "Erreurs REST par méthode", {"method": method}, n))
+        if self._ws is not None:
+            st = self._ws.stats()
+            samples += [
+                ("ws_messages_total", c, "Trames WS reçues", {}, st["messages"]),
+                ("ws_connections", g, "Connexions WS ouvertes", {}, st["connected"]),
+                ("ws_shards", g, "Connexions WS prévues (shards)", {}, st["shards"]),
+                ("ws_reconnects_total", c, "Reconnexions WS", {}, st["reconnects"]),
+                ("ws_queue_depth", g, "Événements WS en attente de callback", {}, st["queue_depth"]),
+                ("ws_coalesced_total", c, "Ticks WS coalescés (écrasés avant lecture)", {}, st["coalesced"]),
+                ("ws_dropped_total", c, "Événements WS jetés (file pleine)", {}, st["dropped"]),
+                ("ws_backfilled_total", c, "Clôtures rejouées après reconnexion", {}, st["backfilled"]),
+            ]
+        return prometheus_text(samples, self.latency)
+
+    def _symbol_levels(self, symbol: str):
+        """État HH/LL glissant du symbole (amorce le cache si besoin, sans refetch ensuite)."""
+        lv = self.indicators.get(symbol)
+        if lv is None:
+            self.candles.refresh(symbol)
+            lv = self.indicators.get(symbol)
+        return lv
+
+    def _compute_levels(self, symbol: str) -> dict:
+        """HH/LL à casser par la prochaine clôture (pas d'appel réseau ici)."""
+        lv = self.indicators.get(symbol)
+        if lv is None or lv.count < max(self.cfg.breakout_lookback, self.cfg.stop_lookback) + 1:
+            return {}
+        return {"hh": lv.hh(self.cfg.breakout_lookback), "ll": lv.ll(self.cfg.stop_lookback),
+                "asof": pd.Timestamp(lv.ts, unit="ms", tz="UTC")}
 
     # ---------------- Sound Alerts ----------------
     def _ding(self, kind: str = "info"):
@@ -265,28 +358,14 @@ class StopLossBot:
             raise ValueError(f"Exchange non supporté: {ex_id}")
         return exchange
 
-    def _init_journal(self):
-        os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
-        if not os.path.exists(self.journal_path):
-            with open(self.journal_path, "w", newline="", encoding="utf-8") as f:
-                w = csv.writer(f)
-                w.writerow(["ts", "symbol", "action", "price", "qty", "realized_pnl", "equity", "note"])
-
-    def _log_trade(self, action: str, symbol: str, price: float, qty: float, pnl: float, note: str = ""):
-        with open(self.journal_path, "a", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow([now_utc().isoformat(), symbol, action, f"{price:.8f}", f"{qty:.8f}", f"{pnl:.2f}", f"{self.equity:.2f}", note])
+    def _log_trade(self, action: str, symbol: str, price: float, qty: float, pnl: float, note: str = "",
+                   stop: float = float("nan")):
+        self.journal.write(now_utc(), symbol, action, price, qty, pnl, self.equity, note, stop=stop)
         # AJOUT: log lisible avec timestamp
-        self.log.info("TRADE action=%s symbol=%s price=%.4f qty=%.8f pnl=%.2f equity=%.2f note=%s",
-                      action, symbol, price, qty, pnl, self.equity, note)
+        self.log.info("TRADE action=%s symbol=%s price=%.4f qty=%.8f pnl=%.2f equity=%.2f stop=%.8f note=%s",
+                      action, symbol, price, qty, pnl, self.equity, stop, note)
 
     # ---------------- Market helpers ----------------
-    def _fetch_ohlcv_df(self, symbol: str, limit: int = 200) -> pd.DataFrame:
-        ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe=self.cfg.timeframe, limit=limit)
-        df = pd.DataFrame(ohlcv, columns=["ts", "open", "high", "low", "close", "volume"])
-        df["ts"] = pd.to_datetime(df["ts"], unit="ms", utc=True)
-        return df
-
     def _atr(self, df: pd.DataFrame, n: int = 14) -> pd.Series:
         prev_close = df["close"].shift(1)
         tr = pd.concat([
@@ -296,7 +375,26 @@ class StopLossBot:
         ], axis=1).max(axis=1)
         return tr.ewm(alpha=1.0 / n, adjust=False).mean()
 
+    def _ws_backfill(self, symbol: str, since_ms: int) -> list:
+        """Clôtures manquées pendant une coupure WS (appelé hors boucle WS, budget REST partagé)."""
+        tf = self.candles.tf_ms
+        self.rest_budget.acquire()
+        rows = self.exchange.fetch_ohlcv(symbol, timeframe=self.cfg.timeframe, since=since_ms + tf, limit=1000)
+        cutoff = self.exchange.milliseconds()
+        rows = [r for r in rows if since_ms < int(r[0]) and int(r[0]) + tf <= cutoff]
+        self.log.info("WS_BACKFILL symbol=%s since=%s candles=%d", symbol, since_ms, len(rows))
+        return rows
+
+    def _depth_snapshot(self, symbol: str) -> dict:
+        """Snapshot REST pour synchroniser le carnet diff-depth (appelé hors thread WS)."""
+        self.rest_budget.acquire()
+        return self.exchange.fetch_order_book(symbol, limit=1000)
+
     def _orderbook_spread_pct(self, symbol: str) -> float:
+        # Carnet local (WS) d'abord : aucune latence réseau
+        spread = self.book.spread_pct(symbol, max_age=self.cfg.book_max_age_sec)
+        if spread is not None:
+            return spread
         ob = self.exchange.fetch_order_book(symbol, limit=5)
         best_bid = ob["bids"][0][0] if ob["bids"] else None
         best_ask = ob["asks"][0][0] if ob["asks"] else None
@@ -333,22 +431,38 @@ class StopLossBot:
 
     # ---------------- Signal ----------------
     def _compute_signal(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """Signal sur la dernière ligne de `df` (slices pandas — chemin de référence)."""
         if len(df) < max(self.cfg.breakout_lookback, self.cfg.stop_lookback) + 5:
             return {"entry_ok": False}
         close = df["close"].iloc[-1]
         high_n = df["high"].iloc[-(self.cfg.breakout_lookback + 1):-1].max()
+        low_n = df["low"].iloc[-(self.cfg.stop_lookback + 1):-1].min()
+        atr = self._atr(df, 14).iloc[-1] if self.cfg.use_atr_stop else None
+        return self._signal_from_levels(close, high_n, low_n, atr)
+
+    def _compute_signal_for(self, symbol: str) -> Dict[str, Any]:
+        """Même signal que `_compute_signal` sur la dernière bougie close, via l'état glissant O(1)."""
+        lv = self.indicators.get(symbol)
+        if lv is None or lv.count < max(self.cfg.breakout_lookback, self.cfg.stop_lookback) + 5:
+            return {"entry_ok": False}
+        atr = lv.atr.value if self.cfg.use_atr_stop else None
+        return self._signal_from_levels(lv.close, lv.prev_hh(self.cfg.breakout_lookback),
+                                        lv.prev_ll(self.cfg.stop_lookback), atr)
+
+    def _signal_from_levels(self, close: float, high_n: float, low_n: float, atr: Optional[float]) -> Dict[str, Any]:
         entry_ok = close > high_n
         if self.cfg.use_atr_stop:
-            atr = self._atr(df, 14).iloc[-1]
             stop = close - self.cfg.atr_mult * atr
         else:
-            stop = df["low"].iloc[-(self.cfg.stop_lookback + 1):-1].min()
+            stop = low_n
         r_value = close - stop
         tp1 = close + self.cfg.take_profit_R * r_value
         return {"entry_ok": bool(entry_ok), "entry_price": float(close), "stop_price": float(stop), "r_value": float(r_value), "tp1_price": float(tp1)}
 
     # ---------------- Execution ----------------
     def _enter_position(self, symbol: str, entry: float, stop: float, tp1: float) -> Optional[Position]:
+        if symbol in self.portfolio or self.portfolio.is_full():
+            return None
         spread_pct = self._orderbook_spread_pct(symbol)
         if spread_pct > self.cfg.max_spread_pct:
             console.print(f"[yellow]Spread {spread_pct:.2f}% > max {self.cfg.max_spread_pct:.2f}% : pas d'entrée.[/yellow]")
@@ -368,19 +482,24 @@ class StopLossBot:
                 console.print(f"[yellow]Notional {notional:.2f} < min_cost {min_cost:.2f}. Ajuste le risque ou choisis un autre symbole.[/yellow]")
                 self.log.info("ENTRY_BLOCKED min_cost notional=%.2f min_cost=%.2f", notional, min_cost)
                 return None
+        blocked = self.portfolio.block_reason(symbol, qty * (entry - stop), self.equity)
+        if blocked:
+            console.print(f"[yellow]Plafond de risque ({blocked}) : pas d'entrée sur {symbol}.[/yellow]")
+            self.log.info("ENTRY_BLOCKED portfolio=%s symbol=%s", blocked, symbol)
+            return None
         pos = Position(symbol=symbol, entry_price=entry, qty=qty, stop_price=stop, r_value=entry - stop, tp1_price=tp1, tp_fraction=self.cfg.tp_fraction, remaining_qty=qty)
         if self.cfg.dry_run:
-            self.position = pos
-            self._log_trade("ENTER_SIM", symbol, entry, qty, 0.0, note="breakout entry")
+            self.portfolio.add(pos)
+            self._log_trade("ENTER_SIM", symbol, entry, qty, 0.0, note="breakout entry", stop=stop)
             console.print(f"[green]DRY RUN:[/green] Entrée {symbol} qty={qty} @ {entry:.2f} | stop={stop:.2f} | tp1={tp1:.2f}")
             self._ding("enter")
             return pos
         try:
-            order = self.exchange.create_order(symbol, "market", "buy", qty, None, {})
+            order = self._market_order(symbol, "buy", qty)
             fill_price = order["average"] or entry
             pos.entry_price = float(fill_price)
-            self.position = pos
-            self._log_trade("ENTER_LIVE", symbol, pos.entry_price, qty, 0.0, note="live entry")
+            self.portfolio.add(pos)
+            self._log_trade("ENTER_LIVE", symbol, pos.entry_price, qty, 0.0, note="live entry", stop=stop)
             console.print(f"[green]LIVE:[/green] Entrée {symbol} qty={qty} @ {pos.entry_price:.2f} | stop={stop:.2f} | tp1={tp1:.2f}")
             self._ding("enter")
             return pos
@@ -389,48 +508,47 @@ class StopLossBot:
             self.log.error("ENTER_ERROR %s", e)
             return None
 
-    def _exit_market(self, reason: str, price: float):
-        if not self.position:
-            return
-        pos = self.position
-        qty = pos.remaining_qty
-        if qty <= 0:
-            return
-        if self.cfg.dry_run:
-            if reason and "STOP" in reason:
-                self._ding("stop")
-            else:
-                self._ding("info")
-            pnl = (price - pos.entry_price) * qty
-            self.equity += pnl
-            pos.realized_pnl += pnl
-            pos.remaining_qty = 0.0
-            pos.closed = True
-            pos.closed_at = now_utc()
-            self._log_trade(f"EXIT_SIM_{reason}", pos.symbol, price, qty, pnl, note=reason)
-            console.print(f"[cyan]DRY RUN:[/cyan] Sortie {reason} qty={qty} @ {price:.2f} | PnL={pnl:.2f} | Equity={self.equity:.2f}")
-            self.position = None
-            return
-        try:
-            order = self.exchange.create_order(pos.symbol, "market", "sell", qty, None, {})
-            fill_price = order["average"] or price
-            pnl = (fill_price - pos.entry_price) * qty
-            self.equity += pnl
-            pos.realized_pnl += pnl
-            pos.remaining_qty = 0.0
-            pos.closed = True
-            pos.closed_at = now_utc()
-            self._log_trade(f"EXIT_LIVE_{reason}", pos.symbol, float(fill_price), qty, pnl, note=reason)
-            console.print(f"[cyan]LIVE:[/cyan] Sortie {reason} qty={qty} @ {fill_price:.2f} | PnL={pnl:.2f} | Equity={self.equity:.2f}")
-            self.position = None
-        except Exception as e:
-            console.print(f"[red]Erreur de sortie live: {e}[/red]")
-            self.log.error("EXIT_ERROR %s", e)
+    def _market_order(self, symbol: str, side: str, qty: float) -> dict:
+        with self.latency.timer("create_order", symbol):
+            return self.exchange.create_order(symbol, "market", side, qty, None, {})
+
+    def _exit_market(self, pos: Position, reason: str, price: float):
+        with self.latency.timer("exit_market", pos.symbol):
+            qty = pos.remaining_qty
+            if qty <= 0:
+                return
+            if self.cfg.dry_run:
+                if reason and "STOP" in reason:
+                    self._ding("stop")
+                else:
+                    self._ding("info")
+                pnl = (price - pos.entry_price) * qty
+                self.equity += pnl
+                pos.realized_pnl += pnl
+                pos.remaining_qty = 0.0
+                pos.closed = True
+                pos.closed_at = now_utc()
+                self._log_trade(f"EXIT_SIM_{reason}", pos.symbol, price, qty, pnl, note=reason)
+                console.print(f"[cyan]DRY RUN:[/cyan] Sortie {pos.symbol} {reason} qty={qty} @ {price:.2f} | PnL={pnl:.2f} | Equity={self.equity:.2f}")
+                self.portfolio.remove(pos.symbol)
+                return
+            try:
+                order = self._market_order(pos.symbol, "sell", qty)
+                fill_price = order["average"] or price
+                pnl = (fill_price - pos.entry_price) * qty
+                self.equity += pnl
+                pos.realized_pnl += pnl
+                pos.remaining_qty = 0.0
+                pos.closed = True
+                pos.closed_at = now_utc()
+                self._log_trade(f"EXIT_LIVE_{reason}", pos.symbol, float(fill_price), qty, pnl, note=reason)
+                console.print(f"[cyan]LIVE:[/cyan] Sortie {pos.symbol} {reason} qty={qty} @ {fill_price:.2f} | PnL={pnl:.2f} | Equity={self.equity:.2f}")
+                self.portfolio.remove(pos.symbol)
+            except Exception as e:
+                console.print(f"[red]Erreur de sortie live: {e}[/red]")
+                self.log.error("EXIT_ERROR %s", e)
 
-    def _partial_take_profit(self, price: float):
-        if not self.position:
-            return
-        pos = self.position
+    def _partial_take_profit(self, pos: Position, price: float):
         qty_tp = pos.remaining_qty * pos.tp_fraction
         qty_tp = max(0.0, min(qty_tp, pos.remaining_qty))
         if qty_tp <= 0:
@@ -441,20 +559,22 @@ class StopLossBot:
             self.equity += pnl
             pos.realized_pnl += pnl
             pos.remaining_qty -= qty_tp
+            pos.tp1_done = True
             pos.stop_price = max(pos.stop_price, pos.entry_price)
             self._log_trade("TP1_SIM", pos.symbol, price, qty_tp, pnl, note="take partial & move stop to BE")
-            console.print(f"[magenta]DRY RUN:[/magenta] TP partiel qty={qty_tp} @ {price:.2f} | Stop => {pos.stop_price:.2f}")
+            console.print(f"[magenta]DRY RUN:[/magenta] TP partiel {pos.symbol} qty={qty_tp} @ {price:.2f} | Stop => {pos.stop_price:.2f}")
             return
         try:
-            order = self.exchange.create_order(pos.symbol, "market", "sell", qty_tp, None, {})
+            order = self._market_order(pos.symbol, "sell", qty_tp)
             fill_price = order["average"] or price
             pnl = (fill_price - pos.entry_price) * qty_tp
             self.equity += pnl
             pos.realized_pnl += pnl
             pos.remaining_qty -= qty_tp
+            pos.tp1_done = True
             pos.stop_price = max(pos.stop_price, pos.entry_price)
             self._log_trade("TP1_LIVE", pos.symbol, float(fill_price), qty_tp, pnl, note="take partial & move stop to BE")
-            console.print(f"[magenta]LIVE:[/magenta] TP partiel qty={qty_tp} @ {fill_price:.2f} | Stop => {pos.stop_price:.2f}")
+            console.print(f"[magenta]LIVE:[/magenta] TP partiel {pos.symbol} qty={qty_tp} @ {fill_price:.2f} | Stop => {pos.stop_price:.2f}")
         except Exception as e:
             console.print(f"[red]Erreur TP1 live: {e}[/red]")
             self.log.error("TP1_ERROR %s", e)
@@ -472,74 +592,226 @@ class StopLossBot:
     def _kill_switch_tripped(self) -> bool:
         return self._daily_pnl_pct() <= self.cfg.kill_switch_daily_dd_pct
 
+    # ---------------- Position / scan steps ----------------
+    def _trailing_inputs(self, symbol: str, forming: bool) -> Optional[tuple]:
+        """(high, ATR) de la dernière bougie — en formation si connue et demandée — depuis l'état ATR O(1)."""
+        lv = self.indicators.get(symbol)
+        if lv is None or lv.count == 0:
+            return None
+        row = self.candles.forming(symbol) if forming else None
+        if row is not None:
+            return row[2], lv.atr.peek(row[2], row[3])
+        return lv.high, lv.atr.value
+
+    def _manage_position(self, pos: Position, last_price: float, trail: Optional[tuple] = None):
+        """TP partiel, trailing ATR (si `trail`=(high, atr) fourni) puis stop — commun au polling et aux événements."""
+        if pos.remaining_qty > 0 and not pos.tp1_done and last_price >= pos.tp1_price and pos.tp_fraction > 0:
+            self._partial_take_profit(pos, last_price)
+        if trail is not None and self.cfg.trailing_use_atr:
+            high, atr = trail
+            level = high - self.cfg.atr_mult * atr
+            if level > pos.stop_price:
+                pos.stop_price = level
+        if last_price <= pos.stop_price:
+            self._exit_market(pos, "STOP", last_price)
+
+    def _scan_symbol(self, symbol: str) -> bool:
+        """Évalue le signal sur la dernière bougie close (une seule fois par bougie). True si entrée."""
+        if symbol in self.portfolio:
+            return False
+        lv = self.indicators.get(symbol)
+        if lv is None or lv.ts is None:
+            return False
+        prev = self._last_checked_candle.get(symbol)
+        if prev is not None and lv.ts <= prev:
+            return False
+        self._last_checked_candle[symbol] = lv.ts
+        with self.latency.timer("compute_signal", symbol):
+            sig = self._compute_signal_for(symbol)
+        if sig.get("entry_ok"):
+            with self.latency.timer("enter_position", symbol):
+                pos = self._enter_position(symbol, sig["entry_price"], sig["stop_price"], sig["tp1_price"])
+            return pos is not None
+        return False
+
+    def _status_tick(self):
+        self._render_status()
+        self.journal.maybe_flush()
+        # Log périodique d'état (lisible) :
+        try:
+            self.log.info("STATUS ex=%s dry=%s eq=%.2f daily=%.2f%% pos=%s",
+                          self.exchange.id, self.cfg.dry_run, self.equity, self._daily_pnl_pct(),
+                          (",".join(self.portfolio.symbols()) or "None"))
+            for line in self.latency.log_lines():
+                self.log.info(line)
+        except Exception:
+            pass
+
+    def _warn_kill_switch(self):
+        self._ding("kill")
+        console.print(f"[red]Kill switch: PnL journalier {self._daily_pnl_pct():.2f}% <= {self.cfg.kill_switch_daily_dd_pct:.2f}% — pause jusqu'au lendemain.[/red]")
+        self.log.warning("KILL_SWITCH daily_pnl=%.2f%% threshold=%.2f%%", self._daily_pnl_pct(), self.cfg.kill_switch_daily_dd_pct)
+
+    def _preflight_symbols(self, symbols: List[str]) -> List[str]:
+        """Symboles validés contre les marchés chargés (et correction USUT -> USDT si besoin)."""
+        out = []
+        for s in symbols:
+            if s not in self.markets:
+                fixed = s.replace("USUT", "USDT")
+                if fixed not in self.markets:
+                    examples = [m for m in self.markets.keys() if m.endswith(f"/{self.cfg.fiat}")][:10]
+                    raise ValueError(f"Symbole '{s}' indisponible sur {self.exchange.id}. Exemples valides: {examples}")
+                console.print(f"[yellow]Symbole '{s}' introuvable. Correction automatique -> '{fixed}'.[/yellow]")
+                s = fixed
+            out.append(s)
+        return out
+
+    def set_symbols(self, symbols: List[str]) -> None:
+        """
+        Change l'univers à chaud : symboles validés comme au démarrage (ValueError => univers
+        inchangé), historique des nouveaux chargé, puis SUBSCRIBE/UNSUBSCRIBE ciblés côté WS,
+        sans tout reconnecter. Les symboles retirés mais encore en position restent abonnés.
+        """
+        symbols = self._preflight_symbols(list(symbols))
+        added = [s for s in symbols if s not in self.cfg.symbols]
+        for s, err in self.candles.refresh_many(added):
+            if err is not None:
+                self.log.warning("BOOTSTRAP_ERROR symbol=%s err=%s", s, err)
+        self.cfg.symbols = symbols
+        if self._ws is not None:
+            held = [s for s in self.portfolio.symbols() if s not in symbols]
+            self._ws.update_symbols(symbols + held)
+        self.log.info("SYMBOLS_UPDATED symbols=%s added=%s", self.cfg.symbols, added)
+
+    def request_reload(self) -> None:
+        """Handler SIGHUP : pose seulement un drapeau, la boucle principale relit la config."""
+        self._reload_requested = True
+
+    def _apply_reload(self) -> None:
+        """Relit `symbols` dans config_path et l'applique (set_symbols) ; config invalide => ignorée."""
+        if not self._reload_requested:
+            return
+        self._reload_requested = False
+        try:
+            symbols = Config.from_yaml(self.config_path).symbols
+            if symbols != self.cfg.symbols:
+                self.set_symbols(symbols)
+        except Exception as e:
+            console.print(f"[red]Rechargement de {self.config_path} refusé: {e}[/red]")
+            self.log.warning("RELOAD_ERROR err=%s", e)
+
     # ---------------- Main loop ----------------
     def run(self):
         console.rule("[bold green]Stop-Loss Bot — Démarrage")
-        last_checked_candle = {s: None for s in self.cfg.symbols}
+        if self.cfg.event_driven:
+            if self._ws is not None:
+                return self._run_events()
+            console.print("[yellow]event_driven demandé sans WebSocket actif — fallback polling.[/yellow]")
+            self.log.warning("EVENT_MODE unavailable (no WS), polling")
         try:
             while True:  # loop; SIGTERM/KeyboardInterrupt will break
+                t_cycle = time.perf_counter()
                 self._reset_daily_if_needed()
                 if self._kill_switch_tripped():
-                    self._ding("kill")
-                    console.print(f"[red]Kill switch: PnL journalier {self._daily_pnl_pct():.2f}% <= {self.cfg.kill_switch_daily_dd_pct:.2f}% — pause jusqu'au lendemain.[/red]")
-                    self.log.warning("KILL_SWITCH daily_pnl=%.2f%% threshold=%.2f%%", self._daily_pnl_pct(), self.cfg.kill_switch_daily_dd_pct)
+                    self._warn_kill_switch()
                     time.sleep(self.cfg.poll_seconds)
                     continue
 
-                if self.position:
-                    symbol = self.position.symbol
+                for pos in self.portfolio:
+                    symbol = pos.symbol
                     ticker = self.exchange.fetch_ticker(symbol)
                     last_price = ticker.get("last") or ticker.get("close") or ticker.get("bid") or ticker.get("ask")
                     if last_price is None:
-                        time.sleep(self.cfg.poll_seconds)
                         continue
-                    if self.position.remaining_qty > 0 and last_price >= self.position.tp1_price and self.position.tp_fraction > 0:
-                        self._partial_take_profit(last_price)
+                    trail = None
                     if self.cfg.trailing_use_atr:
-                        df = self._fetch_ohlcv_df(symbol, limit=100)
-                        atr = self._atr(df, 14).iloc[-1]
-                        trail = df["high"].iloc[-1] - self.cfg.atr_mult * atr
-                        if trail > self.position.stop_price:
-                            self.position.stop_price = trail
-                        self._cache_levels(symbol, df)
-                    if last_price <= self.position.stop_price:
-                        self._exit_market("STOP", last_price)
-                else:
-                    for symbol in self.cfg.symbols:
-                        df = self._fetch_ohlcv_df(symbol, limit=200)
-                        self._cache_levels(symbol, df)
-                        last_ts = df["ts"].iloc[-1]
-                        if last_checked_candle[symbol] is None or last_ts > last_checked_candle[symbol]:
-                            last_checked_candle[symbol] = last_ts
-                            sig = self._compute_signal(df)
-                            if sig.get("entry_ok"):
-                                if self._enter_position(symbol, sig["entry_price"], sig["stop_price"], sig["tp1_price"]):
-                                    break
-
-                self._render_status()
-                # Log périodique d'état (lisible) :
-                try:
-                    sym0 = self.cfg.symbols[0]
-                    self.log.info("STATUS ex=%s dry=%s eq=%.2f daily=%.2f%% pos=%s",
-                                  self.exchange.id, self.cfg.dry_run, self.equity, self._daily_pnl_pct(),
-                                  (self.position.symbol if self.position else "None"))
-                except Exception:
-                    pass
-
+                        # Bougie en formation requise : un petit fetch `since=` au lieu de 100 bougies
+                        self.candles.refresh(symbol, force=True)
+                        trail = self._trailing_inputs(symbol, forming=True)
+                    self._manage_position(pos, last_price, trail)
+
+                # Le scan continue sur tout l'univers tant que le portefeuille a de la place.
+                # Fetchs en parallèle (REST seulement si une clôture manque), signaux à l'arrivée.
+                if not self.portfolio.is_full():
+                    todo = [s for s in self.cfg.symbols if s not in self.portfolio]
+                    for symbol, err in self.candles.refresh_many(todo):
+                        if err is not None:
+                            self.log.warning("SCAN_ERROR symbol=%s err=%s", symbol, err)
+                            continue
+                        self._scan_symbol(symbol)
+                        if self.portfolio.is_full():
+                            break
+
+                self._apply_reload()
+                self._status_tick()
+                self.latency.observe("loop_cycle", "*", (time.perf_counter() - t_cycle) * 1000.0)
                 time.sleep(self.cfg.poll_seconds)
         except KeyboardInterrupt:
             console.print("[yellow]Arrêt demandé par l'utilisateur.[/yellow]")
             self.log.info("USER_INTERRUPT")
 
+    def _run_events(self):
+        """
+        Mode événementiel (WS requis) :
+        - clôture de bougie => signal (ou trailing si position) immédiatement
+        - bookTicker => TP/stop des symboles en position
+        - toutes les `poll_seconds` : dashboard + rattrapage REST des clôtures manquées
+        """
+        self.log.info("EVENT_MODE started")
+        for symbol, err in self.candles.refresh_many(self.cfg.symbols):
+            if err is not None:
+                self.log.warning("BOOTSTRAP_ERROR symbol=%s err=%s", symbol, err)
+        last_status = 0.0
+        try:
+            while True:
+                self._reset_daily_if_needed()
+                try:
+                    kind, symbol = self._events.get(timeout=1.0)
+                except queue.Empty:
+                    kind = symbol = None
+                t_cycle = time.perf_counter()
+
+                if kind == "kline":
+                    pos = self.portfolio.get(symbol)
+                    if pos is not None:
+                        trail = self._trailing_inputs(symbol, forming=False)
+                        if trail is not None:
+                            price = self._last_ticker.get(symbol) or self.indicators.get(symbol).close
+                            self._manage_position(pos, price, trail)
+                    elif not self._kill_switch_tripped():
+                        self._scan_symbol(symbol)
+                    event_time = self._kline_event_time.get(symbol)
+                    if event_time:
+                        self.latency.observe("close_to_decision", symbol, time.time() * 1000.0 - event_time)
+                elif kind == "tick":
+                    self._pending_ticks.discard(symbol)
+                    price = self._last_ticker.get(symbol)
+                    pos = self.portfolio.get(symbol)
+                    if price and pos is not None:
+                        self._manage_position(pos, price)
+                if kind is not None:
+                    self.latency.observe("loop_cycle", "*", (time.perf_counter() - t_cycle) * 1000.0)
+
+                if time.monotonic() - last_status >= self.cfg.poll_seconds:
+                    last_status = time.monotonic()
+                    self._apply_reload()
+                    if self._kill_switch_tripped():
+                        self._warn_kill_switch()
+                    # Filet de sécurité : clôtures ratées par le WS (REST seulement pour ceux en retard)
+                    before = {s: self.candles.last_closed_ts(s) for s in self.cfg.symbols}
+                    for s, err in self.candles.refresh_many(self.cfg.symbols):
+                        if err is None and self.candles.last_closed_ts(s) != before[s]:
+                            self._events.put(("kline", s))
+                    self._status_tick()
+        except KeyboardInterrupt:
+            console.print("[yellow]Arrêt demandé par l'utilisateur.[/yellow]")
+            self.log.info("USER_INTERRUPT")
+
     def _current_hh_level(self, symbol: str) -> float:
-        L = self.cfg.breakout_lookback
-        df = self._fetch_ohlcv_df(symbol, limit=L + 2)
-        return float(df["high"].iloc[-(L + 1):-1].max())
+        return float(self._symbol_levels(symbol).hh(self.cfg.breakout_lookback))
 
     def _current_ll_level(self, symbol: str) -> float:
-        L = self.cfg.stop_lookback
-        df = self._fetch_ohlcv_df(symbol, limit=L + 2)
-        return float(df["low"].iloc[-(L + 1):-1].min())
+        return float(self._symbol_levels(symbol).ll(self.cfg.stop_lookback))
 
     # ---------------- Status UI ----------------
     def _render_status(self):
@@ -549,6 +821,12 @@ class StopLossBot:
 
         table.add_row("Exchange", self.exchange.id)
         table.add_row("Dry run", str(self.cfg.dry_run))
+        if self._ws is not None:
+            st = self._ws.stats()
+            table.add_row("WebSocket", f"{st['connected']}/{st['shards']} connexions, {st['streams']} streams, "
+                                       f"{st['reconnects']} reconnexions")
+            table.add_row("File WS", f"{st['queue_depth']} en attente (max {st['queue_max_depth']}), "
+                                     f"{st['coalesced']} ticks coalescés, {st['dropped']} jetés")
         table.add_row("Equity", f"{self.equity:.2f}")
         table.add_row("PnL journalier", f"{self._daily_pnl_pct():.2f}%")
 
@@ -561,9 +839,12 @@ class StopLossBot:
                 last = t.get("last") or t.get("close") or t.get("bid") or t.get("ask")
             spread_pct = self._orderbook_spread_pct(sym0)
             table.add_row(f"Prix ({sym0})", f"{(last or 0):.4f}")
+            top = self.book.top(sym0, max_age=self.cfg.book_max_age_sec)
+            if top is not None:
+                table.add_row("Bid / Ask", f"{top[0]:.4f} / {top[1]:.4f}  (WS)")
             table.add_row("Spread", f"{spread_pct:.3f}%")
             try:
-                lv = getattr(self, "_levels", {}).get(sym0)
+                lv = self._compute_levels(sym0)
                 if lv:
                     table.add_row(f"HH{self.cfg.breakout_lookback} ({sym0})",
                                   f"{lv['hh']:.4f}  (close > ceci ⇒ entrée)")
@@ -576,16 +857,18 @@ class StopLossBot:
         except Exception:
             pass
 
-        if self.position:
-            table.add_row("Position", json.dumps({
-                "symbol": self.position.symbol,
-                "entry": round(self.position.entry_price, 2),
-                "stop": round(self.position.stop_price, 2),
-                "tp1": round(self.position.tp1_price, 2),
-                "qty": round(self.position.remaining_qty, 8),
-            }))
+        if len(self.portfolio):
+            table.add_row("Risque ouvert", f"{self.portfolio.total_risk() / self.equity * 100.0:.2f}% "
+                                           f"(max {self.cfg.max_total_risk_pct:.2f}%)")
+            for pos in self.portfolio:
+                table.add_row(f"Position ({pos.symbol})", json.dumps({
+                    "entry": round(pos.entry_price, 2),
+                    "stop": round(pos.stop_price, 2),
+                    "tp1": round(pos.tp1_price, 2),
+                    "qty": round(pos.remaining_qty, 8),
+                }))
         else:
-            table.add_row("Position", "Aucune")
+            table.add_row("Positions", f"Aucune (max {self.cfg.max_positions})")
 
         # Ne pas écraser le terminal si dashboard_clear=False
         if self.cfg.dashboard_clear:
@@ -594,6 +877,20 @@ class StopLossBot:
 
     def close(self):
         """Nettoyage doux: arrêter le WS, flush, etc."""
+        try:
+            self.candles.close()
+        except Exception:
+            pass
+        try:
+            self.journal.close()
+        except Exception:
+            pass
+        if self._metrics_srv is not None:
+            try:
+                self._metrics_srv.shutdown()
+                self._metrics_srv.server_close()
+            except Exception:
+                pass
         try:
             ws = getattr(self, "_ws", None)
             if ws:
@@ -627,17 +924,30 @@ class StopLossBot:
             _ = getattr(self, "exchange", None)
         except Exception:
             pass
+        # En dernier : vide la file de logs (y compris les messages d'arrêt ci-dessus)
+        try:
+            self.log.info("SHUTDOWN")
+            stop_event_logger("bot")
+        except Exception:
+            pass
 
 
 def main():
     cfg = Config.from_yaml("config.yaml")
-    bot = StopLossBot(cfg)
+    bot = StopLossBot(cfg, config_path="config.yaml")
 
     pid = os.getpid()
     print(f"[BOOT] PID={pid}")
 
+    exit_signal: List[int] = []
+
     def _graceful_exit(signum, frame):
-        # Laisser remonter SystemExit pour casser les boucles de run()
+        # Laisser remonter SystemExit pour casser les boucles de run() ; le finally appelle
+        # bot.close() qui vide le journal des trades et la file de logs
+        if cfg.log_async:
+            bot.log.info("SIGNAL signum=%s", signum)  # QueueHandler (SimpleQueue) : sûr depuis un handler de signal
+        else:
+            exit_signal.append(signum)  # FileHandler (verrou) : journalisé hors du handler, dans le finally
         raise SystemExit(0)
 
     for sig in (signal.SIGINT, signal.SIGTERM):
@@ -645,12 +955,18 @@ def main():
             signal.signal(sig, _graceful_exit)
         except Exception:
             pass
+    try:
+        signal.signal(signal.SIGHUP, lambda signum, frame: bot.request_reload())  # kill -HUP <pid>
+    except (AttributeError, ValueError):
+        pass  # Windows : pas de SIGHUP
 
     try:
         bot.run()
     except SystemExit:
         pass
     finally:
+        if exit_signal:
+            bot.log.info("SIGNAL signum=%s", exit_signal[0])
         try:
             bot.close()
         finally:
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+metrics.py — Mesures de latence (histogrammes p50/p99 par étape et par symbole) + mini serveur HTTP
+- LatencyHistogram : buckets log-espacés fixes (0.01 ms -> ~170 s), coût constant par mesure,
+  quantiles approchés (borne haute du bucket, erreur relative < 10 %)
+- LatencyRegistry : (nom, symbole) -> histogramme ; chaque mesure alimente aussi l'agrégat "*"
+    - observe(name, symbol, ms) / timer(name, symbol) (context manager, perf_counter)
+- InstrumentedExchange : proxy ccxt qui chronomètre chaque appel REST (rest_<méthode>) et compte les erreurs
+- prometheus_text(samples, registry) : format texte Prometheus 0.0.4 (gauges/counters + summaries)
+- start_metrics_server(host, port, routes) : ThreadingHTTPServer en thread daemon (comme
+  terminal_candles_stream.start_status_server) ; routes = {chemin: fn() -> (content_type, body)}
+Étapes mesurées par le bot :
+    ws_event_lag      réception WS - temps d'événement Binance `E` (horloges locale/exchange)
+    ws_queue_delay    réception WS -> exécution du callback (file EventPipe)
+    close_to_decision `E` de la clôture -> fin de l'évaluation du signal (mode événementiel)
+    compute_signal, enter_position, create_order, exit_market, loop_cycle, rest_*
+Tout est calculé à la lecture (scrape) depuis l'état existant : rien d'ajouté au chemin de trading
+hormis l'incrément des histogrammes.
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+# Bornes hautes des buckets (ms) : 0.01 * 1.2^k
+_BOUNDS: List[float] = [0.01 * 1.2 ** k for k in range(90)]
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "n", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(_BOUNDS) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect.bisect_left(_BOUNDS, ms)] += 1
+        self.n += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def quantile(self, q: float) -> float:
+        if self.n == 0:
+            return math.nan
+        rank = q * self.n
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank and c:
+                return min(_BOUNDS[i], self.max) if i < len(_BOUNDS) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {"count": self.n, "mean_ms": self.total / self.n if self.n else math.nan,
+                "p50_ms": self.quantile(0.50), "p99_ms": self.quantile(0.99), "max_ms": self.max}
+
+
+class LatencyRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist: Dict[Tuple[str, str], LatencyHistogram] = {}
+
+    def observe(self, name: str, symbol: str, ms: float) -> None:
+        keys = ((name, symbol), (name, "*")) if symbol != "*" else ((name, "*"),)
+        with self._lock:
+            for key in keys:
+                h = self._hist.get(key)
+                if h is None:
+                    h = self._hist[key] = LatencyHistogram()
+                h.observe(ms)
+
+    @contextmanager
+    def timer(self, name: str, symbol: str = "*") -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, symbol, (time.perf_counter() - t0) * 1000.0)
+
+    def items(self) -> List[Tuple[Tuple[str, str], Dict[str, float]]]:
+        with self._lock:
+            return [(key, {"count": h.n, "sum": h.total, "p50": h.quantile(0.5), "p99": h.quantile(0.99)})
+                    for key, h in sorted(self._hist.items())]
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            items = sorted(self._hist.items())
+            return [{"name": name, "symbol": sym, **h.summary()} for (name, sym), h in items]
+
+    def log_lines(self) -> List[str]:
+        """Une ligne par étape (agrégat tous symboles), pour le log périodique."""
+        return [f"LATENCY name={r['name']} n={r['count']} p50={r['p50_ms']:.2f}ms "
+                f"p99={r['p99_ms']:.2f}ms max={r['max_ms']:.2f}ms"
+                for r in self.snapshot() if r["symbol"] == "*"]
+
+    def to_json(self) -> str:
+        rows = [{k: (None if isinstance(v, float) and math.isnan(v) else v) for k, v in r.items()}
+                for r in self.snapshot()]
+        return json.dumps(rows)
+
+
+class InstrumentedExchange:
+    """
+    Proxy transparent d'un exchange ccxt : fetch_* / create_* / cancel_* / load_markets sont chronométrés
+    dans `registry` sous "rest_<méthode>" (le compte de l'histogramme = nombre d'appels).
+    """
+
+    _TIMED = ("fetch_", "create_", "cancel_", "load_markets")
+
+    def __init__(self, exchange, registry: LatencyRegistry):
+        object.__setattr__(self, "_ex", exchange)
+        object.__setattr__(self, "_reg", registry)
+        object.__setattr__(self, "errors", {})
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._ex, name)
+        if not callable(attr) or not name.startswith(self._TIMED):
+            return attr
+        reg, errors = self._reg, self.errors
+
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            except Exception:
+                errors[name] = errors.get(name, 0) + 1
+                raise
+            finally:
+                reg.observe("rest_" + name, "*", (time.perf_counter() - t0) * 1000.0)
+        return timed
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._ex, name, value)
+
+
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _num(v: float) -> str:
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return "NaN"
+    if isinstance(v, float) and math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v))
+
+
+def prometheus_text(samples: List[Tuple[str, str, str, Dict[str, Any], float]],
+                    registry: LatencyRegistry = None, prefix: str = "bot") -> str:
+    """samples: (nom, type gauge|counter, aide, labels, valeur). Histogrammes => summary `{prefix}_latency_ms`."""
+    out: List[str] = []
+    seen = set()
+    for name, kind, help_, labels, value in samples:
+        full = f"{prefix}_{name}"
+        if full not in seen:
+            seen.add(full)
+            out.append(f"# HELP {full} {help_}")
+            out.append(f"# TYPE {full} {kind}")
+        out.append(f"{full}{_labels(labels)} {_num(value)}")
+    if registry is not None:
+        full = f"{prefix}_latency_ms"
+        out.append(f"# HELP {full} Latences par étape et par symbole (ms)")
+        out.append(f"# TYPE {full} summary")
+        for (stage, symbol), h in registry.items():
+            base = {"stage": stage, "symbol": symbol}
+            out.append(f"{full}{_labels({**base, 'quantile': '0.5'})} {_num(h['p50'])}")
+            out.append(f"{full}{_labels({**base, 'quantile': '0.99'})} {_num(h['p99'])}")
+            out.append(f"{full}_sum{_labels(base)} {_num(h['sum'])}")
+            out.append(f"{full}_count{_labels(base)} {_num(h['count'])}")
+    return "\n".join(out) + "\n"
+
+
+def start_metrics_server(host: str, port: int, routes: Dict[str, Callable[[], Tuple[str, str]]]):
+    """Démarre un mini serveur HTTP en thread daemon. Retourne (serveur, thread)."""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):  # silence le bruit
+            return
+
+        def do_GET(self):
+            fn = routes.get(self.path.split("?")[0])
+            if fn is None:
+                self.send_response(404)
+                self.end_headers()
+                return
+            try:
+                ctype, text = fn()
+                body = text.encode("utf-8")
+                self.send_response(200)
+            except Exception as e:
+                ctype, body = "text/plain", str(e).encode("utf-8")
+                self.send_response(500)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    srv = ThreadingHTTPServer((host, port), Handler)
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    return srv, t
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+optimize.py — Balayage de paramètres (grid / random search) sur le backtest, tous les cœurs
+- Les OHLCV de tous les symboles sont copiés UNE fois dans un bloc de mémoire partagée
+  (multiprocessing.shared_memory) : chaque worker y accède en vue NumPy, sans pickling
+- Un jeu de paramètres = une tâche du pool de processus => métriques de backtest.summarize
+- Sortie : tableau classé (Rich) + CSV optionnel
+
+Usage:
+    python optimize.py --breakout_lookback 10,20,30 --stop_lookback 5,10 --atr_mult 1.5,2,3
+    python optimize.py --random 200 --take_profit_R 0.5,1,1.5,2 --tp_fraction 0.25,0.5,0.75 --out sweep.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backtest import BacktestParams, fetch_history, run_backtest, summarize
+
+# Champs de Config balayables et leur type
+SWEEP_FIELDS = {
+    "breakout_lookback": int,
+    "stop_lookback": int,
+    "atr_mult": float,
+    "take_profit_R": float,
+    "tp_fraction": float,
+    "use_atr_stop": lambda v: str(v).lower() in ("1", "true", "yes", "on"),
+}
+
+# État par worker (rempli par _init_worker)
+_SHM = None
+_DATA: Dict[str, np.ndarray] = {}
+
+
+def pack_shared(data: Dict[str, np.ndarray]) -> Tuple[shared_memory.SharedMemory, List[Tuple[str, int, int]]]:
+    """Copie les tableaux (N, 6) bout à bout dans un segment partagé. Retourne (shm, layout)."""
+    total = sum(a.shape[0] for a in data.values())
+    shm = shared_memory.SharedMemory(create=True, size=max(1, total * 6 * 8))
+    buf = np.ndarray((total, 6), dtype=np.float64, buffer=shm.buf)
+    layout, pos = [], 0
+    for sym, arr in data.items():
+        n = arr.shape[0]
+        buf[pos:pos + n] = arr
+        layout.append((sym, pos, n))
+        pos += n
+    return shm, layout
+
+
+def _init_worker(shm_name: str, total: int, layout: List[Tuple[str, int, int]]) -> None:
+    global _SHM, _DATA
+    _SHM = shared_memory.SharedMemory(name=shm_name)
+    buf = np.ndarray((total, 6), dtype=np.float64, buffer=_SHM.buf)
+    _DATA = {sym: buf[pos:pos + n] for sym, pos, n in layout}
+
+
+def _evaluate(base: dict, combo: dict, risk_quote: float) -> dict:
+    params = BacktestParams(**{**base, **combo})
+    trades = run_backtest(_DATA, params, risk_quote=risk_quote)
+    return {**combo, **summarize(trades)}
+
+
+def build_combos(space: Dict[str, list], n_random: int = 0, seed: int = 0) -> List[dict]:
+    keys = list(space)
+    grid = [dict(zip(keys, vals)) for vals in itertools.product(*(space[k] for k in keys))]
+    if n_random and n_random < len(grid):
+        return random.Random(seed).sample(grid, n_random)
+    return grid
+
+
+def sweep(data: Dict[str, np.ndarray], base: dict, combos: List[dict], workers: int = 0,
+          risk_quote: float = 100.0) -> pd.DataFrame:
+    shm, layout = pack_shared(data)
+    total = sum(n for _, _, n in layout)
+    rows: List[dict] = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                                 initargs=(shm.name, total, layout)) as pool:
+            futures = [pool.submit(_evaluate, base, combo, risk_quote) for combo in combos]
+            for fut in as_completed(futures):
+                rows.append(fut.result())
+    finally:
+        shm.close()
+        shm.unlink()
+    return pd.DataFrame(rows)
+
+
+def main():
+    import ccxt
+    from rich.console import Console
+    from rich.table import Table
+    from candle_db import CandleDB
+    from main import Config
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", default="config.yaml")
+    ap.add_argument("--symbols", default="", help="liste séparée par des virgules (défaut: config)")
+    ap.add_argument("--timeframe", default="")
+    ap.add_argument("--limit", type=int, default=1000, help="nombre de bougies par symbole")
+    for name in SWEEP_FIELDS:
+        ap.add_argument(f"--{name}", default="", help="valeurs séparées par des virgules (défaut: config)")
+    ap.add_argument("--random", type=int, default=0, help="tire N combinaisons au hasard dans la grille")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=0, help="processus (défaut: nb de cœurs)")
+    ap.add_argument("--risk_quote", type=float, default=100.0)
+    ap.add_argument("--rank_by", default="total_R")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--out", default="", help="CSV de toutes les combinaisons")
+    ap.add_argument("--db", default=None, help="base locale des bougies (défaut: candle_db_dir, '' = aucune)")
+    args = ap.parse_args()
+
+    cfg = Config.from_yaml(args.config)
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()] or cfg.symbols
+    timeframe = args.timeframe or cfg.timeframe
+    ex = getattr(ccxt, cfg.exchange.lower())({"enableRateLimit": True})
+    db_dir = cfg.candle_db_dir if args.db is None else args.db
+    db = CandleDB(db_dir) if db_dir else None
+    data = {s: fetch_history(ex, s, timeframe, args.limit, db=db) for s in symbols}
+
+    base = vars(BacktestParams.from_config(cfg))
+    space = {}
+    for name, conv in SWEEP_FIELDS.items():
+        raw = getattr(args, name)
+        space[name] = [conv(v) for v in raw.split(",") if v.strip()] if raw else [base[name]]
+    combos = build_combos(space, args.random, args.seed)
+
+    console = Console()
+    console.print(f"[cyan]{len(combos)} combinaison(s) × {len(symbols)} symbole(s) — {timeframe}[/cyan]")
+    res = sweep(data, base, combos, workers=args.workers, risk_quote=args.risk_quote)
+    res = res.sort_values(args.rank_by, ascending=False, kind="stable").reset_index(drop=True)
+    if args.out:
+        res.to_csv(args.out, index=False)
+
+    table = Table(title=f"Top {min(args.top, len(res))} — classé par {args.rank_by}")
+    for col in res.columns:
+        table.add_column(col, style="cyan" if col in SWEEP_FIELDS else None)
+    for _, row in res.head(args.top).iterrows():
+        table.add_row(*[f"{v:.3f}" if isinstance(v, float) else str(v) for v in row.tolist()])
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
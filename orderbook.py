@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+orderbook.py — Carnet d'ordres local alimenté par le WebSocket (pour main.py)
+- Top-of-book par symbole depuis `@bookTicker` (meilleur bid/ask + quantités) : zéro REST
+- Optionnel : carnet complet depuis `@depth@100ms` (diff-depth) synchronisé sur un snapshot REST
+  selon la procédure Binance :
+    1. bufferiser les diffs reçus
+    2. snapshot REST (lastUpdateId) dans un thread à part (jamais dans la boucle WS)
+    3. ignorer les diffs u <= lastUpdateId ; le premier appliqué vérifie U <= lastUpdateId+1 <= u
+    4. ensuite chaque diff doit suivre (U == u_précédent + 1), sinon resynchronisation
+- `top(symbol, max_age)` : (bid, ask) du carnet synchronisé s'il existe, sinon du bookTicker ;
+  None si rien de frais => l'appelant retombe sur fetch_order_book
+Thread-safe : écrit depuis le thread WS, lu depuis le thread principal.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+Top = Tuple[float, float]  # (bid, ask)
+
+
+class DepthBook:
+    """Carnet diff-depth d'un symbole (prix -> quantité)."""
+
+    def __init__(self, max_buffer: int = 1000):
+        self.bids: Dict[float, float] = {}
+        self.asks: Dict[float, float] = {}
+        self.last_update_id: Optional[int] = None   # None => pas synchronisé
+        self.buffer: Deque = deque(maxlen=max_buffer)
+        self.syncing = False
+        self.updated_at = 0.0
+        self._best_bid: Optional[float] = None
+        self._best_ask: Optional[float] = None
+
+    @property
+    def synced(self) -> bool:
+        return self.last_update_id is not None
+
+    def load_snapshot(self, last_update_id: int, bids: List[list], asks: List[list]) -> None:
+        self.bids = {float(p): float(q) for p, q, *_ in bids if float(q) > 0}
+        self.asks = {float(p): float(q) for p, q, *_ in asks if float(q) > 0}
+        self._best_bid = max(self.bids) if self.bids else None
+        self._best_ask = min(self.asks) if self.asks else None
+        self.last_update_id = int(last_update_id)
+        self.updated_at = time.monotonic()
+        pending = list(self.buffer)
+        self.buffer.clear()
+        first = True
+        for ev in pending:
+            if ev.u <= self.last_update_id:
+                continue
+            if first and not (ev.U <= self.last_update_id + 1 <= ev.u):
+                self.last_update_id = None  # snapshot trop ancien: resync
+                return
+            first = False
+            if not self.apply(ev):
+                return
+
+    def apply(self, ev) -> bool:
+        """Applique un diff (ws_binance.DepthDiff) déjà ordonné. False (et désynchronisé) si une séquence manque."""
+        U, u = ev.U, ev.u
+        if u <= self.last_update_id:
+            return True
+        if U > self.last_update_id + 1:
+            self.last_update_id = None
+            return False
+        for p, q in ev.b:
+            self._set(self.bids, float(p), float(q), bid=True)
+        for p, q in ev.a:
+            self._set(self.asks, float(p), float(q), bid=False)
+        self.last_update_id = u
+        self.updated_at = time.monotonic()
+        return True
+
+    def _set(self, side: Dict[float, float], price: float, qty: float, bid: bool) -> None:
+        best = self._best_bid if bid else self._best_ask
+        if qty > 0:
+            side[price] = qty
+            if best is None or (price > best if bid else price < best):
+                best = price
+        else:
+            side.pop(price, None)
+            if price == best:  # recalcul seulement quand le meilleur niveau disparaît
+                best = (max(side) if bid else min(side)) if side else None
+        if bid:
+            self._best_bid = best
+        else:
+            self._best_ask = best
+
+    def top(self) -> Optional[Top]:
+        if self._best_bid is None or self._best_ask is None:
+            return None
+        return self._best_bid, self._best_ask
+
+    def levels(self, n: int = 5) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
+        bids = sorted(self.bids.items(), reverse=True)[:n]
+        asks = sorted(self.asks.items())[:n]
+        return bids, asks
+
+
+class OrderBookCache:
+    def __init__(self, snapshot_fn: Optional[Callable[[str], dict]] = None):
+        """`snapshot_fn(symbol)` -> dict ccxt fetch_order_book (avec 'nonce' = lastUpdateId)."""
+        self.snapshot_fn = snapshot_fn
+        self._lock = threading.Lock()
+        self._tops: Dict[str, Tuple[float, float, float, float, float]] = {}  # bid, bidQty, ask, askQty, t
+        self._depth: Dict[str, DepthBook] = {}
+        self.resyncs = 0
+
+    # ---------------- bookTicker ----------------
+    def update_top(self, symbol: str, bid: float, bid_qty: float, ask: float, ask_qty: float) -> None:
+        with self._lock:
+            self._tops[symbol] = (bid, bid_qty, ask, ask_qty, time.monotonic())
+
+    # ---------------- diff-depth ----------------
+    def apply_diff(self, symbol: str, ev) -> None:
+        start_sync = False
+        with self._lock:
+            book = self._depth.get(symbol)
+            if book is None:
+                book = self._depth[symbol] = DepthBook()
+            if not book.synced:
+                book.buffer.append(ev)
+                if not book.syncing and self.snapshot_fn is not None:
+                    book.syncing = start_sync = True
+            elif not book.apply(ev):
+                book.buffer.append(ev)
+                if not book.syncing and self.snapshot_fn is not None:
+                    book.syncing = start_sync = True
+        if start_sync:
+            threading.Thread(target=self._sync, args=(symbol,), daemon=True).start()
+
+    def _sync(self, symbol: str) -> None:
+        try:
+            snap = self.snapshot_fn(symbol)
+            last_id = snap.get("nonce")
+            if last_id is None:
+                return
+            with self._lock:
+                book = self._depth[symbol]
+                book.load_snapshot(int(last_id), snap.get("bids") or [], snap.get("asks") or [])
+                self.resyncs += 1
+        except Exception:
+            pass  # le prochain diff relancera une synchro
+        finally:
+            with self._lock:
+                self._depth[symbol].syncing = False
+
+    # ---------------- Lecture ----------------
+    def top(self, symbol: str, max_age: float = 30.0) -> Optional[Top]:
+        now = time.monotonic()
+        with self._lock:
+            book = self._depth.get(symbol)
+            if book is not None and book.synced and now - book.updated_at <= max_age:
+                t = book.top()
+                if t is not None:
+                    return t
+            row = self._tops.get(symbol)
+            if row is not None and now - row[4] <= max_age:
+                return row[0], row[2]
+        return None
+
+    def spread_pct(self, symbol: str, max_age: float = 30.0) -> Optional[float]:
+        t = self.top(symbol, max_age)
+        if t is None:
+            return None
+        bid, ask = t
+        mid = (bid + ask) / 2.0
+        return (ask - bid) / mid * 100.0 if mid > 0 else None
+
+    def levels(self, symbol: str, n: int = 5):
+        with self._lock:
+            book = self._depth.get(symbol)
+            if book is None or not book.synced:
+                return None
+            return book.levels(n)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+portfolio.py — Positions simultanées du bot (remplace l'unique `self.position`)
+- Une position au plus par symbole
+- Plafonds : nombre de positions, risque par symbole, risque total ouvert (en % de l'equity)
+- Risque ouvert d'une position = (entry - stop) * qty restante, borné à 0
+  (une position dont le stop est à break-even ou au-dessus ne consomme plus de budget)
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class Portfolio:
+    def __init__(self, max_positions: int = 5, max_total_risk_pct: float = 5.0, max_symbol_risk_pct: float = 2.0):
+        self.max_positions = int(max_positions)
+        self.max_total_risk_pct = float(max_total_risk_pct)
+        self.max_symbol_risk_pct = float(max_symbol_risk_pct)
+        self.positions: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.positions
+
+    def __iter__(self) -> Iterator[Any]:
+        # copie: on peut fermer une position pendant l'itération
+        return iter(list(self.positions.values()))
+
+    def get(self, symbol: str) -> Optional[Any]:
+        return self.positions.get(symbol)
+
+    def symbols(self) -> List[str]:
+        return list(self.positions)
+
+    def add(self, pos) -> None:
+        self.positions[pos.symbol] = pos
+
+    def remove(self, symbol: str) -> None:
+        self.positions.pop(symbol, None)
+
+    # ---------------- Risque ----------------
+    @staticmethod
+    def open_risk(pos) -> float:
+        return max(0.0, (pos.entry_price - pos.stop_price) * pos.remaining_qty)
+
+    def total_risk(self) -> float:
+        return sum(self.open_risk(p) for p in self.positions.values())
+
+    def is_full(self) -> bool:
+        return len(self.positions) >= self.max_positions
+
+    def block_reason(self, symbol: str, risk_quote: float, equity: float) -> Optional[str]:
+        """Raison du refus d'une nouvelle position (None si elle tient dans les plafonds)."""
+        if symbol in self.positions:
+            return "already_open"
+        if self.is_full():
+            return f"max_positions={self.max_positions}"
+        if equity <= 0:
+            return "equity<=0"
+        if risk_quote / equity * 100.0 > self.max_symbol_risk_pct:
+            return f"symbol_risk>{self.max_symbol_risk_pct:.2f}%"
+        if (self.total_risk() + risk_quote) / equity * 100.0 > self.max_total_risk_pct:
+            return f"total_risk>{self.max_total_risk_pct:.2f}%"
+        return None
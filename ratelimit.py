@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+ratelimit.py — Budget de requêtes REST partagé entre threads (seau à jetons)
+- `acquire(cost)` bloque jusqu'à disponibilité des jetons, retourne l'attente (s)
+- Complète `enableRateLimit` de ccxt, qui espace les appels mais ne borne pas
+  un débit global quand plusieurs workers tapent l'exchange en parallèle
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+
+class RateBudget:
+    def __init__(self, rate_per_sec: float, burst: float = 0.0):
+        self.rate = float(rate_per_sec)
+        self.capacity = float(burst) if burst > 0 else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_sec = 0.0   # cumul des attentes (observabilité)
+        self.waits = 0
+
+    def acquire(self, cost: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= cost:
+                    self._tokens -= cost
+                    if waited:
+                        self.waited_sec += waited
+                        self.waits += 1
+                    return waited
+                delay = (cost - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
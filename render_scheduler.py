@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+render_scheduler.py — Cadence de rendu des viewers terminal (asyncio)
+- Le flux WS ne dessine plus : il appelle `mark_dirty()` (O(1)) à chaque tick
+- Une tâche unique redessine au plus `max_fps` fois par seconde ; les ticks reçus entre
+  deux images sont fusionnés (seul l'état le plus récent est dessiné)
+- `state_fn()` (optionnel) résume l'état visible (ex: compteur de version du tampon) :
+  si rien n'a changé depuis la dernière image, le rendu est sauté
+- `invalidate()` force la prochaine image (premier affichage, redimensionnement du terminal)
+Partagé par terminal_candles_stream.py et terminal_candles_stream_ascii.py.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class RenderScheduler:
+    def __init__(self, render_fn: Callable[[], Any], max_fps: float = 4.0,
+                 state_fn: Optional[Callable[[], Any]] = None):
+        """`render_fn` peut être une fonction ou une coroutine ; max_fps <= 0 => pas de limite."""
+        self.render_fn = render_fn
+        self.max_fps = float(max_fps)
+        self.state_fn = state_fn
+        self._event = asyncio.Event()
+        self._force = False
+        self._last_state: Any = object()
+        self._next_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.ticks = 0
+        self.frames = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def mark_dirty(self) -> None:
+        self.ticks += 1
+        self._event.set()
+
+    def invalidate(self) -> None:
+        self._force = True
+        self._event.set()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    async def run(self) -> None:
+        while True:
+            await self._event.wait()
+            delay = self._next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)  # les ticks arrivant pendant l'attente sont fusionnés
+            self._event.clear()
+            state = self.state_fn() if self.state_fn is not None else None
+            if not self._force and self.state_fn is not None and state == self._last_state:
+                self.skipped += 1
+                continue
+            self._force = False
+            self._last_state = state
+            try:
+                res = self.render_fn()
+                if inspect.isawaitable(res):
+                    await res
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.errors += 1
+            self.frames += 1
+            if self.max_fps > 0:
+                self._next_at = time.monotonic() + 1.0 / self.max_fps
+
+    def stats(self) -> Dict[str, int]:
+        return {"ticks": self.ticks, "frames": self.frames, "skipped": self.skipped, "errors": self.errors}
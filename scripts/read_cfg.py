@@ -9,6 +9,9 @@ arg = sys.argv[1] if len(sys.argv) > 1 else "symbol"
 if arg == "symbol":
     s = cfg.get("symbols", ["BTC/USDT"])
     print(s[0] if isinstance(s, list) else s)
+elif arg == "symbols":
+    s = cfg.get("symbols", ["BTC/USDT"])
+    print(",".join(s) if isinstance(s, list) else s)
 elif arg == "timeframe":
     print(cfg.get("timeframe", "1h"))
 else:
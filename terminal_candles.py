@@ -2,6 +2,7 @@
 """
 Affichage terminal des bougies (snapshot) avec plotext (ASCII).
 - Si plotext manque, on affiche un fallback simple et on suggère l'installation.
+- Les bougies closes sont lues/écrites dans la base locale (candle_db) : seul le trou est téléchargé.
 Usage:
     python terminal_candles.py --symbol BTC/USDT --timeframe 1h --limit 120
 """
@@ -10,10 +11,19 @@ import importlib
 import ccxt
 import pandas as pd
 
-def fetch_df(exchange_id: str, symbol: str, timeframe: str, limit: int) -> pd.DataFrame:
+from candle_db import CandleDB, sync_tail
+
+def fetch_df(exchange_id: str, symbol: str, timeframe: str, limit: int, db_dir: str = "data/candles") -> pd.DataFrame:
     ex = getattr(ccxt, exchange_id)({"enableRateLimit": True})
-    ohlcv = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-    df = pd.DataFrame(ohlcv, columns=["ts","open","high","low","close","volume"])
+    if not db_dir:
+        ohlcv = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+        return pd.DataFrame(ohlcv, columns=["ts","open","high","low","close","volume"])
+    closed = sync_tail(CandleDB(db_dir), ex, symbol, timeframe, max(1, limit - 1)).tolist()
+    forming = ex.fetch_ohlcv(symbol, timeframe=timeframe, limit=1)
+    if forming and (not closed or forming[-1][0] > closed[-1][0]):
+        closed.append(forming[-1])
+    df = pd.DataFrame(closed, columns=["ts","open","high","low","close","volume"])
+    df["ts"] = df["ts"].astype("int64")
     return df
 
 def show_candles(df):
@@ -42,8 +52,9 @@ def main():
     ap.add_argument("--symbol", default="BTC/USDT")
     ap.add_argument("--timeframe", default="1h")
     ap.add_argument("--limit", type=int, default=120)
+    ap.add_argument("--db", default="data/candles", help="base locale des bougies ('' = REST seul)")
     args = ap.parse_args()
-    df = fetch_df(args.exchange, args.symbol, args.timeframe, args.limit)
+    df = fetch_df(args.exchange, args.symbol, args.timeframe, args.limit, db_dir=args.db)
     show_candles(df)
 
 if __name__ == "__main__":
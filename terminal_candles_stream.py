@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 """
 Streaming Candlestick (Terminal) — Binance WebSocket + plotext (gratuit)
-- Précharge l'historique via REST Binance (affichage immédiat)
-- Bougies en temps réel via WS
+- Précharge l'historique depuis la base locale (candle_db) + REST Binance pour le trou (affichage immédiat)
+- Bougies en temps réel via WS ; après une reconnexion, les bougies closes pendant la coupure
+  sont rattrapées en REST (et enregistrées en base) avant de reprendre le flux
 - Utilise des indices numériques en abscisse + étiquettes texte (évite les erreurs de format de dates)
+- Overlays (MA, HH) incrémentaux : calculés une fois par bougie close, seul le point de la bougie
+  en formation est recalculé à chaque tick (O(1))
+- Rendu cadencé (render_scheduler) : au plus --fps images/s, ticks intermédiaires fusionnés,
+  aucune image si l'état visible n'a pas changé
 - (Optionnel) Mini serveur HTTP /health et /status avec port auto-incrémenté
 
 Usage (classique, sans serveur):
@@ -15,11 +20,9 @@ Usage (avec mini serveur HTTP et port auto):
 import argparse
 import asyncio
 import json
-import math
 import signal
 from datetime import datetime, timezone
-from typing import Deque, List, Tuple
-from collections import deque
+from typing import Dict, List, Tuple
 
 # --- Ajouts pour serveur HTTP optionnel ---
 import os
@@ -29,8 +32,13 @@ import threading
 from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 # ------------------------------------------
 
+import numpy as np
 import websockets
-import requests
+
+from candle_db import CandleDB, load_closed_klines, missed_klines
+from candle_ring import CandleRing
+from indicators import RollingMax, RollingMean
+from render_scheduler import RenderScheduler
 
 try:
     import plotext as plx
@@ -44,63 +52,115 @@ GLOBAL_STATUS = {}
 def to_stream_symbol(sym: str) -> str:
     return sym.replace("/", "").lower()
 
-def to_rest_symbol(sym: str) -> str:
-    return sym.replace("/", "").upper()
-
 def ts_to_str(ms: int) -> str:
     # label lisible pour l'axe (HH:MM)
     return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%H:%M")
 
+class Overlay:
+    """
+    Série d'overlay maintenue bougie par bougie :
+    - "ma"      : moyenne des `period` dernières clôtures (fenêtre partielle au début)
+    - "hh"      : plus haut des `period` dernières bougies, bougie courante incluse
+    - "prev_hh" : plus haut des `period` bougies précédentes (high courant s'il n'y en a pas)
+    """
+    def __init__(self, kind: str, period: int, limit: int):
+        self.kind = kind
+        self.period = period
+        if kind == "ma":
+            self._state = RollingMean(period)
+        elif kind == "hh":
+            self._state = RollingMax(period - 1)  # max(period-1 closes précédentes, high courant)
+        elif kind == "prev_hh":
+            self._state = RollingMax(period)
+        else:
+            raise ValueError(f"Overlay inconnu: {kind}")
+        self.values = CandleRing(limit, fields=("v",))  # point de la bougie en formation = emplacement `forming`
+
+    def peek(self, h: float, c: float) -> float:
+        """Valeur pour une bougie (h, c) ajoutée après les closes connues — état inchangé."""
+        if self.kind == "ma":
+            return self._state.peek(c)
+        m = self._state.value()
+        if m != m:
+            return h
+        return max(m, h) if self.kind == "hh" else m
+
+    def push(self, h: float, c: float) -> None:
+        self.values.append(self.peek(h, c))
+        self._state.push(c if self.kind == "ma" else h)
+
+    def set_live(self, h: float, c: float) -> None:
+        self.values.set_forming(self.peek(h, c))
+
 class CandleBuffer:
-    """Tampon de N bougies OHLC avec bougie courante remplaçable tant qu'elle n'est pas close."""
+    """
+    Tampon de N bougies OHLC (CandleRing, ts = closeTime) avec bougie courante remplaçable
+    tant qu'elle n'est pas close. get_arrays()/get_overlay() rendent des vues sans copie.
+    """
     def __init__(self, limit: int):
         self.limit = limit
-        self.opens: Deque[float] = deque(maxlen=limit)
-        self.highs: Deque[float] = deque(maxlen=limit)
-        self.lows: Deque[float] = deque(maxlen=limit)
-        self.closes: Deque[float] = deque(maxlen=limit)
-        self.labels: Deque[str] = deque(maxlen=limit)
-        self.current_open: float = math.nan
-        self.current_high: float = math.nan
-        self.current_low: float = math.nan
-        self.current_close: float = math.nan
-        self.current_label: str = ""
+        self.ring = CandleRing(limit, fields=("ts", "open", "high", "low", "close"))
+        self.overlays: Dict[Tuple[str, int], Overlay] = {}
+
+    @property
+    def version(self) -> int:
+        """Incrémenté à chaque changement visible (clé du RenderScheduler)."""
+        return self.ring.version
+
+    def add_overlay(self, kind: str, period: int) -> Tuple[str, int]:
+        """Enregistre un overlay (avant preload). Même (kind, period) => même série, calculée une fois."""
+        key = (kind, int(period))
+        if key not in self.overlays:
+            ov = self.overlays[key] = Overlay(kind, int(period), self.limit)
+            for h, c in zip(self.ring.view("high", False).tolist(), self.ring.view("close", False).tolist()):
+                ov.push(h, c)
+            row = self.ring.forming_row()
+            if row is not None:
+                ov.set_live(row[2], row[4])
+        return key
+
+    def _append_closed(self, t_close, o, h, l, c):
+        self.ring.append(t_close, o, h, l, c)
+        for ov in self.overlays.values():
+            ov.push(h, c)
+
+    def last_closed_time(self):
+        """closeTime de la dernière bougie close, None si vide."""
+        return int(self.ring.last("ts")) if len(self.ring) else None
 
     def preload(self, ohlc_list):
-        """Remplit l'historique initial (liste d'items [openTime, o, h, l, c, v, closeTime, ...])"""
+        """Ajoute des bougies closes (items [openTime, o, h, l, c, v, closeTime, ...]) ; déjà connues ignorées."""
         for item in ohlc_list:
-            t_close = int(item[6])
-            o = float(item[1]); h=float(item[2]); l=float(item[3]); c=float(item[4])
-            self.opens.append(o); self.highs.append(h); self.lows.append(l); self.closes.append(c); self.labels.append(ts_to_str(t_close))
+            if len(self.ring) and int(item[6]) <= self.ring.last("ts"):
+                continue
+            self._append_closed(int(item[6]), float(item[1]), float(item[2]), float(item[3]), float(item[4]))
 
-    def update_live(self, o,h,l,c, label: str):
-        self.current_open, self.current_high, self.current_low, self.current_close = o,h,l,c
-        self.current_label = label
+    def update_live(self, o, h, l, c, t_close: int):
+        if not self.ring.set_forming(t_close, o, h, l, c):
+            return  # tick sans changement OHLC (volume seul)
+        for ov in self.overlays.values():
+            ov.set_live(h, c)
 
     def close_current(self):
-        if math.isnan(self.current_open):
+        row = self.ring.forming_row()
+        if row is None:
             return
-        self.opens.append(self.current_open)
-        self.highs.append(self.current_high)
-        self.lows.append(self.current_low)
-        self.closes.append(self.current_close)
-        self.labels.append(self.current_label)
-        self.current_open = self.current_high = self.current_low = self.current_close = math.nan
-        self.current_label = ""
-
-    def get_arrays(self) -> Tuple[List[float], List[float], List[float], List[float], List[str]]:
-        o = list(self.opens); h = list(self.highs); l = list(self.lows); c = list(self.closes); lbl = list(self.labels)
-        if not math.isnan(self.current_open):
-            o.append(self.current_open); h.append(self.current_high); l.append(self.current_low); c.append(self.current_close); lbl.append(self.current_label + "*")
-        return o,h,l,c,lbl
-
-def fetch_klines_rest(symbol: str, timeframe: str, limit: int):
-    """Binance REST public klines"""
-    url = "https://api.binance.com/api/v3/klines"
-    params = {"symbol": to_rest_symbol(symbol), "interval": timeframe, "limit": limit}
-    r = requests.get(url, params=params, timeout=10)
-    r.raise_for_status()
-    return r.json()
+        self._append_closed(*row)
+
+    def get_overlay(self, key: Tuple[str, int]) -> np.ndarray:
+        """Série alignée sur get_arrays() (point de la bougie en formation inclus)."""
+        return self.overlays[key].values.view("v", forming=self.ring.has_forming)
+
+    def get_arrays(self) -> Tuple[np.ndarray, ...]:
+        """(open, high, low, close, closeTime) — vues valides jusqu'au prochain tick."""
+        ts, o, h, l, c = self.ring.arrays(forming=True)
+        return o, h, l, c, ts
+
+    def labels(self, idx: List[int]) -> List[str]:
+        """Étiquettes HH:MM des indices demandés ('*' = bougie en formation)."""
+        ts = self.ring.view("ts")
+        last = len(ts) - 1
+        return [ts_to_str(int(ts[i])) + ("*" if i == last and self.ring.has_forming else "") for i in idx]
 
 # ---------- Serveur HTTP optionnel ----------
 def find_free_port_incremental(base: int = 8765, host: str = "127.0.0.1", max_tries: int = 200) -> int:
@@ -147,7 +207,7 @@ def start_status_server(host: str, port: int):
     return srv, t
 # --------------------------------------------
 
-async def stream(symbol: str, timeframe: str, limit: int, ma_period:int=20, breakout:int=20, overlay_ma20:bool=False, overlay_hh20:bool=False, lookback:int=20):
+async def stream(symbol: str, timeframe: str, limit: int, ma_period:int=20, breakout:int=20, overlay_ma20:bool=False, overlay_hh20:bool=False, lookback:int=20, db_dir: str = "data/candles", fps: float = 4.0):
     url = f"wss://stream.binance.com:9443/ws/{to_stream_symbol(symbol)}@kline_{timeframe}"
     buf = CandleBuffer(limit=limit)
 
@@ -161,79 +221,89 @@ async def stream(symbol: str, timeframe: str, limit: int, ma_period:int=20, brea
         "breakout": breakout,
     })
 
-    # Précharge l'historique pour rendu immédiat
+    # Overlays enregistrés avant le préchargement, puis tenus à jour bougie par bougie
+    ma_key = buf.add_overlay("ma", ma_period)
+    hh_key = buf.add_overlay("hh", breakout)
+    ma20_key = buf.add_overlay("ma", 20) if overlay_ma20 else None
+    prev_hh_key = buf.add_overlay("prev_hh", lookback) if overlay_hh20 else None
+
+    # Précharge l'historique (bougies closes seulement) pour rendu immédiat
+    db = CandleDB(db_dir) if db_dir else None
     try:
-        hist = fetch_klines_rest(symbol, timeframe, limit=limit)
-        # garde toutes sauf la bougie en cours
-        buf.preload(hist[:-1])
+        buf.preload(load_closed_klines(symbol, timeframe, limit, db))
     except Exception as e:
         print("Préchargement REST échoué:", e)
 
     async def render(overlay_ma20=False, overlay_hh20=False, lookback=20):
-        o,h,l,c,lbl = buf.get_arrays()
-        if len(o) < 1:
+        o,h,l,c,_ = buf.get_arrays()
+        n = len(o)
+        if n < 1:
             return
         plx.clear_figure()
         # Utilise des indices pour l'axe X et colle des labels texte
-        x = list(range(len(o)))
-        plx.candlestick(dates=x, data={"Open": o, "High": h, "Low": l, "Close": c})
+        # (plotext attend des listes : une seule conversion par image, depuis les vues du tampon)
+        x = list(range(n))
+        plx.candlestick(dates=x, data={"Open": o.tolist(), "High": h.tolist(), "Low": l.tolist(), "Close": c.tolist()})
         # Overlays: MA and HH breakout
-        if len(c) >= ma_period:
-            ma_vals = [sum(c[max(0,i-ma_period+1):i+1]) / (i - max(0,i-ma_period+1) + 1) for i in range(len(c))]
-            plx.plot(x, ma_vals, label=f"MA{ma_period}")
-        if len(h) >= breakout:
-            hh_vals = []
-            for i in range(len(h)):
-                start = max(0, i - breakout + 1)
-                hh_vals.append(max(h[start:i+1]))
-            plx.plot(x, hh_vals, label=f"HH{breakout}")
-        plx.title(f"{symbol} {timeframe}  (Bougies: {len(o)})")
+        if n >= ma_period:
+            plx.plot(x, buf.get_overlay(ma_key).tolist(), label=f"MA{ma_period}")
+        if n >= breakout:
+            plx.plot(x, buf.get_overlay(hh_key).tolist(), label=f"HH{breakout}")
+        plx.title(f"{symbol} {timeframe}  (Bougies: {n})")
         # Overlays
         try:
-            x = list(range(len(o)))
-            if overlay_ma20 and len(c) >= 2:
-                ma = []
-                for i in range(len(c)):
-                    s = max(0, i-19); w = c[s:i+1]; ma.append(sum(w)/len(w))
-                plx.plot(x, ma, label="MA20")
-            if overlay_hh20 and len(h) >= 2:
-                hh = []
-                for i in range(len(h)):
-                    s = max(0, i - lookback)
-                    prev = h[s:i] if i > s else []
-                    lvl = max(prev) if prev else h[i]
-                    hh.append(lvl)
-                plx.plot(x, hh, label=f"HH{lookback}")
+            if overlay_ma20 and n >= 2 and not (ma20_key == ma_key and n >= ma_period):
+                plx.plot(x, buf.get_overlay(ma20_key).tolist(), label="MA20")
+            if overlay_hh20 and n >= 2:
+                plx.plot(x, buf.get_overlay(prev_hh_key).tolist(), label=f"HH{lookback}")
             plx.legend(True)
         except Exception:
             pass
 
         try:
-            step = max(1, len(lbl)//6)
-            xticks = [i for i in range(0, len(lbl), step)]
-            xlabels = [lbl[i] for i in xticks]
-            plx.xticks(xticks, xlabels)
+            step = max(1, n//6)
+            xticks = [i for i in range(0, n, step)]
+            plx.xticks(xticks, buf.labels(xticks))
         except Exception:
             pass
         # MAJ statut global
         try:
-            last_close = c[-1] if c else None
             GLOBAL_STATUS.update({
-                "points": len(c),
-                "last": last_close,
-                "label_last": lbl[-1] if lbl else None,
+                "points": n,
+                "last": float(c[-1]),
+                "label_last": buf.labels([n - 1])[0],
+                "render": scheduler.stats(),
             })
         except Exception:
             pass
 
         plx.show()
 
-    # Premier rendu
-    await render(overlay_ma20=overlay_ma20, overlay_hh20=overlay_hh20, lookback=lookback)
+    # Rendu cadencé : les messages WS ne font que marquer l'état comme modifié
+    scheduler = RenderScheduler(lambda: render(overlay_ma20=overlay_ma20, overlay_hh20=overlay_hh20, lookback=lookback),
+                                max_fps=fps, state_fn=lambda: buf.version)
+    scheduler.start()
+    scheduler.invalidate()  # premier rendu
+    with contextlib.suppress(NotImplementedError, AttributeError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGWINCH, scheduler.invalidate)
+
+    async def backfill():
+        """Clôtures manquées pendant une coupure (REST, base locale complétée), avant de reprendre le flux."""
+        last = buf.last_closed_time()
+        if last is None:
+            return
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(None, missed_klines, symbol, timeframe, last, limit, db)
+        except Exception:
+            return  # REST indisponible : le flux reprend quand même
+        if rows:
+            buf.preload(rows)
+            scheduler.mark_dirty()
 
     while True:
         try:
             async with websockets.connect(url, ping_interval=20, ping_timeout=20) as ws:
+                await backfill()
                 async for msg in ws:
                     data = json.loads(msg)
                     k = data.get("k", {})
@@ -243,18 +313,27 @@ async def stream(symbol: str, timeframe: str, limit: int, ma_period:int=20, brea
                         continue
                     o = float(k["o"]); h = float(k["h"]); l = float(k["l"]); c = float(k["c"])
                     is_closed = bool(k["x"])
-                    label = ts_to_str(int(k["T"]))
+                    t_close = int(k["T"])
+                    last = buf.last_closed_time()
+                    if last is not None and t_close <= last:
+                        continue  # déjà reçue via le rattrapage REST
 
                     if is_closed:
-                        buf.update_live(o,h,l,c,label)
+                        buf.update_live(o,h,l,c,t_close)
                         buf.close_current()
+                        if db is not None:
+                            try:
+                                db.append("binance", symbol, timeframe, [[int(k["t"]), o, h, l, c, float(k["v"])]])
+                            except Exception:
+                                pass
                     else:
-                        buf.update_live(o,h,l,c,label)
-                    await render(overlay_ma20=overlay_ma20, overlay_hh20=overlay_hh20, lookback=lookback)
+                        buf.update_live(o,h,l,c,t_close)
+                    scheduler.mark_dirty()
         except (asyncio.CancelledError, KeyboardInterrupt):
             break
         except Exception:
             await asyncio.sleep(2.0)
+    scheduler.stop()
 
 def main():
     ap = argparse.ArgumentParser()
@@ -266,6 +345,8 @@ def main():
     ap.add_argument("--lookback", type=int, default=20)
     ap.add_argument("--ma", type=int, default=20)
     ap.add_argument("--breakout", type=int, default=20)
+    ap.add_argument("--db", default="data/candles", help="base locale des bougies ('' = REST seul)")
+    ap.add_argument("--fps", type=float, default=4.0, help="images/s max (ticks intermédiaires fusionnés, 0 = illimité)")
 
     # Nouveau: serveur HTTP optionnel
     ap.add_argument("--serve", action="store_true", help="Expose /health et /status via HTTP (optionnel)")
@@ -277,7 +358,7 @@ def main():
 
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    task = loop.create_task(stream(args.symbol, args.timeframe, args.limit, args.ma, args.breakout, args.overlay_ma20, args.overlay_hh20, args.lookback))
+    task = loop.create_task(stream(args.symbol, args.timeframe, args.limit, args.ma, args.breakout, args.overlay_ma20, args.overlay_hh20, args.lookback, args.db, args.fps))
     srv_ref = None
 
     # Démarrage optionnel du serveur
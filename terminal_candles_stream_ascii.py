@@ -3,29 +3,43 @@
 ASCII Candlestick Streaming (gratuit, sans plotext)
 - WebSocket Binance gratuit (kline_{timeframe})
 - Couleurs ANSI (vert/rouge) si terminal compatible
-- Mise à jour en continu : ticks et clôtures
+- Mise à jour en continu : ticks et clôtures, rendu cadencé (--fps max, ticks intermédiaires fusionnés)
+- Rendu différentiel : seules les cellules modifiées sont réécrites (positionnement curseur ANSI) ;
+  écran complet seulement quand l'échelle change ou que le graphique se décale d'une bougie
+- Grille multi-symboles (--symbols) : un graphique par symbole dans le même terminal, tous abonnés
+  sur une seule connexion (flux combiné Binance), un seul RenderScheduler pour toute la grille
+- Préchargement depuis la base locale (--db), REST uniquement pour le trou ; à chaque reconnexion,
+  les bougies closes pendant la coupure sont rattrapées en REST avant de reprendre le flux
 Usage:
-    python terminal_candles_stream_ascii.py --symbol BTC/USDT --timeframe 1m --limit 120 --height 24 --cols 100
+    python terminal_candles_stream_ascii.py --symbol BTC/USDT --timeframe 1m --limit 120 --height 24 --cols 100 --fps 4
+    python terminal_candles_stream_ascii.py --symbols BTC/USDT,ETH/USDT,SOL/USDT,BNB/USDT --timeframe 1m
 """
 
 import argparse
 import asyncio
 import json
-import math
 import os
 import shutil
 import signal
 import sys
-from collections import deque
 from datetime import datetime, timezone
 
+import numpy as np
 import websockets
 
+from candle_db import CandleDB, load_closed_klines, missed_klines
+from candle_ring import CandleRing
+from render_scheduler import RenderScheduler
+
 RESET = "\033[0m"
 RED = "\033[31m"
 GREEN = "\033[32m"
 DIM = "\033[2m"
 BOLD = "\033[1m"
+CLEAR = "\033[H\033[J"
+HIDE_CURSOR = "\033[?25l"
+SHOW_CURSOR = "\033[?25h"
+MIN_TILE_COLS = 36  # deux horodatages "YYYY-MM-DD HH:MM" dans le pied
 
 def supports_color() -> bool:
     return sys.stdout.isatty() and os.environ.get("TERM") not in (None, "dumb")
@@ -44,27 +58,39 @@ def ts_str(ms: int) -> str:
     return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%H:%M")
 
 class KlineBuf:
+    """Bougies closes + bougie en formation (CandleRing, t = closeTime) ; arrays() rend des vues sans copie."""
     def __init__(self, limit: int):
         self.limit = limit
-        self.data = deque(maxlen=limit)  # list of dicts: {o,h,l,c,t_close}
+        self.ring = CandleRing(limit, fields=("t", "o", "h", "l", "c"))
+
+    @property
+    def version(self) -> int:
+        """Incrémenté à chaque changement visible (clé du RenderScheduler)."""
+        return self.ring.version
+
+    def last_closed_time(self):
+        """closeTime de la dernière bougie close, None si vide."""
+        return int(self.ring.last("t")) if len(self.ring) else None
 
     def upsert_live(self, o, h, l, c, t_close, closed: bool):
+        last = self.last_closed_time()
+        if last is not None and t_close <= last:
+            return  # déjà reçue (rattrapage REST)
         if closed:
-            self.data.append({"o": o, "h": h, "l": l, "c": c, "t": t_close})
+            self.ring.append(t_close, o, h, l, c)  # remplace la bougie en formation correspondante
         else:
-            # replace or append current forming candle
-            if self.data and self.data[-1].get("_forming", False):
-                self.data[-1] = {"o": o, "h": h, "l": l, "c": c, "t": t_close, "_forming": True}
-            else:
-                self.data.append({"o": o, "h": h, "l": l, "c": c, "t": t_close, "_forming": True})
+            self.ring.set_forming(t_close, o, h, l, c)  # sans effet si OHLC inchangé (volume seul)
+
+    def preload(self, klines):
+        """Bougies closes au format kline Binance [openTime, o, h, l, c, v, closeTime] ; déjà connues ignorées."""
+        last = self.last_closed_time()
+        self.ring.extend([[k[6], k[1], k[2], k[3], k[4]] for k in klines if last is None or int(k[6]) > last])
 
     def arrays(self):
-        o = [d["o"] for d in self.data]
-        h = [d["h"] for d in self.data]
-        l = [d["l"] for d in self.data]
-        c = [d["c"] for d in self.data]
-        t = [d["t"] for d in self.data]
-        forming = [bool(d.get("_forming")) for d in self.data]
+        t, o, h, l, c = self.ring.arrays(forming=True)
+        forming = np.zeros(len(t), dtype=bool)
+        if self.ring.has_forming:
+            forming[-1] = True
         return o, h, l, c, t, forming
 
 def scale(val, vmin, vmax, rows):
@@ -74,114 +100,226 @@ def scale(val, vmin, vmax, rows):
     y = int((val - vmin) / (vmax - vmin) * (rows - 1))
     return max(0, min(rows - 1, y))
 
-def render(symbol, timeframe, buf: KlineBuf, height: int = 24, cols: int = 100, ma: int = 20, breakout: int = 20):
-    o, h, l, c, t, forming = buf.arrays()
-    if len(o) < 2:
-        return
-    # If too many candles for cols, sample the last 'cols'
-    n = len(o)
-    start = max(0, n - cols)
-    o = o[start:]; h = h[start:]; l = l[start:]; c = c[start:]; t = t[start:]; forming = forming[start:]
-    # Determine min/max range with small padding
-    vmin = min(l); vmax = max(h)
-    pad = (vmax - vmin) * 0.02 if vmax > vmin else 1.0
-    vmin -= pad; vmax += pad
-
-    rows = height
-    # build grid of spaces
-    grid = [[" "]*len(o) for _ in range(rows)]
-
-    for x in range(len(o)):
-        oy = scale(o[x], vmin, vmax, rows)
-        hy = scale(h[x], vmin, vmax, rows)
-        ly = scale(l[x], vmin, vmax, rows)
-        cy = scale(c[x], vmin, vmax, rows)
-
-        # wick: vertical line from low to high
-        for y in range(ly, hy+1):
-            grid[rows-1-y][x] = "│"  # invert y for printing (row 0 is top)
-
-        # body: between open and close
-        y1, y2 = sorted((oy, cy))
-        for y in range(y1, y2+1):
-            grid[rows-1-y][x] = "█"
-
-    # Overlays: draw MA and HH lines as dots if those cells are empty
-    if len(c) >= ma or len(h) >= breakout:
-        for x in range(len(o)):
-            # MA
-            if len(c) >= ma and x >= ma - 1:
-                start = x - ma + 1
-                window = c[start:x+1]
-                ma_val = sum(window) / len(window)
-                y = scale(ma_val, vmin, vmax, rows)
-                ry = rows - 1 - y
-                if 0 <= ry < rows and grid[ry][x] == " ":
-                    grid[ry][x] = "."
-            # HH
-            if len(h) >= breakout and x >= breakout - 1:
-                start = x - breakout + 1
-                hh = max(h[start:x+1])
-                y = scale(hh, vmin, vmax, rows)
-                ry = rows - 1 - y
-                if 0 <= ry < rows and grid[ry][x] == " ":
-                    grid[ry][x] = "·"
-
-
-    # Prepare header
-    last_close = c[-1]
-    change = (last_close - c[0]) / c[0] * 100 if c[0] else 0.0
-    header = f"{symbol} {timeframe}  last={last_close:.2f}  Δ={change:+.2f}%  range=[{vmin:.2f} .. {vmax:.2f}]"
-    if HAS_COLOR:
-        header_col = colorize(header, GREEN if last_close >= o[-1] else RED)
-    else:
-        header_col = header
-
-    # Clear screen
-    cols_term = shutil.get_terminal_size((120, rows+4)).columns
-    print("\033[H\033[J", end="")  # ANSI clear
-    print(BOLD + header_col + RESET)
-    # Print grid with colors for up/down candles
-    for y in range(rows):
-        line = []
-        for x in range(len(o)):
-            ch = grid[y][x]
-            if ch == "█":
-                col = GREEN if c[x] >= o[x] else RED
-                line.append(colorize("█", col))
-            elif ch == "│":
-                col = GREEN if c[x] >= o[x] else RED
-                line.append(colorize("│", col))
-            else:
-                line.append(" ")
-        print("".join(line))
-
-    # Footer labels
-    left = ts_str(t[0]); right = ts_str(t[-1])
-    label_line = f"{DIM}{left}{RESET}".ljust(cols_term - len(right)) + f"{DIM}{right}{RESET}"
-    print(label_line)
+def _overlays(h, c, ma: int, breakout: int):
+    """MA(ma) et HH(breakout) sur la fenêtre visible (NaN avant la première fenêtre complète)."""
+    n = len(c)
+    ma_vals = np.full(n, np.nan)
+    hh_vals = np.full(n, np.nan)
+    if 0 < ma <= n:
+        cs = np.concatenate(([0.0], np.cumsum(c)))
+        ma_vals[ma - 1:] = (cs[ma:] - cs[:-ma]) / ma
+    if 0 < breakout <= n:
+        hh_vals[breakout - 1:] = np.lib.stride_tricks.sliding_window_view(h, breakout).max(axis=1)
+    return ma_vals, hh_vals
+
+class AsciiChart:
+    """
+    Graphique en bougies dessiné dans un rectangle du terminal (ligne `top`, colonne `left`) :
+    en-tête, `height` lignes de bougies, pied (étiquettes de temps).
+    frame(buf) rend uniquement les séquences ANSI nécessaires depuis l'image précédente :
+    - même échelle (min/max), même première bougie => seules les cellules modifiées sont
+      réécrites (positionnement curseur), en pratique la colonne de la bougie en formation
+    - sinon (nouvelle échelle, décalage d'une bougie, invalidate()) => rectangle entier redessiné
+    """
+    def __init__(self, symbol, timeframe, height: int = 24, cols: int = 100, ma: int = 20, breakout: int = 20,
+                 top: int = 1, left: int = 1):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.height = height
+        self.cols = cols
+        self.ma = ma
+        self.breakout = breakout
+        self.top = top
+        self.left = left
+        self._key = None
+        self._inputs = []   # entrées de chaque colonne dessinée (o, h, l, c, ma, hh)
+        self._cells = []    # cellules de chaque colonne dessinée (haut -> bas)
+        self._header = None
+        self._footer = None
+        self.full_repaints = 0
+        self.partial_repaints = 0
+
+    def invalidate(self):
+        self._key = None
+
+    def _goto(self, row: int, col: int) -> str:
+        return f"\033[{self.top + row};{self.left + col}H"
+
+    def _column(self, o, h, l, c, ma_val, hh_val, vmin, vmax):
+        rows = self.height
+        cells = [" "] * rows
+        col = GREEN if c >= o else RED
+        ly, hy = scale(l, vmin, vmax, rows), scale(h, vmin, vmax, rows)
+        for y in range(ly, hy + 1):
+            cells[rows - 1 - y] = colorize("│", col)  # mèche (ligne 0 = haut)
+        y1, y2 = sorted((scale(o, vmin, vmax, rows), scale(c, vmin, vmax, rows)))
+        for y in range(y1, y2 + 1):
+            cells[rows - 1 - y] = colorize("█", col)
+        # overlays en pointillés, seulement sur des cellules vides
+        for val, ch in ((ma_val, "."), (hh_val, "·")):
+            if val is not None:
+                ry = rows - 1 - scale(val, vmin, vmax, rows)
+                if cells[ry] == " ":
+                    cells[ry] = colorize(ch, DIM)
+        return cells
+
+    def frame(self, buf: KlineBuf) -> str:
+        o, h, l, c, t, _ = buf.arrays()
+        n = len(o)
+        if n < 2:
+            return ""
+        start = max(0, n - self.cols)
+        o, h, l, c, t = o[start:], h[start:], l[start:], c[start:], t[start:]
+        ma_vals, hh_vals = _overlays(h, c, self.ma, self.breakout)
+        # échelle min/max avec une petite marge
+        vmin = float(l.min()); vmax = float(h.max())
+        pad = (vmax - vmin) * 0.02 if vmax > vmin else 1.0
+        vmin -= pad; vmax += pad
+
+        key = (vmin, vmax, float(t[0]), self.height, self.cols)
+        full = key != self._key
+        out = []
+        inputs = [(oo, hh, ll, cc, None if m != m else m, None if x != x else x)
+                  for oo, hh, ll, cc, m, x in zip(o.tolist(), h.tolist(), l.tolist(), c.tolist(),
+                                                  ma_vals.tolist(), hh_vals.tolist())]
+        blank = [" "] * self.height
+        cells = []
+        for x, inp in enumerate(inputs):
+            if not full and x < len(self._inputs) and self._inputs[x] == inp:
+                cells.append(self._cells[x])
+                continue
+            col = self._column(*inp, vmin, vmax)
+            cells.append(col)
+            if not full:
+                prev = self._cells[x] if x < len(self._cells) else blank
+                for y in range(self.height):
+                    if col[y] != prev[y]:
+                        out.append(self._goto(1 + y, x) + col[y])
+
+        # en-tête et pied (réécrits seulement s'ils changent)
+        last_close = inputs[-1][3]
+        change = (last_close - inputs[0][3]) / inputs[0][3] * 100 if inputs[0][3] else 0.0
+        header = f"{self.symbol} {self.timeframe}  last={last_close:.2f}  Δ={change:+.2f}%  range=[{vmin:.2f} .. {vmax:.2f}]"
+        header = header[:max(self.cols, 20)].ljust(max(self.cols, 20))
+        header = BOLD + colorize(header, GREEN if last_close >= inputs[-1][0] else RED) + RESET if HAS_COLOR else header
+        left = ts_str(int(t[0])); right = ts_str(int(t[-1]))
+        width = max(self.cols, len(left) + len(right) + 1)
+        footer = f"{DIM}{left}{RESET}" + " " * (width - len(left) - len(right)) + f"{DIM}{right}{RESET}" if HAS_COLOR \
+            else left + " " * (width - len(left) - len(right)) + right
+
+        if full:
+            out = [self._goto(0, 0) + header]
+            for y in range(self.height):
+                line = "".join(col[y] for col in cells)
+                out.append(self._goto(1 + y, 0) + line + " " * (self.cols - len(cells)))
+            out.append(self._goto(1 + self.height, 0) + footer)
+            self.full_repaints += 1
+        else:
+            if header != self._header:
+                out.append(self._goto(0, 0) + header)
+            if footer != self._footer:
+                out.append(self._goto(1 + self.height, 0) + footer)
+            if out:
+                self.partial_repaints += 1
+        self._key = key
+        self._inputs = inputs
+        self._cells = cells
+        self._header = header
+        self._footer = footer
+        return "".join(out)
 
 def ts_str(ms: int) -> str:
     return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M")
 
-async def main_async(symbol: str, timeframe: str, limit: int, height: int, cols: int, ma:int, breakout:int):
-    url = f"wss://stream.binance.com:9443/ws/{to_stream_symbol(symbol)}@kline_{timeframe}"
-    buf = KlineBuf(limit=max(limit, cols))
+def grid_layout(n: int, height=None, cols=None, grid_cols: int = 0, gap: int = 2):
+    """
+    Tuiles de la grille : (hauteur, largeur, [(top, left), ...]).
+    Taille non imposée => terminal partagé entre les tuiles (largeur >= MIN_TILE_COLS).
+    Chaque tuile occupe height + 3 lignes (en-tête, pied, séparation).
+    """
+    size = shutil.get_terminal_size((120, 40))
+    ncols = grid_cols or max(1, min(n, (size.columns + gap) // (MIN_TILE_COLS + gap)))
+    nrows = -(-n // ncols)
+    if cols is None:
+        cols = max(MIN_TILE_COLS, (size.columns + gap) // ncols - gap)
+    if height is None:
+        height = max(4, (size.lines - 1) // nrows - 3)
+    tiles = [(1 + (i // ncols) * (height + 3), 1 + (i % ncols) * (cols + gap)) for i in range(n)]
+    return height, cols, tiles
+
+async def main_async(symbols, timeframe: str, limit: int, height=None, cols=None, ma: int = 20, breakout: int = 20,
+                     fps: float = 4.0, grid_cols: int = 0, db_dir: str = "data/candles"):
+    """Un seul WebSocket (flux combiné) et un seul RenderScheduler, quel que soit le nombre de symboles."""
+    streams = "/".join(f"{to_stream_symbol(s)}@kline_{timeframe}" for s in symbols)
+    url = f"wss://stream.binance.com:9443/stream?streams={streams}"
+    route = {to_stream_symbol(s).upper(): s for s in symbols}
+    tile_h, tile_w, tiles = grid_layout(len(symbols), height, cols, grid_cols)
+    bufs = {s: KlineBuf(limit=max(limit, tile_w)) for s in symbols}
+    charts = {s: AsciiChart(s, timeframe, height=tile_h, cols=tile_w, ma=ma, breakout=breakout, top=top, left=left)
+              for s, (top, left) in zip(symbols, tiles)}
+    park = [max(top for top, _ in tiles) + tile_h + 2]
+
+    # Préchargement (base locale + REST pour le trou), symboles en parallèle
+    db = CandleDB(db_dir) if db_dir else None
+    loop = asyncio.get_running_loop()
+    rows = await asyncio.gather(*(loop.run_in_executor(None, load_closed_klines, s, timeframe, limit, db)
+                                  for s in symbols), return_exceptions=True)
+    for s, r in zip(symbols, rows):
+        if not isinstance(r, BaseException):
+            bufs[s].preload(r)  # échec : le graphique se remplit avec le flux
+
+    def draw():
+        out = "".join(charts[s].frame(bufs[s]) for s in symbols)
+        if out:
+            # curseur reparqué sous la grille après chaque mise à jour
+            sys.stdout.write(out + f"\033[{park[0]};1H")
+            sys.stdout.flush()
+
+    def on_resize():
+        h, w, pos = grid_layout(len(symbols), height, cols, grid_cols)
+        for s, (top, left) in zip(symbols, pos):
+            ch = charts[s]
+            ch.height, ch.cols, ch.top, ch.left = h, w, top, left
+            ch.invalidate()
+        park[0] = max(top for top, _ in pos) + h + 2
+        sys.stdout.write(CLEAR)
+        scheduler.invalidate()
+
+    scheduler = RenderScheduler(draw, max_fps=fps, state_fn=lambda: tuple(b.version for b in bufs.values()))
+    sys.stdout.write(CLEAR)
+    scheduler.start()
+    scheduler.invalidate()
+    try:
+        loop.add_signal_handler(signal.SIGWINCH, on_resize)
+    except (NotImplementedError, AttributeError):
+        pass
+
+    async def backfill():
+        """Clôtures manquées pendant une coupure (REST, base locale complétée), tous symboles en parallèle."""
+        todo = [s for s in symbols if bufs[s].last_closed_time() is not None]
+        rows = await asyncio.gather(*(loop.run_in_executor(None, missed_klines, s, timeframe,
+                                                            bufs[s].last_closed_time(), limit, db)
+                                      for s in todo), return_exceptions=True)
+        for s, r in zip(todo, rows):
+            if not isinstance(r, BaseException) and r:
+                bufs[s].preload(r)
+                scheduler.mark_dirty()
 
     async def consume():
         async with websockets.connect(url, ping_interval=20, ping_timeout=20) as ws:
+            await backfill()
             async for msg in ws:
                 data = json.loads(msg)
+                data = data.get("data", data)
                 k = data.get("k", {})
-                if not k:
-                    k = data.get("data", {}).get("k", {})
-                if not k:
+                buf = bufs.get(route.get(data.get("s") or k.get("s", "")))
+                if not k or buf is None:
                     continue
                 o = float(k["o"]); h = float(k["h"]); l = float(k["l"]); c = float(k["c"])
                 closed = bool(k["x"])
                 t_close = int(k["T"])
                 buf.upsert_live(o, h, l, c, t_close, closed)
-                render(symbol, timeframe, buf, height=height, cols=cols, ma=ma, breakout=breakout)
+                scheduler.mark_dirty()
 
     while True:
         try:
@@ -190,10 +328,12 @@ async def main_async(symbol: str, timeframe: str, limit: int, height: int, cols:
             break
         except Exception:
             await asyncio.sleep(2.0)
+    scheduler.stop()
 
 def cli():
     ap = argparse.ArgumentParser()
     ap.add_argument("--symbol", default="BTC/USDT")
+    ap.add_argument("--symbols", default="", help="grille multi-symboles, liste séparée par des virgules (remplace --symbol)")
     ap.add_argument("--timeframe", default="1m")
     ap.add_argument("--limit", type=int, default=200)
     ap.add_argument("--overlay_ma20", action="store_true")
@@ -201,13 +341,23 @@ def cli():
     ap.add_argument("--lookback", type=int, default=20)
     ap.add_argument("--ma", type=int, default=20)
     ap.add_argument("--breakout", type=int, default=20)
-    ap.add_argument("--height", type=int, default=24)
-    ap.add_argument("--cols", type=int, default=100)
+    ap.add_argument("--height", type=int, default=None, help="hauteur d'un graphique (défaut 24 ; grille : auto)")
+    ap.add_argument("--cols", type=int, default=None, help="largeur d'un graphique (défaut 100 ; grille : auto)")
+    ap.add_argument("--grid_cols", type=int, default=0, help="graphiques par ligne de la grille (0 = auto)")
+    ap.add_argument("--db", default="data/candles", help="base locale des bougies ('' = REST seul)")
+    ap.add_argument("--fps", type=float, default=4.0, help="images/s max (ticks intermédiaires fusionnés, 0 = illimité)")
     args = ap.parse_args()
 
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()] or [args.symbol]
+    height, cols = args.height, args.cols
+    if len(symbols) == 1:
+        height = height or 24
+        cols = cols or 100
+
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    task = loop.create_task(main_async(args.symbol, args.timeframe, args.limit, args.height, args.cols, args.ma, args.breakout))
+    task = loop.create_task(main_async(symbols, args.timeframe, args.limit, height, cols, args.ma, args.breakout,
+                                       args.fps, args.grid_cols, args.db))
 
     def handle_sig(*_):
         if not task.done():
@@ -218,9 +368,14 @@ def cli():
         except NotImplementedError:
             pass
 
+    if HAS_COLOR:
+        sys.stdout.write(HIDE_CURSOR)
     try:
         loop.run_until_complete(task)
     finally:
+        if HAS_COLOR:
+            sys.stdout.write(SHOW_CURSOR)
+            sys.stdout.flush()
         loop.stop()
         loop.close()
 
@@ -2,12 +2,34 @@
 """
 ws_binance.py — WebSocket helper (Binance public streams)
 Interface (compatible avec main.py) :
-- class StreamConfig(symbols, timeframe, on_kline_closed, on_ticker, reconnect_delay)
+- class StreamConfig(symbols, timeframe, on_kline_closed, on_ticker, reconnect_delay, on_depth)
+    - on_depth (optionnel) : abonne aussi `@depth@100ms` (diff-depth, cf. orderbook.py)
 - class BinanceWS(config): 
     - start(loop)   # démarre en tâche(s) asynchrones (dans la loop fournie, ou sa propre loop)
     - async stop()  # annule proprement les tâches et ferme les WS
+    - update_symbols(symbols)  # SUBSCRIBE/UNSUBSCRIBE à chaud, sans reconnecter les autres shards
+Callbacks : (symbole tel que configuré, message typé) — BookTicker, KlineClosed, DepthDiff
+(NamedTuple, champs déjà convertis en float/int : pas de dict brut côté stratégie).
 Notes:
 - Pas de clé API requise (streams publics).
+- Décodage JSON : orjson, sinon msgspec, sinon json (stdlib) — détecté à l'import.
+- Routage : table précalculée nom de stream -> (symbole, parseur, callback) ; aucun split
+  ni recherche de sous-chaîne par message.
+- Sharding : les streams sont répartis sur N connexions (`streams_per_connection`, Binance
+  limite à 1024 par connexion). Chaque shard a sa propre reconnexion (backoff exponentiel
+  plafonné). Les lecteurs décodent/routent puis poussent dans une file commune (EventPipe).
+- Backpressure : les callbacks tournent dans un thread consommateur (jamais dans la boucle WS,
+  un callback lent ne bloque plus la lecture des sockets) qui vide la file par lots :
+    - bookTicker : coalescé par symbole (le dernier gagne) — sous charge on saute des ticks
+    - kline close : jamais jeté
+    - depth : borné (`queue_max`) ; un diff jeté provoque une resynchro du carnet (orderbook.py)
+  Profondeur de file, ticks coalescés et diffs jetés exposés via stats().
+- Rattrapage après reconnexion (optionnel, `backfill(symbol, since_ms)` -> lignes ccxt closes) :
+  les clôtures manquées pendant la coupure sont récupérées en REST (thread à part) et rejouées
+  dans l'ordre via on_kline_closed ; les clôtures live du symbole sont retenues pendant ce temps
+  puis émises à la suite (dédupliquées par openTime).
+- Latence (optionnel, `latency` = metrics.LatencyRegistry) : ws_event_lag (réception - `E`)
+  et ws_queue_delay (réception -> callback) par symbole.
 - Annule proprement les tâches pour éviter: 
   "Task was destroyed but it is pending!" et "coroutine was never awaited".
 """
@@ -18,11 +40,74 @@ import asyncio
 import contextlib
 import json
 import threading
+import time
+from collections import deque
 from dataclasses import dataclass
-from typing import Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 
 import websockets
 
+from candle_db import timeframe_ms
+
+try:
+    import orjson
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import msgspec
+        _loads = msgspec.json.Decoder().decode
+        JSON_BACKEND = "msgspec"
+    except ImportError:
+        _loads = json.loads
+        JSON_BACKEND = "json"
+
+
+class BookTicker(NamedTuple):
+    update_id: int
+    bid: float
+    bid_qty: float
+    ask: float
+    ask_qty: float
+
+
+class KlineClosed(NamedTuple):
+    event_time: int   # E (ms)
+    open_time: int    # t (ms)
+    close_time: int   # T (ms)
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+
+class DepthDiff(NamedTuple):
+    U: int
+    u: int
+    b: list   # [[prix, qté], ...] (chaînes Binance)
+    a: list
+
+
+def parse_book_ticker(d: dict) -> BookTicker:
+    return BookTicker(d.get("u", 0), float(d["b"]), float(d["B"]), float(d["a"]), float(d["A"]))
+
+
+def parse_kline(d: dict) -> Optional[KlineClosed]:
+    """None si la bougie n'est pas close (aucun objet construit)."""
+    k = d["k"]
+    if not k["x"]:
+        return None
+    return KlineClosed(d.get("E", 0), k["t"], k["T"], float(k["o"]), float(k["h"]),
+                       float(k["l"]), float(k["c"]), float(k["v"]))
+
+
+def parse_depth(d: dict) -> DepthDiff:
+    return DepthDiff(d["U"], d["u"], d.get("b", []), d.get("a", []))
+
+# (symbole, parseur, callback, coalescable)
+Route = Tuple[str, Callable[[dict], Any], Optional[Callable], bool]
+
 @dataclass
 class StreamConfig:
     symbols: List[str]
@@ -30,10 +115,107 @@ class StreamConfig:
     on_kline_closed: Optional[Callable[[str, dict], None]] = None
     on_ticker: Optional[Callable[[str, dict], None]] = None
     reconnect_delay: float = 3.0
+    on_depth: Optional[Callable[[str, dict], None]] = None
+    depth_speed: str = "100ms"
+    streams_per_connection: int = 200
+    max_reconnect_delay: float = 60.0
+    queue_max: int = 10000   # événements ordonnés non critiques (depth) en attente
+    batch_max: int = 500     # événements ordonnés livrés par lot
+    backfill: Optional[Callable[[str, int], list]] = None  # (symbole, openTime) -> [[t,o,h,l,c,v], ...] après t
+    latency: Optional[Any] = None  # metrics.LatencyRegistry
+
+BASE_URL = "wss://stream.binance.com:9443/stream"
+
 
 def _to_stream_symbol(sym: str) -> str:
     return sym.replace("/", "").lower()
 
+class EventPipe:
+    """
+    File bornée entre les lecteurs WS (producteurs, boucle asyncio) et le thread des callbacks.
+    - put_latest : un slot par clé, écrasé si non consommé (coalescence, le dernier gagne)
+    - put : FIFO ; `critical=True` n'est jamais jeté, sinon jeté quand la file est pleine
+    """
+
+    def __init__(self, maxlen: int = 10000, batch_max: int = 500):
+        self.maxlen = int(maxlen)
+        self.batch_max = max(1, int(batch_max))
+        self._cond = threading.Condition()
+        self._fifo: deque = deque()
+        self._latest: Dict[Any, tuple] = {}
+        self._closed = False
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.batches = 0
+        self.max_depth = 0
+
+    def put(self, item: tuple, critical: bool = False) -> bool:
+        with self._cond:
+            if not critical and len(self._fifo) >= self.maxlen:
+                self.dropped += 1
+                return False
+            self._fifo.append(item)
+            self._touch()
+        return True
+
+    def put_latest(self, key: Any, item: tuple) -> None:
+        with self._cond:
+            if key in self._latest:
+                self.coalesced += 1
+            self._latest[key] = item
+            self._touch()
+
+    def _touch(self) -> None:
+        depth = len(self._fifo) + len(self._latest)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        self._cond.notify()
+
+    def get_batch(self, timeout: float = 0.5) -> List[tuple]:
+        """FIFO d'abord (ordre préservé, au plus batch_max), puis tous les derniers ticks."""
+        with self._cond:
+            if not self._fifo and not self._latest and not self._closed:
+                self._cond.wait(timeout)
+            n = min(len(self._fifo), self.batch_max)
+            batch = [self._fifo.popleft() for _ in range(n)]
+            if self._latest:
+                batch.extend(self._latest.values())
+                self._latest = {}
+            self.delivered += len(batch)
+            if batch:
+                self.batches += 1
+            return batch
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._fifo) + len(self._latest)
+
+    def stats(self) -> Dict[str, int]:
+        return {"queue_depth": self.depth(), "queue_max_depth": self.max_depth, "delivered": self.delivered,
+                "coalesced": self.coalesced, "dropped": self.dropped, "batches": self.batches}
+
+
+class _Shard:
+    """Une connexion WS et les streams qu'elle porte."""
+
+    def __init__(self, idx: int, streams: List[str]):
+        self.idx = idx
+        self.streams: List[str] = list(streams)
+        self.conn = None
+        self.task: Optional[asyncio.Task] = None
+        self.reconnects = 0
+
+
 class BinanceWS:
     def __init__(self, cfg: StreamConfig):
         self.cfg = cfg
@@ -42,11 +224,22 @@ class BinanceWS:
         self._thread: Optional[threading.Thread] = None
         self._tasks: List[asyncio.Task] = []
         self._stop_evt = asyncio.Event()
-        self._ws_conn = None  # combined stream connection
         self._running = False
+        self._route_table: Dict[str, Route] = {}
+        self._shards: List[_Shard] = []
+        self._pipe = EventPipe(cfg.queue_max, cfg.batch_max)
+        self._consumer: Optional[threading.Thread] = None
+        self._req_id = 0
+        # Rattrapage: dernier openTime émis par symbole, clôtures live retenues pendant un backfill
+        self._last_kline: Dict[str, int] = {}
+        self._held: Dict[str, List[KlineClosed]] = {}
+        self.backfilled = 0
+        self.messages = 0  # trames reçues (tous shards)
 
     def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
         """Démarre le consommateur dans la boucle fournie ou crée sa propre boucle threadée."""
+        self._consumer = threading.Thread(target=self._consume_events, name="ws-callbacks", daemon=True)
+        self._consumer.start()
         if loop and loop.is_running():
             self.loop = loop
             self._own_loop = False
@@ -81,7 +274,7 @@ class BinanceWS:
             self.loop.close()
 
     async def stop(self):
-        """Annule proprement toutes les tâches et ferme la connexion WS."""
+        """Annule proprement toutes les tâches et ferme les connexions WS."""
         if not self._running:
             return
         self._running = False
@@ -90,15 +283,19 @@ class BinanceWS:
             self._stop_evt.set()
         except Exception:
             pass
-        # Ferme WS si ouvert
-        try:
-            if self._ws_conn is not None:
-                await self._ws_conn.close()
-        except Exception:
-            pass
+        self._pipe.close()
+        if self._consumer is not None and threading.current_thread() is not self._consumer:
+            self._consumer.join(timeout=2.0)
+        # Ferme les WS ouverts
+        for shard in list(self._shards):
+            try:
+                if shard.conn is not None:
+                    await shard.conn.close()
+            except Exception:
+                pass
         # Annule tâches
         try:
-            tasks = list(self._tasks)
+            tasks = list(self._tasks) + [sh.task for sh in self._shards if sh.task is not None]
             self._tasks.clear()
             for t in tasks:
                 t.cancel()
@@ -108,7 +305,7 @@ class BinanceWS:
         except Exception:
             pass
         # Si on a sa propre loop threadée, attendre la fin du thread
-        if self._own_loop and self._thread is not None:
+        if self._own_loop and self._thread is not None and threading.current_thread() is not self._thread:
             try:
                 # post un no-op pour réveiller la loop si besoin
                 if self.loop and self.loop.is_running():
@@ -118,35 +315,74 @@ class BinanceWS:
                 pass
             self._thread.join(timeout=2.0)
 
+    def _routes(self, symbols: List[str]) -> Dict[str, Route]:
+        """Nom de stream -> (symbole configuré, parseur, callback). Ordre: bookTicker, kline, depth."""
+        routes: Dict[str, Route] = {}
+        for s in symbols:
+            routes[f"{_to_stream_symbol(s)}@bookTicker"] = (s, parse_book_ticker, self.cfg.on_ticker, True)
+        for s in symbols:
+            routes[f"{_to_stream_symbol(s)}@kline_{self.cfg.timeframe}"] = (s, parse_kline, self.cfg.on_kline_closed, False)
+        if self.cfg.on_depth:
+            for s in symbols:
+                routes[f"{_to_stream_symbol(s)}@depth@{self.cfg.depth_speed}"] = (s, parse_depth, self.cfg.on_depth, False)
+        return routes
+
+    def stats(self) -> Dict[str, Any]:
+        return {"shards": len(self._shards),
+                "connected": sum(1 for sh in self._shards if sh.conn is not None),
+                "streams": len(self._route_table),
+                "reconnects": sum(sh.reconnects for sh in self._shards),
+                "backfilled": self.backfilled,
+                "messages": self.messages,
+                **self._pipe.stats()}
+
     async def _runner(self):
-        """Boucle de (re)connexion: ouvre une combined stream et dispatch messages."""
-        streams = []
-        # ticker streams
-        for s in self.cfg.symbols:
-            streams.append(f"{_to_stream_symbol(s)}@bookTicker")
-        # kline streams
-        for s in self.cfg.symbols:
-            streams.append(f"{_to_stream_symbol(s)}@kline_{self.cfg.timeframe}")
-        url = "wss://stream.binance.com:9443/stream?streams=" + "/".join(streams)
+        """Répartit les streams en shards et lance une tâche de connexion par shard."""
+        self._route_table = self._routes(self.cfg.symbols)
+        per = max(1, int(self.cfg.streams_per_connection))
+        names = list(self._route_table)
+        for i in range(0, len(names), per):
+            self._add_shard(names[i:i + per])
+        await self._stop_evt.wait()
+        # laisse les shards se fermer proprement avant de rendre la main
+        await asyncio.gather(*(sh.task for sh in self._shards if sh.task is not None), return_exceptions=True)
+
+    def _add_shard(self, streams: List[str]) -> _Shard:
+        shard = _Shard(len(self._shards), streams)
+        self._shards.append(shard)
+        shard.task = asyncio.get_running_loop().create_task(self._shard_runner(shard))
+        return shard
 
+    async def _shard_runner(self, shard: _Shard):
+        """Boucle de (re)connexion d'un shard, backoff exponentiel remis à zéro après connexion."""
+        delay = self.cfg.reconnect_delay
         while not self._stop_evt.is_set():
+            if not shard.streams:
+                await asyncio.sleep(1.0)  # shard vidé par update_symbols: garde la place
+                continue
+            url = BASE_URL + "?streams=" + "/".join(shard.streams)
             try:
                 async with websockets.connect(url, ping_interval=20, ping_timeout=20) as ws:
-                    self._ws_conn = ws
+                    shard.conn = ws
+                    delay = self.cfg.reconnect_delay
+                    if shard.reconnects:
+                        self._start_backfill(shard)
                     # Consommer jusqu'à stop
                     await self._consume(ws)
             except asyncio.CancelledError:
                 break
             except Exception:
-                # Reconnect soft
-                if self._stop_evt.is_set():
-                    break
-                await asyncio.sleep(self.cfg.reconnect_delay)
+                pass
             finally:
-                self._ws_conn = None
+                shard.conn = None
+            if self._stop_evt.is_set():
+                break
+            shard.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(self.cfg.max_reconnect_delay, delay * 2)
 
     async def _consume(self, ws):
-        """Lit les messages et envoie aux callbacks. Sort sur stop_evt."""
+        """Lit les messages du shard vers la file commune. Sort sur stop_evt ou erreur."""
         while not self._stop_evt.is_set():
             try:
                 msg = await asyncio.wait_for(ws.recv(), timeout=5.0)
@@ -158,29 +394,125 @@ class BinanceWS:
             except Exception:
                 # ferme et laisse le runner reconnecter
                 break
+            self._dispatch(msg, time.time())
 
-            try:
-                data = json.loads(msg)
-            except Exception:
-                continue
+    def _dispatch(self, msg, recv_wall: Optional[float] = None) -> None:
+        """Décode, route et met en file (thread WS). Les callbacks tournent dans _consume_events."""
+        t_recv = time.perf_counter()
+        self.messages += 1
+        try:
+            data = _loads(msg)
+            route = self._route_table.get(data.get("stream"))
+            if route is None:
+                return  # réponses SUBSCRIBE ({"result": null, "id": n}) ou stream retiré
+            symbol, parse, callback, coalesce = route
+            if callback is None:
+                return
+            payload = data["data"]
+            ev = parse(payload)
+        except Exception:
+            return
+        lat = self.cfg.latency
+        if lat is not None and recv_wall is not None:
+            E = payload.get("E")
+            if E:
+                lat.observe("ws_event_lag", symbol, recv_wall * 1000.0 - E)
+        if ev is None:
+            return
+        if coalesce:
+            self._pipe.put_latest((symbol, callback), (callback, symbol, ev, t_recv))
+        elif callback is self.cfg.on_kline_closed:
+            self._emit_kline(symbol, ev, t_recv)
+        else:
+            self._pipe.put((callback, symbol, ev, t_recv))
 
-            payload = data.get("data") or data
-            stream = data.get("stream", "")
+    # ---------------- Rattrapage des clôtures ----------------
+    def _emit_kline(self, symbol: str, ev: KlineClosed, t_recv: Optional[float] = None) -> None:
+        """Boucle WS uniquement (pas de verrou: _dispatch et _finish_backfill y tournent tous deux)."""
+        held = self._held.get(symbol)
+        if held is not None:
+            held.append(ev)
+            return
+        if ev.open_time <= self._last_kline.get(symbol, -1):
+            return
+        self._last_kline[symbol] = ev.open_time
+        self._pipe.put((self.cfg.on_kline_closed, symbol, ev, t_recv or time.perf_counter()), critical=True)
 
-            # bookTicker => on_ticker
-            if "bookTicker" in stream:
-                s = stream.split("@")[0].upper()
-                if self.cfg.on_ticker:
-                    with contextlib.suppress(Exception):
-                        self.cfg.on_ticker(s, payload)
+    def _start_backfill(self, shard: _Shard) -> None:
+        if self.cfg.backfill is None or self.cfg.on_kline_closed is None:
+            return
+        loop = asyncio.get_running_loop()
+        for name in shard.streams:
+            route = self._route_table.get(name)
+            if route is None or route[2] is not self.cfg.on_kline_closed:
                 continue
-
-            # kline => on_kline_closed quand x == true
-            if "kline_" in stream:
-                sym = payload.get("s") or stream.split("@")[0].upper()
-                k = payload.get("k", {})
-                if k.get("x"):  # closed
-                    if self.cfg.on_kline_closed:
-                        with contextlib.suppress(Exception):
-                            self.cfg.on_kline_closed(sym, payload)
+            symbol = route[0]
+            since = self._last_kline.get(symbol)
+            if since is None or symbol in self._held:
                 continue
+            self._held[symbol] = []
+            fut = loop.run_in_executor(None, self.cfg.backfill, symbol, since)
+            fut.add_done_callback(lambda f, sym=symbol: self._finish_backfill(sym, f))
+
+    def _finish_backfill(self, symbol: str, fut) -> None:
+        held = self._held.pop(symbol, [])
+        rows = [] if fut.cancelled() or fut.exception() is not None else (fut.result() or [])
+        tf = timeframe_ms(self.cfg.timeframe)
+        replay = [KlineClosed(0, int(r[0]), int(r[0]) + tf - 1, float(r[1]), float(r[2]), float(r[3]),
+                              float(r[4]), float(r[5])) for r in rows]
+        n = 0
+        for ev in sorted(replay + held, key=lambda e: e.open_time):
+            if ev.open_time > self._last_kline.get(symbol, -1):
+                n += ev.event_time == 0
+                self._emit_kline(symbol, ev)
+        self.backfilled += n
+
+    def _consume_events(self) -> None:
+        pipe = self._pipe
+        lat = self.cfg.latency
+        while not pipe.closed:
+            for callback, symbol, ev, t_recv in pipe.get_batch():
+                if lat is not None:
+                    lat.observe("ws_queue_delay", symbol, (time.perf_counter() - t_recv) * 1000.0)
+                with contextlib.suppress(Exception):
+                    callback(symbol, ev)
+
+    # ---------------- Abonnements à chaud ----------------
+    def update_symbols(self, symbols: List[str]) -> None:
+        """Remplace l'univers suivi. Thread-safe ; seuls les shards concernés reçoivent un message."""
+        self.cfg.symbols = list(symbols)
+        if self.loop is None or not self._running:
+            return
+        asyncio.run_coroutine_threadsafe(self._apply_symbols(list(symbols)), self.loop)
+
+    async def _apply_symbols(self, symbols: List[str]) -> None:
+        new_routes = self._routes(symbols)
+        removed = [n for n in self._route_table if n not in new_routes]
+        added = [n for n in new_routes if n not in self._route_table]
+        # Routes ajoutées avant SUBSCRIBE (premier message déjà routable), retirées après UNSUBSCRIBE
+        self._route_table = {**self._route_table, **new_routes}
+        for shard in self._shards:
+            gone = [n for n in shard.streams if n in removed]
+            if gone:
+                shard.streams = [n for n in shard.streams if n not in removed]
+                await self._send(shard, "UNSUBSCRIBE", gone)
+        self._route_table = new_routes
+        per = max(1, int(self.cfg.streams_per_connection))
+        for shard in self._shards:
+            if not added:
+                break
+            room = per - len(shard.streams)
+            if room > 0:
+                take, added = added[:room], added[room:]
+                shard.streams.extend(take)
+                await self._send(shard, "SUBSCRIBE", take)
+        for i in range(0, len(added), per):
+            self._add_shard(added[i:i + per])
+
+    async def _send(self, shard: _Shard, method: str, streams: List[str]) -> None:
+        """Sans connexion ouverte, rien à envoyer : la prochaine URL de connexion est à jour."""
+        if shard.conn is None:
+            return
+        self._req_id += 1
+        with contextlib.suppress(Exception):
+            await shard.conn.send(json.dumps({"method": method, "params": streams, "id": self._req_id}))